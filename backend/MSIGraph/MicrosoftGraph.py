@@ -1,357 +1,284 @@
-import os
+import logging
 import httpx
 from fastapi import APIRouter, Request, Depends, HTTPException
-from backend.auth.dependency import get_current_user
-from ..supabase import supabase
-import datetime
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response
+from backend.auth.dependency import get_current_user, get_current_user_from_query
+from .. import db
+from .graph_client import get_graph_client, pool_stats, graph_url
+from .scheduler import graph_scheduler, MAILBOX_HEADER
+from .calendars import discover_calendars, compact_calendar
+from .trial_sync import sync_trial
+from .conflicts import check_schedule, index_cache
+from .response_cache import calendar_cache
+from .events import enrich_event, get_all_pages, parse_event_range, select_fields, compact_event, DERIVED_FIELDS, EVENT_PAGE_SIZE
+from .models import CalendarsResponse, EventsResponse
+from .event_store import event_store, graph_iso
+from .agenda import merged_agenda, stream_agenda, format_ndjson, format_sse
+from .event_jobs import CREATE_EVENT_JOB, event_url
+from .notification_hub import notification_hub
+from .subscriptions import subscriptions
+from .token_cache import TOKENS_CHANGED, token_cache, expires_at_from_now, token_url
+from backend.deadlines.engine import get_calendar, jurisdictions
+from backend.settings import get_settings
+from backend.worker_bus import worker_bus
+from backend.responses import CompactJSONResponse
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-CLIENT_ID = os.getenv("MS_CLIENT_ID")
-CLIENT_SECRET = os.getenv("MS_CLIENT_SECRET")
 REDIRECT_URI = "http://localhost:5173/callback"
 
 
-async def refresh_token_if_expired(user_id: str, access_token: str, refresh_token: str, expires_at: str) -> str:
-    """
-    Helper function to check if token is expired and refresh it if needed.
-    Returns the valid access token (either existing or refreshed).
-    Raises HTTPException if token refresh fails.
-    """
-    if expires_at:
-        expires_datetime = datetime.datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
-        if expires_datetime <= datetime.datetime.now(datetime.timezone.utc):
-            print("Access token expired, attempting to refresh...")
-            if refresh_token:
-                # Try to refresh the token
-                refresh_payload = {
-                    "client_id": CLIENT_ID,
-                    "client_secret": CLIENT_SECRET,
-                    "refresh_token": refresh_token,
-                    "grant_type": "refresh_token",
-                }
-                async with httpx.AsyncClient() as client:
-                    refresh_response = await client.post("https://login.microsoftonline.com/common/oauth2/v2.0/token", data=refresh_payload)
-                    if refresh_response.status_code == 200:
-                        new_tokens = refresh_response.json()
-                        new_access_token = new_tokens["access_token"]
-                        new_refresh_token = new_tokens.get("refresh_token", refresh_token)
-                        new_expires_in = new_tokens.get("expires_in")
-                        new_expires_at = (datetime.datetime.utcnow() + datetime.timedelta(seconds=new_expires_in)).isoformat() if new_expires_in else None
-                        
-                        # Update token in database
-                        update_data = {
-                            "access_token": new_access_token,
-                            "refresh_token": new_refresh_token,
-                            "expires_at": new_expires_at
-                        }
-                        supabase.table("ms_tokens").update(update_data).eq("user_id", user_id).execute()
-                        print("Token refreshed successfully")
-                        return new_access_token
-                    else:
-                        print("Failed to refresh token, deleting expired token")
-                        supabase.table("ms_tokens").delete().eq("user_id", user_id).execute()
-                        raise HTTPException(status_code=401, detail="Microsoft token expired and refresh failed. Please reconnect your Microsoft account.")
-            else:
-                print("No refresh token available, deleting expired token")
-                supabase.table("ms_tokens").delete().eq("user_id", user_id).execute()
-                raise HTTPException(status_code=401, detail="Microsoft token expired and no refresh token available. Please reconnect your Microsoft account.")
-    
-    return access_token
-
-
 @router.post("/api/msgraph/create-event")
-async def msgraph_create_event(request: Request, user=Depends(get_current_user)):
+async def msgraph_create_event(request: Request, user=Depends(get_current_user), client: httpx.AsyncClient = Depends(get_graph_client)):
     try:
         data = await request.json()
     except Exception as e:
-        print("Error parsing JSON:", e)
+        logger.info("Error parsing JSON: %s", e)
         raise HTTPException(status_code=400, detail="Invalid JSON")
-    print("Received data:", data)
     user_id = user["sub"]
     
     # Get calendar_id from request data or query params
     calendar_id = data.get("calendar_id")
     
-    # Fetch access token from Supabase
-    token_result = supabase.table("ms_tokens").select("access_token, refresh_token, expires_at").eq("user_id", user_id).execute()
-    if not token_result.data or len(token_result.data) == 0:
-        raise HTTPException(status_code=401, detail="Microsoft account not connected")
-    
-    token_data = token_result.data[0]
-    access_token = token_data["access_token"]
-    refresh_token = token_data["refresh_token"]
-    expires_at = token_data["expires_at"]
-    
-    # Use helper function to check and refresh token if needed
-    access_token = await refresh_token_if_expired(user_id, access_token, refresh_token, expires_at)
+    # Async mode: queue the write and answer 202 right away; poll /api/jobs/{job_id} for the result
+    if data.get("async") or "respond-async" in request.headers.get("Prefer", ""):
+        if not data.get("event"):
+            raise HTTPException(status_code=400, detail="Missing event payload")
+        job = await request.app.state.job_store.enqueue(user_id, CREATE_EVENT_JOB, {"calendar_id": calendar_id, "event": data["event"]})
+        request.app.state.job_workers.notify()
+        status_url = f"/api/jobs/{job['id']}"
+        return JSONResponse({"job_id": job["id"], "status": job["status"], "status_url": status_url}, status_code=202, headers={"Location": status_url})
+
+    # Cached per user; loads from Supabase and refreshes only when needed
+    access_token = await token_cache.get_access_token(client, user_id)
     
-    print("Microsoft access token (first 50 chars):", access_token[:50] if access_token else "None")
     # Prepare event payload from request data
     event_payload = data.get("event")
-    print("Event payload:", event_payload)
     if not event_payload:
         raise HTTPException(status_code=400, detail="Missing event payload")
     
     # Determine the API endpoint based on whether a specific calendar is selected
-    if calendar_id:
-        api_url = f"https://graph.microsoft.com/v1.0/me/calendars/{calendar_id}/events"
-        print(f"Creating event in specific calendar: {calendar_id}")
-    else:
-        api_url = "https://graph.microsoft.com/v1.0/me/events"
-        print("Creating event in default calendar")
+    api_url = event_url(calendar_id)
+    logger.debug("Creating event in %s", f"calendar {calendar_id}" if calendar_id else "the default calendar")
     
     # Call Microsoft Graph API to create event
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            api_url,
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            },
-            json=event_payload
-        )
-        print(f"Microsoft Graph response status: {response.status_code}")
-        print(f"Microsoft Graph response text: {response.text}")
-        if response.status_code >= 400:
-            return {"error": response.text, "status": response.status_code}
-        return response.json()
-
-@router.post("/api/msgraph/calendars")
-async def msgraph_get_calendars(request: Request, user=Depends(get_current_user)):
+    response = await client.post(
+        api_url,
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            MAILBOX_HEADER: user_id,
+            "Content-Type": "application/json"
+        },
+        json=event_payload
+    )
+    if response.status_code >= 400:
+        logger.warning("Failed to create event: %s - %s", response.status_code, response.text)
+        # Throttling was already retried by the scheduler; pass the final status (and Retry-After) on
+        retry_headers = {"Retry-After": response.headers["Retry-After"]} if "Retry-After" in response.headers else None
+        return JSONResponse({"error": response.text, "status": response.status_code}, status_code=response.status_code, headers=retry_headers)
+    return response.json()
+
+@router.post("/api/msgraph/sync-trial")
+async def msgraph_sync_trial(request: Request, user=Depends(get_current_user), client: httpx.AsyncClient = Depends(get_graph_client)):
+    """
+    Create all events for a trial (the trial itself plus every calculated
+    deadline) in the selected calendars through Graph $batch requests.
+    Send the same Idempotency-Key header (or idempotency_key field) when
+    retrying a submit so events that were already created are not duplicated;
+    a retry sent while the first attempt is still running gets a 409.
+    """
     try:
         data = await request.json()
     except Exception as e:
-        print("Error parsing JSON:", e)
+        logger.info("Error parsing JSON: %s", e)
         raise HTTPException(status_code=400, detail="Invalid JSON")
-    
+
     user_id = user["sub"]
-    # Fetch access token from Supabase (reuse the same token logic as create-event)
-    token_result = supabase.table("ms_tokens").select("access_token, refresh_token, expires_at").eq("user_id", user_id).execute()
-    if not token_result.data or len(token_result.data) == 0:
-        raise HTTPException(status_code=401, detail="Microsoft account not connected")
-    
-    token_data = token_result.data[0]
-    access_token = token_data["access_token"]
-    refresh_token = token_data["refresh_token"]
-    expires_at = token_data["expires_at"]
-    
-    # Use helper function to check and refresh token if needed
-    access_token = await refresh_token_if_expired(user_id, access_token, refresh_token, expires_at)
-    
-    all_calendars = []
+    idempotency_key = request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+    access_token = await token_cache.get_access_token(client, user_id)
     headers = {
         "Authorization": f"Bearer {access_token}",
+        MAILBOX_HEADER: user_id,
         "Content-Type": "application/json"
     }
+
+    result = await sync_trial(client, headers, user_id, data, idempotency_key, request.app.state.idempotency_store)
+    logger.info("Trial sync: %d/%d events created", result["succeeded"], result["total"])
+    # 207 Multi-Status when only some of the events were created
+    return JSONResponse(result, status_code=200 if result["failed"] == 0 else 207)
+
+@router.post("/api/msgraph/scheduling-check")
+async def msgraph_scheduling_check(request: Request, user=Depends(get_current_user), client: httpx.AsyncClient = Depends(get_graph_client)):
+    """
+    Check a trial before it is created: takes the sync-trial payload (plus an
+    optional "jurisdiction") and returns the trial and deadline events that
+    would land on days already booked in their calendars, with the nearest
+    free business days to move them to.
+    """
+    try:
+        data = await request.json()
+    except Exception as e:
+        logger.info("Error parsing JSON: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+
+    user_id = user["sub"]
+    access_token = await token_cache.get_access_token(client, user_id)
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        MAILBOX_HEADER: user_id,
+        "Content-Type": "application/json"
+    }
+
+    jurisdiction = data.get("jurisdiction")
+    try:
+        if jurisdiction is not None and not isinstance(jurisdiction, str):
+            raise KeyError(jurisdiction)
+        get_calendar(jurisdiction)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown jurisdiction {jurisdiction!r}; expected one of {jurisdictions()}")
+    try:
+        return await check_schedule(client, headers, user_id, data, jurisdiction)
+    except ValueError as e:
+        # A date outside the business-day tables
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/api/msgraph/scheduling-check/stats")
+async def msgraph_scheduling_check_stats(user=Depends(get_current_user)):
+    """Hit/build counters of the per-calendar conflict index cache."""
+    return index_cache.stats()
+
+@router.post("/api/msgraph/calendars", response_model=CalendarsResponse)
+async def msgraph_get_calendars(request: Request, user=Depends(get_current_user), client: httpx.AsyncClient = Depends(get_graph_client)):
+    try:
+        data = await request.json()
+    except Exception as e:
+        logger.info("Error parsing JSON: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid JSON")
     
-    async with httpx.AsyncClient() as client:
-        # 1. Get all calendars from /me/calendars (includes personal + shared calendars)
-        personal_calendar_ids = set()
-        shared_calendar_ids = set()
-        
-        try:
-            response = await client.get("https://graph.microsoft.com/v1.0/me/calendars?$select=id,name,owner,isDefaultCalendar,canEdit,canShare,canViewPrivateItems", headers=headers)
-            if response.status_code == 200:
-                all_user_calendars = response.json().get("value", [])
-                
-                # Get current user's email to identify personal vs shared calendars
-                user_response = await client.get("https://graph.microsoft.com/v1.0/me?$select=mail,userPrincipalName", headers=headers)
-                current_user_email = None
-                if user_response.status_code == 200:
-                    user_data = user_response.json()
-                    current_user_email = user_data.get("mail") or user_data.get("userPrincipalName")
-                    print(f"Current user email from Graph API: {current_user_email}")
-                else:
-                    print(f"Failed to get user info: {user_response.status_code} - {user_response.text}")
-                    # Fallback: Use email from Supabase JWT if Graph API fails
-                    if user and user.get("email"):
-                        current_user_email = user.get("email")
-                        print(f"Using fallback email from Supabase JWT: {current_user_email}")
-                    else:
-                        print("No fallback email available - will treat all calendars as shared")
-                
-                for cal in all_user_calendars:
-                    calendar_owner = cal.get("owner")
-                    
-                    # Handle calendars without owner information
-                    if calendar_owner is None:
-                        calendar_name = cal.get("name", "")
-                        
-                        # If the calendar name looks like an email address, treat it as shared
-                        if "@" in calendar_name and "." in calendar_name:
-                            cal["type"] = "shared"
-                            cal["groupName"] = f"Shared calendar"
-                            shared_calendar_ids.add(cal["id"])
-                            print(f"✗ Shared calendar (no owner info, email-like name): {calendar_name}")
-                        else:
-                            # Otherwise treat as personal (likely user's own calendar without proper owner info)
-                            cal["type"] = "personal"
-                            personal_calendar_ids.add(cal["id"])
-                            print(f"✓ Personal calendar (no owner info, non-email name): {calendar_name}")
-                        continue
-                        
-                    calendar_owner_email = calendar_owner.get("address", "")
-                    
-                    # Check if this calendar is owned by the current user
-                    if current_user_email and calendar_owner_email.lower() == current_user_email.lower():
-                        cal["type"] = "personal"
-                        personal_calendar_ids.add(cal["id"])
-                        print(f"✓ Personal calendar: {cal.get('name')} - Owner: {calendar_owner_email}")
-                    else:
-                        cal["type"] = "shared"
-                        owner_name = calendar_owner.get("name", "Unknown")
-                        cal["groupName"] = f"Shared by {owner_name}"
-                        shared_calendar_ids.add(cal["id"])
-                        print(f"✗ Shared calendar: {cal.get('name')} - Owner: {calendar_owner_email}")
-                        if not current_user_email:
-                            print(f"  Reason: current_user_email is None")
-                    
-                all_calendars.extend(all_user_calendars)
-            else:
-                print(f"Failed to get calendars: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"Error fetching calendars: {e}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
-        
-        # 2. Get calendar groups (additional shared calendars not in /me/calendars)
-        try:
-            response = await client.get("https://graph.microsoft.com/v1.0/me/calendarGroups", headers=headers)
-            if response.status_code == 200:
-                calendar_groups = response.json().get("value", [])
-                for group in calendar_groups:
-                    # Skip "My calendars" group since we already processed those
-                    if group.get("name", "").lower() in ["my calendars", "my calendar", "meine kalender"]:
-                        print(f"Skipping '{group.get('name')}' group - already processed")
-                        continue
-                    
-                    # Get calendars in each group
-                    group_response = await client.get(f"https://graph.microsoft.com/v1.0/me/calendarGroups/{group['id']}/calendars?$select=id,name,owner,isDefaultCalendar,canEdit,canShare,canViewPrivateItems", headers=headers)
-                    if group_response.status_code == 200:
-                        group_calendars = group_response.json().get("value", [])
-                        for cal in group_calendars:
-                            # Only add if not already processed from /me/calendars
-                            if cal["id"] not in personal_calendar_ids and cal["id"] not in shared_calendar_ids:
-                                cal["type"] = "shared"
-                                cal["groupName"] = group.get("name", "Unknown Group")
-                                all_calendars.append(cal)
-                                print(f"Additional shared calendar from group: {cal.get('name')} - Group: {group.get('name')}")
-                            else:
-                                print(f"Skipping duplicate calendar '{cal.get('name')}' - already processed")
-            else:
-                print(f"Failed to get calendar groups: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"Error fetching calendar groups: {e}")
-        
-        # 3. Get Office 365 group calendars (if user is member) - Optional, may not work for personal accounts
-        existing_calendar_ids = {cal["id"] for cal in all_calendars}  # Track all existing calendar IDs
-        try:
-            response = await client.get("https://graph.microsoft.com/v1.0/me/memberOf?$filter=groupTypes/any(c:c eq 'Unified')", headers=headers)
-            if response.status_code == 200:
-                groups = response.json().get("value", [])
-                print(f"Found {len(groups)} Office 365 groups")
-                for group in groups:
-                    # Get calendar for each Office 365 group
-                    group_cal_response = await client.get(f"https://graph.microsoft.com/v1.0/groups/{group['id']}/calendar?$select=id,name,owner,isDefaultCalendar", headers=headers)
-                    if group_cal_response.status_code == 200:
-                        group_calendar = group_cal_response.json()
-                        # Only add if not already in existing calendars
-                        if group_calendar["id"] not in existing_calendar_ids:
-                            group_calendar["type"] = "group"
-                            group_calendar["groupName"] = group.get("displayName", "Unknown Group")
-                            all_calendars.append(group_calendar)
-                            print(f"Office 365 group calendar: {group_calendar.get('name')} - Group: {group.get('displayName')}")
-                        else:
-                            print(f"Skipping duplicate group calendar '{group_calendar.get('name')}' - already exists")
-                    else:
-                        print(f"Failed to get calendar for group '{group.get('displayName')}': {group_cal_response.status_code}")
-            elif response.status_code == 404:
-                print("Office 365 groups not available - likely a personal Microsoft account or insufficient permissions")
-            elif response.status_code == 403:
-                print("Access denied to Office 365 groups - insufficient permissions")
-            else:
-                print(f"Failed to get group memberships: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"Error fetching group calendars (non-critical): {e}")
-    
-    print(f"Total calendars found: {len(all_calendars)}")
-    return {"calendars": all_calendars}
+    user_id = user["sub"]
 
-@router.post("/api/msgraph/calendar-events")
-async def msgraph_get_calendar_events(request: Request, user=Depends(get_current_user)):
+    async def load_calendars():
+        # Cached per user; loads from Supabase and refreshes only when needed
+        access_token = await token_cache.get_access_token(client, user_id)
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            MAILBOX_HEADER: user_id,
+            "Content-Type": "application/json"
+        }
+        return [compact_calendar(calendar) for calendar in await discover_calendars(client, headers, user)]
+
+    # A user's calendar set rarely changes: serve it from the per-user cache
+    all_calendars = await calendar_cache.get(user_id, load_calendars, force_refresh=bool(data.get("force_refresh")))
+    return CompactJSONResponse({"calendars": all_calendars}, accept_encoding=request.headers.get("accept-encoding", ""))
+
+
+@router.get("/api/msgraph/calendars/cache-stats")
+async def msgraph_calendar_cache_stats(user=Depends(get_current_user)):
+    """Hit/miss counters and size of the calendar list cache."""
+    return calendar_cache.stats()
+
+def events_response(request: Request, events: list) -> CompactJSONResponse:
+    return CompactJSONResponse({"events": events, "total": len(events)}, accept_encoding=request.headers.get("accept-encoding", ""))
+
+@router.post("/api/msgraph/calendar-events", response_model=EventsResponse)
+async def msgraph_get_calendar_events(request: Request, user=Depends(get_current_user), client: httpx.AsyncClient = Depends(get_graph_client)):
+    """
+    Events of one calendar in a date range. Body: {"calendar_id", "start"?, "end"?,
+    "sync"?: "delta", "fields"?: [...]}. "fields" limits each event to those
+    fields (and the Graph request to the properties they need); empty values
+    are left out. Large responses are gzip compressed when accepted.
+    """
     try:
         data = await request.json()
     except Exception as e:
-        print("Error parsing JSON:", e)
+        logger.info("Error parsing JSON: %s", e)
         raise HTTPException(status_code=400, detail="Invalid JSON")
     
     calendar_id = data.get("calendar_id")
     if not calendar_id:
         raise HTTPException(status_code=400, detail="Missing calendar_id")
+    try:
+        fields, select = select_fields(data.get("fields"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     user_id = user["sub"]
-    # Fetch access token from Supabase
-    token_result = supabase.table("ms_tokens").select("access_token, refresh_token, expires_at").eq("user_id", user_id).execute()
-    if not token_result.data or len(token_result.data) == 0:
-        raise HTTPException(status_code=401, detail="Microsoft account not connected")
-    
-    token_data = token_result.data[0]
-    access_token = token_data["access_token"]
-    refresh_token = token_data["refresh_token"]
-    expires_at = token_data["expires_at"]
-    
-    # Use helper function to check and refresh token if needed
-    access_token = await refresh_token_if_expired(user_id, access_token, refresh_token, expires_at)
+    # Cached per user; loads from Supabase and refreshes only when needed
+    access_token = await token_cache.get_access_token(client, user_id)
     
     headers = {
         "Authorization": f"Bearer {access_token}",
+        MAILBOX_HEADER: user_id,
         "Content-Type": "application/json"
     }
     
-    # Get current date and 30 days from now for filtering upcoming events
-    from datetime import datetime, timedelta
-    start_time = datetime.now().isoformat() + "Z"
-    end_time = (datetime.now() + timedelta(days=30)).isoformat() + "Z"
+    # Upcoming 30 days unless the caller asks for another range (at most a year either side of today)
+    start, end = parse_event_range(data)
     
     try:
-        async with httpx.AsyncClient() as client:
-            # Fetch events for the specific calendar with date filter
-            url = f"https://graph.microsoft.com/v1.0/me/calendars/{calendar_id}/events"
-            params = {
-                "$filter": f"start/dateTime ge '{start_time}' and start/dateTime le '{end_time}'",
-                "$orderby": "start/dateTime",
-                "$top": 50,
-                "$select": "id,subject,start,end,location,organizer,isAllDay,bodyPreview,webLink,categories"
-            }
-            
-            response = await client.get(url, headers=headers, params=params)
-            
-            if response.status_code == 200:
-                events_data = response.json()
-                events = events_data.get("value", [])
-                
-                # Process events to add helpful formatting
-                for event in events:
-                    # Add formatted date strings
-                    if event.get("start"):
-                        start_dt = datetime.fromisoformat(event["start"]["dateTime"].replace("Z", "+00:00"))
-                        event["formattedStartDate"] = start_dt.strftime("%B %d, %Y")
-                        event["formattedStartTime"] = start_dt.strftime("%I:%M %p") if not event.get("isAllDay") else "All day"
-                    
-                    if event.get("end"):
-                        end_dt = datetime.fromisoformat(event["end"]["dateTime"].replace("Z", "+00:00"))
-                        event["formattedEndTime"] = end_dt.strftime("%I:%M %p") if not event.get("isAllDay") else "All day"
-                
-                return {"events": events, "total": len(events)}
-            else:
-                print(f"Failed to get calendar events: {response.status_code} - {response.text}")
-                raise HTTPException(status_code=response.status_code, detail=f"Failed to fetch events: {response.text}")
+        if data.get("sync") == "delta":
+            # Incremental: replay Graph changes into the local store and serve the range from it
+            events = await event_store.events_in_range(client, headers, user_id, calendar_id, start, end, force_sync=bool(data.get("force_sync")))
+            return events_response(request, [compact_event(event, fields) for event in events])
+
+        # Fetch events for the specific calendar with date filter, following every page
+        url = f"{graph_url()}/me/calendars/{calendar_id}/events"
+        params = {
+            "$filter": f"start/dateTime ge '{graph_iso(start)}' and start/dateTime le '{graph_iso(end)}'",
+            "$orderby": "start/dateTime",
+            "$top": EVENT_PAGE_SIZE,
+            "$select": select
+        }
+        events = await get_all_pages(client, url, headers, params)
+        
+        # Add the formatted date and time strings, if any were asked for
+        if any(field in DERIVED_FIELDS for field in fields):
+            for event in events:
+                enrich_event(event)
+        
+        return events_response(request, [compact_event(event, fields) for event in events])
                 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error fetching calendar events: {e}")
+        logger.exception("Error fetching calendar events: %s", e)
         raise HTTPException(status_code=500, detail=f"Error fetching events: {str(e)}")
 
+@router.post("/api/msgraph/agenda")
+async def msgraph_agenda(request: Request, user=Depends(get_current_user), client: httpx.AsyncClient = Depends(get_graph_client)):
+    """
+    Merged agenda across many calendars, streamed in start-time order.
+    Body: {"calendar_ids": [...], "start"?, "end"?, "format": "ndjson" | "sse", "sync"?: "delta"}.
+    Each line (or SSE message) is an event with its calendarId, an error for a
+    calendar that failed, and finally {"type": "end", "total": n}.
+    """
+    try:
+        data = await request.json()
+    except Exception as e:
+        logger.info("Error parsing JSON: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+
+    calendar_ids = list(dict.fromkeys(data.get("calendar_ids") or []))
+    if not calendar_ids:
+        raise HTTPException(status_code=400, detail="Missing calendar_ids")
+
+    start, end = parse_event_range(data)
+
+    user_id = user["sub"]
+    access_token = await token_cache.get_access_token(client, user_id)
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        MAILBOX_HEADER: user_id,
+        "Content-Type": "application/json"
+    }
+
+    records = merged_agenda(client, headers, user_id, calendar_ids, start, end, use_store=data.get("sync") == "delta")
+    if data.get("format") == "sse":
+        return StreamingResponse(stream_agenda(records, format_sse), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    return StreamingResponse(stream_agenda(records, format_ndjson), media_type="application/x-ndjson")
+
 @router.post("/api/msgraph/status")
 async def msgraph_status(request: Request, user=Depends(get_current_user)):
     data = await request.json()
@@ -365,59 +292,149 @@ async def msgraph_status(request: Request, user=Depends(get_current_user)):
     except ValueError:
         raise HTTPException(status_code=400, detail="user_id is not a valid UUID")
     # Query ms_tokens for this user
-    result = supabase.table("ms_tokens").select("user_id").eq("user_id", user_id).execute()
-    connected = bool(result.data and len(result.data) > 0)
+    connected = await db.ms_tokens_exist(user_id)
     return {"connected": connected}
 
 @router.post("/api/msgraph/disconnect")
-async def msgraph_disconnect(request: Request, user=Depends(get_current_user)):
+async def msgraph_disconnect(request: Request, user=Depends(get_current_user), client: httpx.AsyncClient = Depends(get_graph_client)):
     """
     Disconnect Microsoft account by deleting the stored tokens.
     This will force the user to re-authenticate and consent to new permissions.
     """
     user_id = user["sub"]
     
+    # Change subscriptions need the token to be deleted, so they go first
+    await subscriptions.remove_user(client, user_id)
     # Delete the stored Microsoft tokens
-    result = supabase.table("ms_tokens").delete().eq("user_id", user_id).execute()
+    await db.delete_ms_tokens(user_id)
+    token_cache.invalidate(user_id)
+    calendar_cache.invalidate(user_id)
+    event_store.invalidate(user_id)
+    # The other worker processes drop their copies too
+    worker_bus.send(TOKENS_CHANGED, user_id)
+    notification_hub.publish(user_id, {"type": "status", "connected": False})
     
     return {"success": True, "message": "Microsoft account disconnected successfully"}
 
 @router.post("/api/msgraph/token")
-async def msgraph_token(request: Request, user=Depends(get_current_user)):
+async def msgraph_token(request: Request, user=Depends(get_current_user), client: httpx.AsyncClient = Depends(get_graph_client)):
     data = await request.json()
     code = data.get("code")
-    token_url = "https://login.microsoftonline.com/common/oauth2/v2.0/token"
+    settings = get_settings()
     payload = {
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
+        "client_id": settings.ms_client_id,
+        "client_secret": settings.ms_client_secret,
         "code": code,
         "redirect_uri": REDIRECT_URI,
         "grant_type": "authorization_code",
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(token_url, data=payload)
-        tokens = response.json()
+    response = await client.post(token_url(), data=payload)
+    tokens = response.json()
 
     # Store tokens for the authenticated user
     expires_in = tokens.get("expires_in")
-    expires_at = (datetime.datetime.utcnow() + datetime.timedelta(seconds=expires_in)).isoformat() if expires_in else None
+    expires_at = expires_at_from_now(expires_in)
 
     if user and "access_token" in tokens:
-        print(supabase.table("ms_tokens").select("*").execute())
-        print("User object:", user)
         upsert_data = {
             "user_id": user["sub"],
             "access_token": tokens["access_token"],
             "refresh_token": tokens.get("refresh_token"),
             "expires_at": expires_at
         }
-        print("Upsert data:", upsert_data)
         # Validate user_id is a UUID
         import uuid
         try:
             uuid.UUID(str(upsert_data["user_id"]))
         except ValueError:
-            print("ERROR: user_id is not a valid UUID:", upsert_data["user_id"])
+            logger.error("user_id is not a valid UUID: %s", upsert_data["user_id"])
             raise HTTPException(status_code=400, detail="user_id is not a valid UUID")
-        supabase.table("ms_tokens").upsert(upsert_data).execute()
+        token_cache.invalidate(upsert_data["user_id"])
+        calendar_cache.invalidate(upsert_data["user_id"])
+        event_store.invalidate(upsert_data["user_id"])
+        await db.upsert_ms_tokens(upsert_data)
+        token_cache.store(upsert_data["user_id"], upsert_data["access_token"], upsert_data["refresh_token"], expires_at)
+        worker_bus.send(TOKENS_CHANGED, upsert_data["user_id"])
+        notification_hub.publish(upsert_data["user_id"], {"type": "status", "connected": True})
     return tokens
+
+
+@router.get("/api/msgraph/notifications/stream")
+async def msgraph_notification_stream(user=Depends(get_current_user_from_query)):
+    """
+    Live updates for the signed-in user's dashboards, as server-sent events:
+    `status` ({"connected": bool}) on connect and whenever the Microsoft
+    connection changes, `event_change` ({"calendarId", "changeType", "eventId"})
+    when Graph reports a change in a subscribed calendar, and `resync`
+    ({"calendarId"?}) when changes may have been missed and the client should refetch.
+    EventSource can't send headers, so the Supabase JWT comes as ?access_token=.
+    """
+    user_id = user["sub"]
+    connected = await db.ms_tokens_exist(user_id)
+    await subscriptions.listening(user_id)
+    return StreamingResponse(
+        notification_hub.stream(user_id, [{"type": "status", "connected": connected}], until=user.get("exp")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/api/msgraph/subscriptions")
+async def msgraph_subscribe(request: Request, user=Depends(get_current_user), client: httpx.AsyncClient = Depends(get_graph_client)):
+    """
+    Subscribe to Graph change notifications for one of the user's calendars
+    (idempotent). Body: {"calendar_id"}. Without a subscription ("subscribed":
+    false, e.g. GRAPH_NOTIFICATION_URL unset) the client has to keep refetching.
+    """
+    try:
+        data = await request.json()
+    except Exception as e:
+        logger.info("Error parsing JSON: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    calendar_id = data.get("calendar_id")
+    if not calendar_id:
+        raise HTTPException(status_code=400, detail="Missing calendar_id")
+    subscription = await subscriptions.ensure(client, user["sub"], calendar_id)
+    return {
+        "subscribed": subscription is not None,
+        "expires_at": subscription.expires_at.isoformat() if subscription else None,
+    }
+
+
+@router.post("/api/msgraph/notifications")
+async def msgraph_notifications(request: Request):
+    """
+    Graph change and lifecycle notifications (no user auth: each notification
+    must carry its subscription's clientState). When a subscription is
+    created Graph first posts ?validationToken=..., which has to be echoed
+    back as text/plain.
+    """
+    validation_token = request.query_params.get("validationToken")
+    if validation_token is not None:
+        return PlainTextResponse(validation_token)
+    try:
+        data = await request.json()
+    except Exception as e:
+        logger.info("Error parsing JSON: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    await subscriptions.handle(data.get("value") or [])
+    # Graph retries anything but 2xx, so unknown subscriptions are acknowledged too
+    return Response(status_code=202)
+
+
+@router.get("/api/msgraph/subscriptions/stats")
+async def msgraph_subscription_stats(user=Depends(get_current_user)):
+    """Subscription counters of this worker process (the subscription count is for all of them), and its live streams."""
+    return {**await subscriptions.stats(), "streams": notification_hub.stats(), "worker_bus": worker_bus.stats()}
+
+
+@router.get("/api/msgraph/pool-stats")
+async def msgraph_pool_stats(user=Depends(get_current_user), client: httpx.AsyncClient = Depends(get_graph_client)):
+    """Connection pool statistics for the shared Microsoft Graph client."""
+    return pool_stats(client)
+
+
+@router.get("/api/msgraph/scheduler-stats")
+async def msgraph_scheduler_stats(user=Depends(get_current_user)):
+    """Queue depth, in-flight requests and throttling counters for the Graph request scheduler."""
+    return graph_scheduler.stats()
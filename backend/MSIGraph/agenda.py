@@ -0,0 +1,162 @@
+import json
+import heapq
+import asyncio
+import datetime
+from typing import AsyncIterator
+import httpx
+from fastapi import HTTPException
+from backend.settings import get_settings
+from .graph_client import graph_url
+from .events import EVENT_SELECT, EVENT_PAGE_SIZE, enrich_event
+from .event_store import event_store, graph_iso
+
+# Pages buffered per calendar before its fetcher waits for the merge to catch up
+AGENDA_PAGE_BUFFER = 4
+
+_DONE = object()
+
+
+class CalendarFetchError(Exception):
+    def __init__(self, calendar_id: str, status: int, detail: str):
+        super().__init__(detail)
+        self.calendar_id = calendar_id
+        self.status = status
+        self.detail = detail
+
+
+async def _fetch_pages(client: httpx.AsyncClient, headers: dict, calendar_id: str, start: datetime.datetime, end: datetime.datetime,
+                       queue: asyncio.Queue, semaphore: asyncio.Semaphore) -> None:
+    """Page through a calendar's calendarView in start order, pushing each page onto `queue`."""
+    url = f"{graph_url()}/me/calendars/{calendar_id}/calendarView"
+    params = {
+        "startDateTime": graph_iso(start),
+        "endDateTime": graph_iso(end),
+        "$orderby": "start/dateTime",
+        "$select": EVENT_SELECT,
+        "$top": EVENT_PAGE_SIZE,
+    }
+    headers = {**headers, "Prefer": 'outlook.timezone="UTC"'}
+    try:
+        while url:
+            # Held per request, never while waiting for queue space: a fetcher blocked on a
+            # full buffer must not keep another calendar's first page from being fetched
+            async with semaphore:
+                response = await client.get(url, headers=headers, params=params)
+            if response.status_code != 200:
+                raise CalendarFetchError(calendar_id, response.status_code, response.text)
+            page = response.json()
+            await queue.put(page.get("value", []))
+            url, params = page.get("@odata.nextLink"), None
+    except CalendarFetchError as e:
+        await queue.put(e)
+    except Exception as e:
+        await queue.put(CalendarFetchError(calendar_id, 502, str(e)))
+    # Not in a finally: once cancelled (the agenda was abandoned) nobody reads the queue,
+    # and waiting for space in a full one would never end
+    await queue.put(_DONE)
+
+
+async def _iterate_queue(queue: asyncio.Queue) -> AsyncIterator:
+    while True:
+        page = await queue.get()
+        if page is _DONE:
+            return
+        if isinstance(page, CalendarFetchError):
+            yield page
+            continue
+        for event in page:
+            yield event
+
+
+async def _iterate_list(events: list) -> AsyncIterator:
+    for event in events:
+        yield event
+
+
+async def _iterate_store(client: httpx.AsyncClient, headers: dict, user_id: str, calendar_id: str,
+                         start: datetime.datetime, end: datetime.datetime, semaphore: asyncio.Semaphore) -> AsyncIterator:
+    try:
+        async with semaphore:
+            events = await event_store.events_in_range(client, headers, user_id, calendar_id, start, end)
+    except HTTPException as e:
+        yield CalendarFetchError(calendar_id, e.status_code, str(e.detail))
+        return
+    async for event in _iterate_list(events):
+        yield event
+
+
+def _start_key(event: dict) -> str:
+    # Graph returns UTC "YYYY-MM-DDTHH:MM:SS.fffffff" strings, which sort chronologically
+    return (event.get("start") or {}).get("dateTime", "")
+
+
+async def merged_agenda(client: httpx.AsyncClient, headers: dict, user_id: str, calendar_ids: list,
+                        start: datetime.datetime, end: datetime.datetime, use_store: bool = False) -> AsyncIterator[dict]:
+    """
+    Fetch many calendars concurrently and yield their events as one stream
+    ordered by start time (a k-way merge over the per-calendar streams).
+
+    Every calendar is paged independently, so an event is emitted as soon as
+    each calendar has delivered the page that could precede it, without waiting
+    for the slowest calendar to finish. Each event is enriched once, on its way
+    out. A failing calendar yields {"type": "error", ...} and the rest continue.
+    """
+    semaphore = asyncio.Semaphore(max(1, get_settings().agenda_concurrency))
+    tasks = []
+    streams = []
+    for calendar_id in calendar_ids:
+        if use_store:
+            streams.append(_iterate_store(client, headers, user_id, calendar_id, start, end, semaphore))
+        else:
+            queue = asyncio.Queue(maxsize=AGENDA_PAGE_BUFFER)
+            tasks.append(asyncio.create_task(_fetch_pages(client, headers, calendar_id, start, end, queue, semaphore)))
+            streams.append(_iterate_queue(queue))
+
+    async def advance(index: int):
+        """Pull the next event of stream `index` onto the heap, emitting errors as they come."""
+        async for item in streams[index]:
+            if isinstance(item, CalendarFetchError):
+                errors.append({"type": "error", "calendarId": item.calendar_id, "status": item.status, "detail": item.detail})
+                continue
+            heapq.heappush(heap, (_start_key(item), index, item))
+            return
+
+    heap = []
+    errors = []
+    try:
+        await asyncio.gather(*[advance(i) for i in range(len(streams))])
+        while errors:
+            yield errors.pop(0)
+        while heap:
+            _, index, event = heapq.heappop(heap)
+            event = dict(event)
+            if "formattedStartDate" not in event:
+                enrich_event(event)
+            event["calendarId"] = calendar_ids[index]
+            event["type"] = "event"
+            yield event
+            await advance(index)
+            while errors:
+                yield errors.pop(0)
+    finally:
+        # The client may have gone away mid-stream: stop the fetchers and their Graph requests
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def format_ndjson(record: dict) -> bytes:
+    return (json.dumps(record, separators=(",", ":")) + "\n").encode()
+
+
+def format_sse(record: dict) -> bytes:
+    return f"event: {record['type']}\ndata: {json.dumps(record, separators=(',', ':'))}\n\n".encode()
+
+
+async def stream_agenda(records: AsyncIterator[dict], formatter) -> AsyncIterator[bytes]:
+    total = 0
+    async for record in records:
+        if record["type"] == "event":
+            total += 1
+        yield formatter(record)
+    yield formatter({"type": "end", "total": total})
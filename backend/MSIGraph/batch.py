@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import httpx
+from .graph_client import graph_url
+from .scheduler import graph_scheduler, mailbox_key, parse_retry_after, retryable
+
+logger = logging.getLogger(__name__)
+
+# Graph accepts at most 20 requests per JSON $batch
+GRAPH_BATCH_SIZE = 20
+
+
+def chunked(items: list, size: int) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def post_batch(client: httpx.AsyncClient, headers: dict, requests: list) -> dict:
+    """
+    Send up to 20 Graph requests as one JSON $batch.
+    Each request is {"id", "method", "url", ...} with a url relative to /v1.0.
+    Returns {request id: {"status", "headers", "body"}}. If the $batch call
+    itself fails, every request in it gets that status and error body.
+    """
+    response = await client.post(f"{graph_url()}/$batch", headers=headers, json={"requests": requests})
+    if response.status_code != 200:
+        failure = {"status": response.status_code, "headers": dict(response.headers), "body": {"error": response.text}}
+        return {request["id"]: failure for request in requests}
+    return {item["id"]: item for item in response.json().get("responses", [])}
+
+
+def _retry_after(response: dict):
+    for name, value in (response.get("headers") or {}).items():
+        if name.lower() == "retry-after":
+            return parse_retry_after(str(value))
+    return None
+
+
+async def run_batched(client: httpx.AsyncClient, headers: dict, requests: list) -> dict:
+    """
+    Split `requests` into $batch calls and send them all. Returns the merged
+    per-request responses. Request ids must be unique across the whole list.
+
+    Outlook counts every request inside a batch against the mailbox's limit
+    of concurrent requests, so a batch holds no more requests than the
+    mailbox may run at once and takes that many of its slots in the
+    scheduler: batches for one mailbox never add up to more than its limit.
+
+    Graph throttles the requests inside a batch individually: a 200 $batch
+    can carry 429 or 503 responses. Those requests are sent again in a new
+    batch once the longest Retry-After has passed (the mailbox is held by
+    the scheduler meanwhile), up to the scheduler's max_retries. A 503 is
+    only retried for requests retryable() considers safe to repeat.
+    """
+
+    async def send(chunk):
+        try:
+            return await post_batch(client, headers, chunk)
+        except httpx.HTTPError as e:
+            failure = {"status": 502, "headers": {}, "body": {"error": str(e)}}
+            return {request["id"]: failure for request in chunk}
+
+    results = {}
+    pending = requests
+    key = mailbox_key(headers)
+    for attempt in range(graph_scheduler.max_retries + 1):
+        size = max(1, min(GRAPH_BATCH_SIZE, graph_scheduler.batch_size(key)))
+        for chunk_result in await asyncio.gather(*[send(chunk) for chunk in chunked(pending, size)]):
+            results.update(chunk_result)
+        throttled = [request for request in pending
+                     if retryable(results[request["id"]].get("status"), request["method"], request.get("body"))]
+        if not throttled or attempt == graph_scheduler.max_retries:
+            break
+        retry_afters = [_retry_after(results[request["id"]]) for request in throttled]
+        delay = max((r for r in retry_afters if r is not None), default=None)
+        if delay is not None and delay > graph_scheduler.max_retry_after:
+            break
+        # Sets the mailbox's hold; the retried $batch waits for it in the scheduler
+        graph_scheduler.throttle(key, graph_scheduler.backoff(attempt, delay))
+        graph_scheduler.metrics["batch_subrequest_retries"] += len(throttled)
+        logger.warning("%d $batch requests throttled; retrying", len(throttled))
+        pending = throttled
+    return results
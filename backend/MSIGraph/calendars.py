@@ -0,0 +1,222 @@
+import asyncio
+import logging
+from typing import Optional
+import httpx
+from backend.settings import get_settings
+from .graph_client import graph_url
+from .models import CalendarPayload
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_SELECT = "$select=id,name,owner,isDefaultCalendar,canEdit,canShare,canViewPrivateItems"
+GROUP_CALENDAR_SELECT = "$select=id,name,owner,isDefaultCalendar"
+SKIPPED_CALENDAR_GROUPS = ["my calendars", "my calendar", "meine kalender"]
+# What /api/msgraph/calendars returns per calendar: the selected Graph fields plus the classification
+CALENDAR_FIELDS = ("id", "name", "type", "groupName", "owner", "isDefaultCalendar", "canEdit", "canShare", "canViewPrivateItems")
+
+
+async def _gather_in_order(calls, concurrency: int) -> list:
+    """
+    Run the coroutine factories in `calls` with at most `concurrency` in flight.
+    Results come back in call order; exceptions are returned, not raised.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(call):
+        async with semaphore:
+            return await call()
+
+    return await asyncio.gather(*[run(call) for call in calls], return_exceptions=True)
+
+
+def compact_calendar(calendar: dict) -> CalendarPayload:
+    """A discovered calendar without @odata annotations, unset fields or owner details beyond name and address."""
+    compact = {}
+    for field in CALENDAR_FIELDS:
+        value = calendar.get(field)
+        if value is None:
+            continue
+        if field == "owner":
+            value = {key: value[key] for key in ("name", "address") if value.get(key)}
+        compact[field] = value
+    return compact
+
+
+async def discover_calendars(client: httpx.AsyncClient, headers: dict, user: dict, concurrency: Optional[int] = None) -> list:
+    """
+    Collect personal, shared and Office 365 group calendars for the signed-in user.
+
+    The four independent lookups (/me/calendars, /me, /me/calendarGroups and
+    /me/memberOf) run concurrently, then the per-group lookups fan out with at
+    most `concurrency` requests in flight. Results are assembled in the same
+    order, with the same classification and de-duplication, as a sequential walk.
+    """
+    if concurrency is None:
+        concurrency = get_settings().graph_fanout_concurrency
+    calendars_response, user_response, groups_response, member_of_response = await asyncio.gather(
+        client.get(f"{graph_url()}/me/calendars?{CALENDAR_SELECT}", headers=headers),
+        client.get(f"{graph_url()}/me?$select=mail,userPrincipalName", headers=headers),
+        client.get(f"{graph_url()}/me/calendarGroups", headers=headers),
+        client.get(f"{graph_url()}/me/memberOf?$filter=groupTypes/any(c:c eq 'Unified')", headers=headers),
+        return_exceptions=True,
+    )
+
+    # Start the per-group fan-outs right away; they only depend on the group lists
+    calendar_groups = []
+    calendar_groups_task = None
+    if isinstance(groups_response, httpx.Response) and groups_response.status_code == 200:
+        try:
+            calendar_groups = [
+                group for group in groups_response.json().get("value", [])
+                if group.get("name", "").lower() not in SKIPPED_CALENDAR_GROUPS
+            ]
+            calendar_groups_task = asyncio.ensure_future(_gather_in_order([
+                (lambda group_id=group["id"]: client.get(f"{graph_url()}/me/calendarGroups/{group_id}/calendars?{CALENDAR_SELECT}", headers=headers))
+                for group in calendar_groups
+            ], concurrency))
+        except Exception as e:
+            groups_response = e
+
+    office_groups = []
+    office_groups_task = None
+    if isinstance(member_of_response, httpx.Response) and member_of_response.status_code == 200:
+        try:
+            office_groups = member_of_response.json().get("value", [])
+            office_groups_task = asyncio.ensure_future(_gather_in_order([
+                (lambda group_id=group["id"]: client.get(f"{graph_url()}/groups/{group_id}/calendar?{GROUP_CALENDAR_SELECT}", headers=headers))
+                for group in office_groups
+            ], concurrency))
+        except Exception as e:
+            member_of_response = e
+
+    all_calendars = []
+
+    # 1. Calendars from /me/calendars (includes personal + shared calendars)
+    personal_calendar_ids = set()
+    shared_calendar_ids = set()
+
+    try:
+        if isinstance(calendars_response, Exception):
+            raise calendars_response
+        response = calendars_response
+        if response.status_code == 200:
+            all_user_calendars = response.json().get("value", [])
+
+            # Current user's email identifies personal vs shared calendars
+            current_user_email = None
+            if isinstance(user_response, httpx.Response) and user_response.status_code == 200:
+                user_data = user_response.json()
+                current_user_email = user_data.get("mail") or user_data.get("userPrincipalName")
+                logger.debug("Current user email from Graph API: %s", current_user_email)
+            else:
+                if isinstance(user_response, Exception):
+                    raise user_response
+                logger.warning("Failed to get user info: %s - %s", user_response.status_code, user_response.text)
+                # Fallback: Use email from Supabase JWT if Graph API fails
+                if user and user.get("email"):
+                    current_user_email = user.get("email")
+                    logger.debug("Using fallback email from Supabase JWT: %s", current_user_email)
+                else:
+                    logger.info("No fallback email available - will treat all calendars as shared")
+
+            for cal in all_user_calendars:
+                calendar_owner = cal.get("owner")
+
+                # Handle calendars without owner information
+                if calendar_owner is None:
+                    calendar_name = cal.get("name", "")
+
+                    # If the calendar name looks like an email address, treat it as shared
+                    if "@" in calendar_name and "." in calendar_name:
+                        cal["type"] = "shared"
+                        cal["groupName"] = f"Shared calendar"
+                        shared_calendar_ids.add(cal["id"])
+                        logger.debug("Shared calendar (no owner info, email-like name): %s", calendar_name)
+                    else:
+                        # Otherwise treat as personal (likely user's own calendar without proper owner info)
+                        cal["type"] = "personal"
+                        personal_calendar_ids.add(cal["id"])
+                        logger.debug("Personal calendar (no owner info, non-email name): %s", calendar_name)
+                    continue
+
+                calendar_owner_email = calendar_owner.get("address", "")
+
+                # Check if this calendar is owned by the current user
+                if current_user_email and calendar_owner_email.lower() == current_user_email.lower():
+                    cal["type"] = "personal"
+                    personal_calendar_ids.add(cal["id"])
+                    logger.debug("Personal calendar: %s - Owner: %s", cal.get("name"), calendar_owner_email)
+                else:
+                    cal["type"] = "shared"
+                    owner_name = calendar_owner.get("name", "Unknown")
+                    cal["groupName"] = f"Shared by {owner_name}"
+                    shared_calendar_ids.add(cal["id"])
+                    logger.debug("Shared calendar: %s - Owner: %s%s", cal.get("name"), calendar_owner_email,
+                                 "" if current_user_email else " (current user email unknown)")
+
+            all_calendars.extend(all_user_calendars)
+        else:
+            logger.warning("Failed to get calendars: %s - %s", response.status_code, response.text)
+    except Exception as e:
+        logger.exception("Error fetching calendars: %s", e)
+
+    # 2. Calendar groups (additional shared calendars not in /me/calendars)
+    try:
+        if isinstance(groups_response, Exception):
+            raise groups_response
+        if groups_response.status_code == 200:
+            group_responses = await calendar_groups_task
+            for group, group_response in zip(calendar_groups, group_responses):
+                if isinstance(group_response, Exception):
+                    raise group_response
+                if group_response.status_code == 200:
+                    group_calendars = group_response.json().get("value", [])
+                    for cal in group_calendars:
+                        # Only add if not already processed from /me/calendars
+                        if cal["id"] not in personal_calendar_ids and cal["id"] not in shared_calendar_ids:
+                            cal["type"] = "shared"
+                            cal["groupName"] = group.get("name", "Unknown Group")
+                            all_calendars.append(cal)
+                            logger.debug("Additional shared calendar from group: %s - Group: %s", cal.get("name"), group.get("name"))
+                        else:
+                            logger.debug("Skipping duplicate calendar %r - already processed", cal.get("name"))
+        else:
+            logger.warning("Failed to get calendar groups: %s - %s", groups_response.status_code, groups_response.text)
+    except Exception as e:
+        logger.warning("Error fetching calendar groups: %s", e)
+
+    # 3. Office 365 group calendars (if user is member) - Optional, may not work for personal accounts
+    existing_calendar_ids = {cal["id"] for cal in all_calendars}
+    try:
+        if isinstance(member_of_response, Exception):
+            raise member_of_response
+        response = member_of_response
+        if response.status_code == 200:
+            logger.debug("Found %d Office 365 groups", len(office_groups))
+            group_cal_responses = await office_groups_task
+            for group, group_cal_response in zip(office_groups, group_cal_responses):
+                if isinstance(group_cal_response, Exception):
+                    raise group_cal_response
+                if group_cal_response.status_code == 200:
+                    group_calendar = group_cal_response.json()
+                    # Only add if not already in existing calendars
+                    if group_calendar["id"] not in existing_calendar_ids:
+                        group_calendar["type"] = "group"
+                        group_calendar["groupName"] = group.get("displayName", "Unknown Group")
+                        all_calendars.append(group_calendar)
+                        logger.debug("Office 365 group calendar: %s - Group: %s", group_calendar.get("name"), group.get("displayName"))
+                    else:
+                        logger.debug("Skipping duplicate group calendar %r - already exists", group_calendar.get("name"))
+                else:
+                    logger.warning("Failed to get calendar for group %r: %s", group.get("displayName"), group_cal_response.status_code)
+        elif response.status_code == 404:
+            logger.info("Office 365 groups not available - likely a personal Microsoft account or insufficient permissions")
+        elif response.status_code == 403:
+            logger.info("Access denied to Office 365 groups - insufficient permissions")
+        else:
+            logger.warning("Failed to get group memberships: %s - %s", response.status_code, response.text)
+    except Exception as e:
+        logger.warning("Error fetching group calendars (non-critical): %s", e)
+
+    logger.info("Total calendars found: %d", len(all_calendars))
+    return all_calendars
@@ -0,0 +1,394 @@
+import time
+import asyncio
+import datetime
+import zoneinfo
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Iterable, Optional
+import httpx
+from fastapi import HTTPException
+from backend.settings import DEFAULTS, Settings, get_settings
+from backend.deadlines.engine import BusinessDayCalendar, calculate_deadlines, get_calendar
+from .events import parse_graph_datetime
+from .event_store import event_store
+from .trial_sync import build_trial_events, parse_date, TRIAL_CATEGORY
+
+# Events shown as free don't block a date (deadline reminders are created that way)...
+NON_BLOCKING_SHOW_AS = frozenset({"free"})
+# ...except trials, which earlier versions of this app also created as free
+BLOCKING_CATEGORIES = frozenset({TRIAL_CATEGORY})
+
+MINUTES_PER_DAY = 24 * 60
+# Subtrees this small are scanned linearly instead of descended
+_LEAF_LEVEL = 3
+
+
+class IntervalIndex:
+    """
+    Static overlap index over half-open integer intervals [start, end).
+
+    Intervals are kept in one array sorted by start, with an implicit
+    balanced binary tree laid over the array indexes (the layout cgranges
+    uses): the node at index i on level k has children i -/+ 2**(k-1), and
+    max_ends[i] is the largest end in its subtree. A query walks the tree in
+    order, skipping every left subtree whose max end is before the query and
+    stopping at the first start after it, so it costs O(log n + hits) with
+    no per-node objects.
+    """
+
+    def __init__(self, intervals: Iterable[tuple]):
+        """`intervals` yields (start, end, value) tuples."""
+        items = sorted(intervals, key=lambda item: (item[0], item[1]))
+        self.starts = [item[0] for item in items]
+        self.ends = [item[1] for item in items]
+        self.values = [item[2] for item in items]
+        self.max_ends = list(self.ends)
+        self.max_level = self._index()
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _index(self) -> int:
+        n = len(self.starts)
+        if n == 0:
+            return -1
+        ends, max_ends = self.ends, self.max_ends
+        # The rightmost leaf, and the max end of the incomplete subtree it sits in
+        last_i = (n - 1) & ~1
+        last = ends[last_i]
+        k = 1
+        while 1 << k <= n:
+            x = 1 << (k - 1)
+            for i in range((x << 1) - 1, n, x << 2):
+                right = max_ends[i + x] if i + x < n else last
+                max_ends[i] = max(ends[i], max_ends[i - x], right)
+            last_i = last_i - x if (last_i >> k) & 1 else last_i + x
+            if last_i < n and max_ends[last_i] > last:
+                last = max_ends[last_i]
+            k += 1
+        return k - 1
+
+    def overlapping(self, start: int, end: int) -> list:
+        """Values of the intervals overlapping [start, end), in start order."""
+        if not self.starts:
+            return []
+        n = len(self.starts)
+        starts, ends, max_ends, values = self.starts, self.ends, self.max_ends, self.values
+        hits = []
+        stack = [((1 << self.max_level) - 1, self.max_level, False)]
+        while stack:
+            x, k, left_done = stack.pop()
+            if k <= _LEAF_LEVEL:
+                i = x >> k << k
+                stop = min(i + (1 << (k + 1)) - 1, n)
+                while i < stop and starts[i] < end:
+                    if start < ends[i]:
+                        hits.append(values[i])
+                    i += 1
+            elif not left_done:
+                stack.append((x, k, True))
+                left = x - (1 << (k - 1))
+                # Past the end of the array the subtree's max isn't stored; descend anyway
+                if left >= n or max_ends[left] > start:
+                    stack.append((left, k - 1, False))
+            elif x < n and starts[x] < end:
+                if start < ends[x]:
+                    hits.append(values[x])
+                stack.append((x + (1 << (k - 1)), k - 1, False))
+        return hits
+
+
+def _time_zone(name: str) -> datetime.tzinfo:
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown time_zone {name!r}")
+
+
+def _day_minutes(day: datetime.date) -> int:
+    return day.toordinal() * MINUTES_PER_DAY
+
+
+def event_interval(event: dict, zone: datetime.tzinfo) -> tuple:
+    """
+    An event as [start, end) minutes on the local wall clock of `zone`.
+    Timed events come from the store in UTC; all-day events are floating
+    dates and keep their date whatever the zone.
+    """
+    bounds = []
+    for field in ("start", "end"):
+        value = parse_graph_datetime(event[field]["dateTime"])
+        if not event.get("isAllDay"):
+            value = value.replace(tzinfo=datetime.timezone.utc).astimezone(zone)
+        bounds.append(value.toordinal() * MINUTES_PER_DAY + value.hour * 60 + value.minute)
+    start, end = bounds
+    # A zero-length event still occupies its minute
+    return start, max(end, start + 1)
+
+
+def blocks_time(event: dict) -> bool:
+    """Anything not shown as free, and any trial."""
+    return event.get("showAs") not in NON_BLOCKING_SHOW_AS or not BLOCKING_CATEGORIES.isdisjoint(event.get("categories") or ())
+
+
+def build_index(events: list, zone: datetime.tzinfo) -> IntervalIndex:
+    """Index the events that block time."""
+    return IntervalIndex(
+        (*event_interval(event, zone), event) for event in events
+        if event.get("start") and event.get("end") and blocks_time(event)
+    )
+
+
+class IndexCache:
+    """
+    Interval indexes of the event store's calendars, so checking a trial
+    again (or another trial on the same calendars) skips the rebuild. An
+    index covers the calendar's whole synced window and is rebuilt once the
+    store's copy changes (its version moves or the state is replaced).
+    """
+
+    def __init__(self, max_entries: int = DEFAULTS.scheduling_index_cache):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.builds = 0
+
+    def configure(self, settings: Settings) -> None:
+        """Apply the cache size; called by the app lifespan."""
+        self.max_entries = settings.scheduling_index_cache
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, user_id: str, calendar_id: str, zone: datetime.tzinfo, events: list) -> IntervalIndex:
+        """The calendar's index; `events` (just read from the store) are used if the store no longer has it."""
+        state = event_store.cached_state(user_id, calendar_id)
+        key = (user_id, calendar_id, str(zone))
+        entry = self._entries.get(key)
+        if state is not None and entry is not None and entry[0] is state and entry[1] == state.version:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[2]
+        self.builds += 1
+        if state is None:
+            return build_index(events, zone)
+        index = build_index(list(state.events.values()), zone)
+        self._entries[key] = (state, state.version, index)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return index
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "builds": self.builds}
+
+
+index_cache = IndexCache()
+
+
+def conflict_summary(event: dict, calendar_id: str) -> dict:
+    return {
+        "id": event.get("id"),
+        "calendarId": calendar_id,
+        "subject": event.get("subject"),
+        "start": event["start"]["dateTime"],
+        "end": event["end"]["dateTime"],
+        "isAllDay": bool(event.get("isAllDay")),
+        "showAs": event.get("showAs"),
+    }
+
+
+def item_span(item: dict) -> tuple:
+    """(first day, exclusive last day) of one build_trial_events item."""
+    event = item["event"]
+    return parse_date(event["start"]["dateTime"], "start"), parse_date(event["end"]["dateTime"], "end")
+
+
+class ScheduleCheck:
+    """
+    Answers "is anything booked in these calendars on these days" for one
+    trial submission against per-calendar IntervalIndexes built from the
+    event store. Counts queries and the time spent in them.
+    """
+
+    def __init__(self, indexes: dict, business_days: BusinessDayCalendar, search_days: int = DEFAULTS.scheduling_search_days):
+        self.indexes = indexes
+        self.business_days = business_days
+        self.search_days = search_days
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def conflicts(self, calendar_id: str, start: datetime.date, end: datetime.date) -> list:
+        """Blocking events in one calendar overlapping the all-day span [start, end)."""
+        index = self.indexes.get(calendar_id)
+        if index is None:
+            return []
+        started = time.perf_counter()
+        events = index.overlapping(_day_minutes(start), _day_minutes(end))
+        self.query_seconds += time.perf_counter() - started
+        self.queries += 1
+        return events
+
+    def check_items(self, items: list) -> list:
+        """One entry per trial or deadline event that would land on a busy day."""
+        found = []
+        for item in items:
+            start, end = item_span(item)
+            events = self.conflicts(item["calendar_id"], start, end)
+            if events:
+                found.append({
+                    "key": item["key"],
+                    "calendar_id": item["calendar_id"],
+                    "subject": item["subject"],
+                    "start": start.isoformat(),
+                    "end": end.isoformat(),
+                    "events": [conflict_summary(event, item["calendar_id"]) for event in events],
+                })
+        return found
+
+    def nearby_business_days(self, day: datetime.date, forward: bool = True, backward: bool = True) -> Iterable[datetime.date]:
+        """Business days around `day` (excluded), nearest first, within search_days."""
+        days = self.business_days.business_days
+        n = day.toordinal()
+        after = bisect_left(days, n + 1)
+        before = bisect_left(days, n) - 1
+        while True:
+            next_after = days[after] if forward and after < len(days) and days[after] - n <= self.search_days else None
+            next_before = days[before] if backward and before >= 0 and n - days[before] <= self.search_days else None
+            if next_after is None and next_before is None:
+                return
+            if next_before is None or (next_after is not None and next_after - n <= n - next_before):
+                yield datetime.date.fromordinal(next_after)
+                after += 1
+            else:
+                yield datetime.date.fromordinal(next_before)
+                before -= 1
+
+    def free_deadline_day(self, item: dict) -> Optional[datetime.date]:
+        """The nearest earlier business day with nothing booked; a deadline never moves later."""
+        start, _ = item_span(item)
+        for day in self.nearby_business_days(start, forward=False):
+            if not self.conflicts(item["calendar_id"], day, day + datetime.timedelta(days=1)):
+                return day
+        return None
+
+
+def trial_span(data: dict) -> tuple:
+    """(first day, exclusive last day) of the trial in a submission."""
+    trial_items = [item for item in build_trial_events(data) if item["key"].startswith("trial:")]
+    event = trial_items[0]["event"]
+    return parse_date(event["start"]["dateTime"], "trial_date"), parse_date(event["end"]["dateTime"], "trial_date")
+
+
+def shifted_submission(data: dict, trial_start: datetime.date, jurisdiction: Optional[str]) -> dict:
+    """
+    The submission with the trial moved to start on `trial_start` (same
+    length) and every deadline counted from the trial date recomputed with
+    the deadline engine. Deadlines from custom reference dates stay put.
+    """
+    trial = dict(data.get("trial") or {})
+    start, end = trial_span(data)
+    if trial.get("trial_duration") == "custom":
+        trial["custom_start_date"] = trial_start.isoformat()
+        trial["custom_end_date"] = (trial_start + (end - start) - datetime.timedelta(days=1)).isoformat()
+    trial["trial_date"] = trial_start.isoformat()
+
+    deadlines = [dict(deadline) for deadline in data.get("deadlines") or []]
+    moved = [deadline for deadline in deadlines if deadline.get("reference_type") == "trial_date"]
+    if moved:
+        calculated = calculate_deadlines([{"trial_date": trial["trial_date"], "deadlines": moved}], jurisdiction)[0]["deadlines"]
+        for deadline, result in zip(moved, calculated):
+            deadline["calculated_date"] = result["calculated_date"]
+    return {**data, "trial": trial, "deadlines": deadlines}
+
+
+async def load_indexes(client: httpx.AsyncClient, headers: dict, user_id: str, calendar_ids: list,
+                       start: datetime.date, end: datetime.date, zone: datetime.tzinfo) -> tuple:
+    """
+    Bring [start, end) of each calendar up to date in the event store
+    (delta-synced, so usually without a full Graph read) and index it.
+    Returns ({calendar_id: IntervalIndex}, [error]).
+    """
+    # The store works in UTC; a day ahead and behind covers any zone offset
+    range_start = datetime.datetime.combine(start - datetime.timedelta(days=1), datetime.time())
+    range_end = datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time())
+    semaphore = asyncio.Semaphore(max(1, get_settings().agenda_concurrency))
+
+    async def load(calendar_id: str) -> list:
+        async with semaphore:
+            return await event_store.events_in_range(client, headers, user_id, calendar_id, range_start, range_end)
+
+    results = await asyncio.gather(*[load(calendar_id) for calendar_id in calendar_ids], return_exceptions=True)
+    indexes, errors = {}, []
+    for calendar_id, result in zip(calendar_ids, results):
+        if isinstance(result, HTTPException):
+            errors.append({"calendarId": calendar_id, "status": result.status_code, "detail": str(result.detail)})
+        elif isinstance(result, BaseException):
+            errors.append({"calendarId": calendar_id, "status": 502, "detail": str(result)})
+        else:
+            indexes[calendar_id] = index_cache.get(user_id, calendar_id, zone, result)
+    return indexes, errors
+
+
+async def check_schedule(client: httpx.AsyncClient, headers: dict, user_id: str, data: dict, jurisdiction: Optional[str] = None) -> dict:
+    """
+    Check a trial submission (the sync-trial payload) against what is
+    already booked in its target and reminder calendars.
+
+    Every event the submission would create is looked up in its calendar's
+    interval index. If the trial conflicts, the nearest business days the
+    whole trial would fit are suggested, each with the deadline conflicts it
+    would bring once its deadlines are recomputed; each conflicting deadline
+    gets the nearest earlier free business day.
+    """
+    settings = get_settings()
+    business_days = get_calendar(jurisdiction)
+    zone = _time_zone(data.get("time_zone") or "UTC")
+    items = build_trial_events(data)
+    trial_start, trial_end = trial_span(data)
+
+    spans = [item_span(item) for item in items]
+    search = datetime.timedelta(days=settings.scheduling_search_days)
+    # Shifting the trial later moves its deadlines later too, so cover them past the trial's search window
+    range_start = min(start for start, _ in spans) - search * 2
+    range_end = max(end for _, end in spans) + search
+    calendar_ids = list(dict.fromkeys(item["calendar_id"] for item in items))
+
+    started = time.perf_counter()
+    indexes, errors = await load_indexes(client, headers, user_id, calendar_ids, range_start, range_end, zone)
+    load_seconds = time.perf_counter() - started
+
+    check = ScheduleCheck(indexes, business_days, settings.scheduling_search_days)
+    conflicts = check.check_items(items)
+
+    trial_suggestions = []
+    if any(conflict["key"].startswith("trial:") for conflict in conflicts):
+        trial_calendars = [item["calendar_id"] for item in items if item["key"].startswith("trial:")]
+        length = trial_end - trial_start
+        today = datetime.date.today()
+        for day in check.nearby_business_days(trial_start):
+            if day < today or any(check.conflicts(calendar_id, day, day + length) for calendar_id in trial_calendars):
+                continue
+            shifted = build_trial_events(shifted_submission(data, day, jurisdiction))
+            deadline_conflicts = check.check_items([item for item in shifted if not item["key"].startswith("trial:")])
+            trial_suggestions.append({"trial_date": day.isoformat(), "deadline_conflicts": len(deadline_conflicts)})
+            if len(trial_suggestions) >= settings.scheduling_suggestions:
+                break
+
+    deadline_suggestions = {}
+    for conflict in conflicts:
+        if conflict["key"].startswith("deadline:"):
+            item = next(item for item in items if item["key"] == conflict["key"])
+            day = check.free_deadline_day(item)
+            deadline_suggestions[conflict["key"]] = day.isoformat() if day else None
+
+    return {
+        "checked": len(items),
+        "conflicts": conflicts,
+        "suggestions": {"trial_dates": trial_suggestions, "deadlines": deadline_suggestions},
+        "errors": errors,
+        "timing": {
+            "load_ms": round(load_seconds * 1000, 2),
+            "queries": check.queries,
+            "query_us": round(check.query_seconds / max(1, check.queries) * 1e6, 2),
+        },
+    }
@@ -0,0 +1,61 @@
+import httpx
+from fastapi import HTTPException
+from backend.jobs.workers import JobError
+from .graph_client import graph_url
+from .scheduler import parse_retry_after, MAILBOX_HEADER
+from .token_cache import token_cache
+from .events import calendar_events_path
+from .trial_sync import transaction_id
+
+CREATE_EVENT_JOB = "msgraph.create_event"
+
+
+def event_url(calendar_id: str = None) -> str:
+    return f"{graph_url()}{calendar_events_path(calendar_id)}"
+
+
+def create_event_handler(get_client):
+    """
+    Job handler for queued create-event requests. `get_client` returns the
+    shared Graph client (read from app state on every run, so it is always
+    the current one).
+
+    The event carries a transactionId derived from the job id, so a retry
+    after a POST whose response was lost does not create a second event.
+    """
+
+    async def run(job: dict) -> dict:
+        client: httpx.AsyncClient = get_client()
+        payload = job["payload"]
+        try:
+            access_token = await token_cache.get_access_token(client, job["user_id"])
+        except HTTPException as e:
+            # Not connected / refresh token revoked: retrying won't help until the user reconnects
+            raise JobError(f"Microsoft token unavailable: {e.detail}", retryable=e.status_code >= 500)
+
+        event = {"transactionId": transaction_id(job["user_id"], job["id"], "create-event"), **payload["event"]}
+        try:
+            response = await client.post(
+                event_url(payload.get("calendar_id")),
+                headers={
+                    "Authorization": f"Bearer {access_token}",
+                    MAILBOX_HEADER: job["user_id"],
+                    "Content-Type": "application/json"
+                },
+                json=event
+            )
+        except httpx.HTTPError as e:
+            raise JobError(f"Graph request failed: {e!r}")
+
+        if response.status_code >= 400:
+            # Throttling was already retried by the scheduler; 429/5xx are worth another go later
+            retryable = response.status_code == 429 or response.status_code >= 500
+            raise JobError(
+                f"Graph returned {response.status_code}",
+                retryable=retryable,
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+                result={"error": response.text, "status": response.status_code},
+            )
+        return response.json()
+
+    return run
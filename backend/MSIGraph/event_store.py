@@ -0,0 +1,196 @@
+import time
+import asyncio
+import logging
+import datetime
+from collections import OrderedDict
+from typing import Optional
+import httpx
+from fastapi import HTTPException
+from backend.settings import Settings, DEFAULTS
+from .graph_client import graph_url
+from .events import EVENT_FIELDS, EVENT_PAGE_SIZE, enrich_event, parse_graph_datetime, check_event_range
+
+logger = logging.getLogger(__name__)
+
+# Worker bus kind: Graph reported a change in a calendar ({"calendarId"}); every process marks its copy stale
+CALENDAR_CHANGED = "calendar_changed"
+
+
+class DeltaTokenExpired(Exception):
+    """Graph answered 410 Gone: the delta token is no longer valid and a full sync is needed."""
+
+
+def graph_iso(value: datetime.datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S") + "Z"
+
+
+class CalendarSyncState:
+    def __init__(self):
+        self.window_start: Optional[datetime.datetime] = None
+        self.window_end: Optional[datetime.datetime] = None
+        self.delta_link: Optional[str] = None
+        # id -> enriched event, and id -> (start, end) as naive UTC datetimes
+        self.events: dict = {}
+        self.bounds: dict = {}
+        self.synced_at = 0.0
+        # Bumped on every change to events, so anything derived from them can tell it is stale
+        self.version = 0
+        self.full_syncs = 0
+        self.delta_syncs = 0
+        self.lock = asyncio.Lock()
+
+    def covers(self, start: datetime.datetime, end: datetime.datetime) -> bool:
+        return self.delta_link is not None and self.window_start <= start and end <= self.window_end
+
+    def apply(self, item: dict) -> None:
+        """Apply one calendarView/delta item: an upsert, or a removal marked with @removed."""
+        event_id = item["id"]
+        self.version += 1
+        if "@removed" in item:
+            self.events.pop(event_id, None)
+            self.bounds.pop(event_id, None)
+            return
+        event = {**self.events.get(event_id, {}), **{k: item[k] for k in EVENT_FIELDS if k in item}}
+        for derived in ("formattedStartDate", "formattedStartTime", "formattedEndTime"):
+            event.pop(derived, None)
+        self.events[event_id] = enrich_event(event)
+        start = parse_graph_datetime(event["start"]["dateTime"]) if event.get("start") else datetime.datetime.min
+        end = parse_graph_datetime(event["end"]["dateTime"]) if event.get("end") else start
+        self.bounds[event_id] = (start, end)
+
+    def query(self, start: datetime.datetime, end: datetime.datetime) -> list:
+        """Events overlapping [start, end), ordered by start time."""
+        matches = [
+            (bounds[0], event_id) for event_id, bounds in self.bounds.items()
+            if bounds[0] < end and (bounds[1] > start or bounds[0] >= start)
+        ]
+        matches.sort()
+        return [self.events[event_id] for _, event_id in matches]
+
+
+class EventStore:
+    """
+    Local copy of users' calendar events kept current with Graph
+    calendarView/delta.
+
+    The first request for a calendar does a full delta sync over a window that
+    covers the requested range, paging through every result, and keeps the
+    returned deltaLink. Later requests replay only the changes since that link.
+    Any range inside the synced window is served from memory. A range outside
+    it triggers a new full sync over a window that also keeps the old one if
+    both fit in max_days, or else covers just the new range (and
+    the default days around today). Ranges further than event_range_max_days
+    from today are refused with a 400.
+    """
+
+    def __init__(self, max_calendars: int = DEFAULTS.event_store_max_calendars, min_interval: float = DEFAULTS.event_sync_min_interval,
+                 days_before: int = DEFAULTS.event_sync_days_before, days_after: int = DEFAULTS.event_sync_days_after,
+                 max_days: int = DEFAULTS.event_sync_max_days):
+        self.max_calendars = max_calendars
+        self.min_interval = min_interval
+        self.days_before = days_before
+        self.days_after = days_after
+        self.max_days = max_days
+        self._states: OrderedDict = OrderedDict()
+
+    def configure(self, settings: Settings) -> None:
+        """Apply the event_store_* / event_sync_* settings; called by the app lifespan."""
+        self.max_calendars = settings.event_store_max_calendars
+        self.min_interval = settings.event_sync_min_interval
+        self.days_before = settings.event_sync_days_before
+        self.days_after = settings.event_sync_days_after
+        self.max_days = settings.event_sync_max_days
+
+    def _state(self, user_id: str, calendar_id: str) -> CalendarSyncState:
+        key = (user_id, calendar_id)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = CalendarSyncState()
+            while len(self._states) > self.max_calendars:
+                self._states.popitem(last=False)
+        self._states.move_to_end(key)
+        return state
+
+    def invalidate(self, user_id: str, calendar_id: Optional[str] = None) -> None:
+        """Forget a user's synced calendars (all of them, or one)."""
+        for key in [k for k in self._states if k[0] == user_id and (calendar_id is None or k[1] == calendar_id)]:
+            del self._states[key]
+
+    def mark_stale(self, user_id: str, calendar_id: Optional[str] = None) -> None:
+        """Make the next read replay the delta link instead of waiting out min_interval."""
+        for key, state in self._states.items():
+            if key[0] == user_id and (calendar_id is None or key[1] == calendar_id):
+                state.synced_at = 0.0
+
+    async def _follow(self, client: httpx.AsyncClient, url: str, headers: dict, params: Optional[dict], state: CalendarSyncState) -> str:
+        """Page through a delta round, applying every item; returns the new deltaLink."""
+        headers = {**headers, "Prefer": f'odata.maxpagesize={EVENT_PAGE_SIZE}, outlook.timezone="UTC"'}
+        while True:
+            response = await client.get(url, headers=headers, params=params)
+            if response.status_code == 410:
+                raise DeltaTokenExpired()
+            if response.status_code != 200:
+                logger.warning("Failed to sync calendar events: %s - %s", response.status_code, response.text)
+                raise HTTPException(status_code=response.status_code, detail=f"Failed to fetch events: {response.text}")
+            page = response.json()
+            for item in page.get("value", []):
+                state.apply(item)
+            if "@odata.nextLink" in page:
+                url, params = page["@odata.nextLink"], None
+            else:
+                return page["@odata.deltaLink"]
+
+    async def _full_sync(self, client: httpx.AsyncClient, headers: dict, calendar_id: str, state: CalendarSyncState, start: datetime.datetime, end: datetime.datetime) -> None:
+        now = datetime.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        window_start = min(start, now - datetime.timedelta(days=self.days_before))
+        window_end = max(end, now + datetime.timedelta(days=self.days_after))
+        if state.window_start is not None:
+            merged_start, merged_end = min(window_start, state.window_start), max(window_end, state.window_end)
+            if merged_end - merged_start <= datetime.timedelta(days=self.max_days):
+                window_start, window_end = merged_start, merged_end
+
+        fresh = CalendarSyncState()
+        url = f"{graph_url()}/me/calendars/{calendar_id}/calendarView/delta"
+        params = {"startDateTime": graph_iso(window_start), "endDateTime": graph_iso(window_end)}
+        delta_link = await self._follow(client, url, headers, params, fresh)
+
+        state.events, state.bounds = fresh.events, fresh.bounds
+        state.version += 1
+        state.window_start, state.window_end = window_start, window_end
+        state.delta_link = delta_link
+        state.full_syncs += 1
+
+    async def events_in_range(self, client: httpx.AsyncClient, headers: dict, user_id: str, calendar_id: str,
+                              start: datetime.datetime, end: datetime.datetime, force_sync: bool = False) -> list:
+        check_event_range(start, end)
+        state = self._state(user_id, calendar_id)
+        async with state.lock:
+            if not state.covers(start, end):
+                await self._full_sync(client, headers, calendar_id, state, start, end)
+            elif force_sync or time.monotonic() - state.synced_at >= self.min_interval:
+                try:
+                    state.delta_link = await self._follow(client, state.delta_link, headers, None, state)
+                    state.delta_syncs += 1
+                except DeltaTokenExpired:
+                    logger.info("Delta token expired for calendar %s, running a full sync", calendar_id)
+                    state.delta_link = None
+                    await self._full_sync(client, headers, calendar_id, state, start, end)
+            state.synced_at = time.monotonic()
+            return state.query(start, end)
+
+    def cached_state(self, user_id: str, calendar_id: str) -> Optional[CalendarSyncState]:
+        """The synced state of a calendar, if it is in memory; doesn't sync or count as a use."""
+        return self._states.get((user_id, calendar_id))
+
+    def stats(self) -> dict:
+        states = list(self._states.values())
+        return {
+            "calendars": len(states),
+            "max_calendars": self.max_calendars,
+            "events": sum(len(s.events) for s in states),
+            "full_syncs": sum(s.full_syncs for s in states),
+            "delta_syncs": sum(s.delta_syncs for s in states),
+        }
+
+
+event_store = EventStore()
@@ -0,0 +1,175 @@
+import logging
+import datetime
+import functools
+from typing import Iterable, Optional, Union
+import httpx
+from fastapi import HTTPException
+from backend.settings import get_settings
+from .models import EventPayload
+
+logger = logging.getLogger(__name__)
+
+EVENT_FIELDS = ["id", "subject", "start", "end", "location", "organizer", "isAllDay", "bodyPreview", "webLink", "categories", "showAs"]
+EVENT_SELECT = ",".join(EVENT_FIELDS)
+# Graph caps pages at 1000 items; larger pages mean fewer round-trips
+EVENT_PAGE_SIZE = 100
+# Range served when a request names none: the upcoming 30 days
+EVENT_RANGE_DEFAULT_DAYS = 30
+# calendar_id clients send for the user's default calendar
+DEFAULT_CALENDAR_ID = "default"
+# Fields computed by enrich_event, and the Graph fields each one is computed from
+DERIVED_FIELDS = {
+    "formattedStartDate": ("start",),
+    "formattedStartTime": ("start", "isAllDay"),
+    "formattedEndTime": ("end", "isAllDay"),
+}
+# Every field a client can ask for in "fields"
+RESPONSE_FIELDS = tuple(EVENT_FIELDS) + tuple(DERIVED_FIELDS)
+
+
+def calendar_events_path(calendar_id: Optional[str]) -> str:
+    """Graph path (below /v1.0) to create events in a calendar; no id or "default" is the user's default calendar."""
+    if not calendar_id or calendar_id == DEFAULT_CALENDAR_ID:
+        return "/me/events"
+    return f"/me/calendars/{calendar_id}/events"
+
+
+def parse_graph_datetime(value: str) -> datetime.datetime:
+    """Graph dateTimeTimeZone values are naive UTC strings like 2026-01-05T09:00:00.0000000."""
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_range_bound(value: Optional[str], default: datetime.datetime) -> datetime.datetime:
+    """Parse a start/end request parameter (date or datetime) as naive UTC."""
+    if not value:
+        return default
+    try:
+        return parse_graph_datetime(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value!r}")
+
+
+def check_event_range(start: datetime.datetime, end: datetime.datetime) -> None:
+    """Raise HTTPException(400) unless end is after start and both are within event_range_max_days of now."""
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    now = datetime.datetime.utcnow()
+    max_days = get_settings().event_range_max_days
+    limit = datetime.timedelta(days=max_days)
+    if start < now - limit or end > now + limit:
+        raise HTTPException(status_code=400, detail=f"start and end must be within {max_days} days of today")
+
+
+def parse_event_range(data: dict) -> tuple:
+    """(start, end) of a request's "start"/"end" as naive UTC, checked by check_event_range."""
+    now = datetime.datetime.utcnow()
+    start = parse_range_bound(data.get("start"), now)
+    end = parse_range_bound(data.get("end"), now + datetime.timedelta(days=EVENT_RANGE_DEFAULT_DAYS))
+    check_event_range(start, end)
+    return start, end
+
+
+@functools.lru_cache(maxsize=4096)
+def _date_label(day: str) -> str:
+    return datetime.date.fromisoformat(day).strftime("%B %d, %Y")
+
+
+@functools.lru_cache(maxsize=1440)
+def _time_label(hour_minute: str) -> str:
+    return datetime.time.fromisoformat(hour_minute).strftime("%I:%M %p")
+
+
+def _day_and_minute(value: str) -> tuple:
+    """("2026-01-05", "09:00") for a Graph dateTime, in UTC."""
+    offset = value[19:]
+    if len(value) >= 16 and value[10] == "T" and not ("Z" in offset or "+" in offset or "-" in offset):
+        # Already naive UTC, which is how Graph sends them: no need to parse
+        return value[:10], value[11:16]
+    parsed = parse_graph_datetime(value)
+    return parsed.date().isoformat(), parsed.strftime("%H:%M")
+
+
+def enrich_event(event: dict) -> dict:
+    """
+    Add the formattedStartDate/formattedStartTime/formattedEndTime strings the
+    dashboard shows. The labels are cached per day and per minute, so a long
+    agenda formats each date and time of day once.
+    """
+    all_day = event.get("isAllDay")
+    if event.get("start"):
+        day, minute = _day_and_minute(event["start"]["dateTime"])
+        event["formattedStartDate"] = _date_label(day)
+        event["formattedStartTime"] = _time_label(minute) if not all_day else "All day"
+
+    if event.get("end"):
+        _, minute = _day_and_minute(event["end"]["dateTime"])
+        event["formattedEndTime"] = _time_label(minute) if not all_day else "All day"
+    return event
+
+
+def select_fields(requested: Union[str, Iterable[str], None]) -> tuple:
+    """
+    The response fields and the Graph $select for a client's "fields" (a list
+    or comma-separated string; every field when empty). id is always included.
+    Raises ValueError for an unknown field.
+    """
+    if not requested:
+        return RESPONSE_FIELDS, EVENT_SELECT
+    if isinstance(requested, str):
+        requested = requested.split(",")
+    fields = ["id"]
+    for field in requested:
+        field = str(field).strip()
+        if field not in RESPONSE_FIELDS:
+            raise ValueError(f"Unknown event field: {field!r}")
+        if field not in fields:
+            fields.append(field)
+    graph_fields = set()
+    for field in fields:
+        graph_fields.update(DERIVED_FIELDS.get(field, (field,)))
+    return tuple(fields), ",".join(f for f in EVENT_FIELDS if f in graph_fields)
+
+
+def compact_event(event: dict, fields: Iterable[str] = RESPONSE_FIELDS) -> EventPayload:
+    """
+    The response payload for a Graph event: only `fields`, without empty
+    values, @odata annotations or the location and organizer details the
+    dashboard doesn't show. Builds a new dict; `event` is not changed.
+    """
+    compact = {}
+    for field in fields:
+        value = event.get(field)
+        if value is None or value == "" or value == []:
+            continue
+        if field == "start" or field == "end":
+            value = {key: value[key] for key in ("dateTime", "timeZone") if value.get(key)}
+        elif field == "location":
+            if not value.get("displayName"):
+                continue
+            value = {"displayName": value["displayName"]}
+        elif field == "organizer":
+            address = value.get("emailAddress") or {}
+            value = {"emailAddress": {key: address[key] for key in ("name", "address") if address.get(key)}}
+        compact[field] = value
+    return compact
+
+
+async def get_all_pages(client: httpx.AsyncClient, url: str, headers: dict, params: Optional[dict] = None) -> list:
+    """
+    GET a Graph collection and follow @odata.nextLink until the last page.
+    Raises HTTPException with Graph's status if any page fails.
+    """
+    items = []
+    while url:
+        response = await client.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            logger.warning("Failed to get %s: %s - %s", url, response.status_code, response.text)
+            raise HTTPException(status_code=response.status_code, detail=f"Failed to fetch events: {response.text}")
+        page = response.json()
+        items.extend(page.get("value", []))
+        # nextLink already carries every query parameter
+        url, params = page.get("@odata.nextLink"), None
+    return items
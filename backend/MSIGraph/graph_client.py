@@ -0,0 +1,91 @@
+from typing import Optional
+import httpx
+from fastapi import Request
+from backend.settings import Settings, get_settings
+from .scheduler import ThrottlingTransport, graph_scheduler
+
+
+def graph_url() -> str:
+    """Graph's base URL (MS_GRAPH_URL); point it at a local stand-in to run without Microsoft."""
+    return get_settings().graph_url.rstrip("/")
+
+
+def login_url() -> str:
+    return get_settings().login_url.rstrip("/")
+
+
+def token_url() -> str:
+    return f"{login_url()}/common/oauth2/v2.0/token"
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package; fall back to HTTP/1.1 without it."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_graph_client(transport: httpx.AsyncBaseTransport = None, settings: Optional[Settings] = None) -> httpx.AsyncClient:
+    """
+    Create the long-lived, connection-pooled client used for every outbound
+    Microsoft call. Created and closed by the app lifespan in backend/main.py;
+    pool and timeouts come from `settings` (get_settings() if not given).
+    Requests to Graph go through the throttling scheduler; pass `transport`
+    to put a stand-in (e.g. an ASGI app) underneath it.
+    """
+    settings = settings or get_settings()
+    if transport is None:
+        limits = httpx.Limits(
+            max_connections=settings.graph_max_connections,
+            max_keepalive_connections=settings.graph_max_keepalive_connections,
+            keepalive_expiry=settings.graph_keepalive_expiry,
+        )
+        transport = httpx.AsyncHTTPTransport(
+            http2=settings.graph_http2 and http2_available(),
+            limits=limits,
+        )
+    timeout = httpx.Timeout(
+        connect=settings.graph_connect_timeout,
+        read=settings.graph_read_timeout,
+        write=settings.graph_write_timeout,
+        pool=settings.graph_pool_timeout,
+    )
+    return httpx.AsyncClient(
+        transport=ThrottlingTransport(transport, graph_scheduler, settings.graph_url.rstrip("/")),
+        timeout=timeout,
+    )
+
+
+def get_graph_client(request: Request) -> httpx.AsyncClient:
+    """FastAPI dependency returning the shared client from app state."""
+    return request.app.state.graph_client
+
+
+def pool_stats(client: httpx.AsyncClient) -> dict:
+    """
+    Snapshot of the client's connection pool: how many connections are open,
+    idle or busy, and how many of them negotiated HTTP/2.
+    """
+    transport = getattr(client._transport, "transport", client._transport)
+    pool = getattr(transport, "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    stats = {
+        "http2_enabled": bool(getattr(pool, "_http2", False)),
+        "max_connections": getattr(pool, "_max_connections", None),
+        "max_keepalive_connections": getattr(pool, "_max_keepalive_connections", None),
+        "keepalive_expiry": getattr(pool, "_keepalive_expiry", None),
+        "connections": len(connections),
+        "idle": 0,
+        "active": 0,
+        "http2_connections": 0,
+    }
+    for connection in connections:
+        if connection.is_idle():
+            stats["idle"] += 1
+        elif not connection.is_closed():
+            stats["active"] += 1
+        if "HTTP/2" in connection.info():
+            stats["http2_connections"] += 1
+    return stats
@@ -0,0 +1,71 @@
+from typing import List
+# pydantic (for the OpenAPI schema) needs typing_extensions' TypedDict before Python 3.12
+from typing_extensions import TypedDict
+
+# Shapes of the event and calendar payloads the API returns. They are
+# TypedDicts, not pydantic models: responses are built as plain dicts and
+# serialized directly (see backend/responses.py), so no per-event validation
+# runs, while the route's response_model still documents them in OpenAPI.
+# Every key is optional: empty values are left out, and a client can ask for
+# a subset of event fields.
+
+
+class EventTime(TypedDict, total=False):
+    dateTime: str
+    timeZone: str
+
+
+class EventLocation(TypedDict, total=False):
+    displayName: str
+
+
+class EmailAddress(TypedDict, total=False):
+    name: str
+    address: str
+
+
+class EventOrganizer(TypedDict, total=False):
+    emailAddress: EmailAddress
+
+
+class EventPayload(TypedDict, total=False):
+    id: str
+    subject: str
+    start: EventTime
+    end: EventTime
+    location: EventLocation
+    organizer: EventOrganizer
+    isAllDay: bool
+    bodyPreview: str
+    webLink: str
+    categories: List[str]
+    showAs: str
+    formattedStartDate: str
+    formattedStartTime: str
+    formattedEndTime: str
+
+
+class EventsResponse(TypedDict):
+    events: List[EventPayload]
+    total: int
+
+
+class CalendarOwner(TypedDict, total=False):
+    name: str
+    address: str
+
+
+class CalendarPayload(TypedDict, total=False):
+    id: str
+    name: str
+    type: str
+    groupName: str
+    owner: CalendarOwner
+    isDefaultCalendar: bool
+    canEdit: bool
+    canShare: bool
+    canViewPrivateItems: bool
+
+
+class CalendarsResponse(TypedDict):
+    calendars: List[CalendarPayload]
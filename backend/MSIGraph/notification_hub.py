@@ -0,0 +1,113 @@
+import time
+import asyncio
+import contextlib
+from typing import AsyncIterator, Optional
+from .agenda import format_sse
+from backend.metrics import Gauge, registry
+from backend.settings import DEFAULTS, Settings
+from backend.worker_bus import worker_bus
+
+# Worker bus kind of a message published in another worker process, for the streams open in this one
+STREAM_MESSAGE = "stream_message"
+
+
+class NotificationHub:
+    """
+    Fan-out of live messages to each user's open dashboard streams.
+
+    Every stream has its own bounded queue. publish() never waits: when a
+    stream's queue is full its backlog is replaced by a single resync
+    message, which tells the client to refetch instead of replaying changes.
+    A user's streams may be open in other worker processes, so publish()
+    also sends the message over the worker bus; deliver() is what the
+    receiving processes run.
+    """
+
+    def __init__(self, buffer: int = DEFAULTS.notification_stream_buffer):
+        self.buffer = max(2, buffer)
+        self.keepalive = DEFAULTS.notification_keepalive
+        self._streams: dict = {}
+        self.published = 0
+        self.overflows = 0
+
+    def configure(self, settings: Settings) -> None:
+        """Apply the stream settings (streams opened afterwards use them); called by the app lifespan."""
+        self.buffer = max(2, settings.notification_stream_buffer)
+        self.keepalive = settings.notification_keepalive
+
+    def listeners(self, user_id: str) -> int:
+        """Streams of user_id open in this process."""
+        return len(self._streams.get(user_id, ()))
+
+    def users(self) -> list:
+        """Users with a stream open in this process."""
+        return list(self._streams)
+
+    def publish(self, user_id: str, message: dict) -> int:
+        """Queue a message for every open stream of user_id, in every worker process. Returns how many streams here got it."""
+        worker_bus.send(STREAM_MESSAGE, user_id, message)
+        return self.deliver(user_id, message)
+
+    def deliver(self, user_id: str, message: dict) -> int:
+        """Queue a message for the streams of user_id open in this process."""
+        streams = self._streams.get(user_id, ())
+        for queue in streams:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.overflows += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+        self.published += len(streams)
+        return len(streams)
+
+    @contextlib.contextmanager
+    def listen(self, user_id: str):
+        queue = asyncio.Queue(self.buffer)
+        self._streams.setdefault(user_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            streams = self._streams.get(user_id)
+            streams.discard(queue)
+            if not streams:
+                del self._streams[user_id]
+
+    async def stream(self, user_id: str, first: list, until: Optional[float] = None,
+                     keepalive: Optional[float] = None) -> AsyncIterator[bytes]:
+        """
+        Server-sent events for one connection: the `first` messages, then
+        everything published for the user. Ends at `until` (a time.time()
+        value, the JWT's exp) so a stream never outlives its token; the
+        client reconnects with a fresh one.
+        """
+        with self.listen(user_id) as queue:
+            for message in first:
+                yield format_sse(message)
+            while True:
+                timeout = self.keepalive if keepalive is None else keepalive
+                if until is not None:
+                    remaining = until - time.time()
+                    if remaining <= 0:
+                        return
+                    timeout = min(timeout, remaining)
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield format_sse(message)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._streams),
+            "streams": sum(len(s) for s in self._streams.values()),
+            "published": self.published,
+            "overflows": self.overflows,
+        }
+
+
+notification_hub = NotificationHub()
+
+registry.register(Gauge("notification_streams", "Open live-update streams.", lambda: notification_hub.stats()["streams"]))
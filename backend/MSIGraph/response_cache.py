@@ -0,0 +1,128 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from backend.settings import DEFAULTS
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("value", "stored_at")
+
+    def __init__(self, value: Any):
+        self.value = value
+        self.stored_at = time.monotonic()
+
+
+class SWRCache:
+    """
+    Bounded LRU response cache with stale-while-revalidate.
+
+    Within `ttl` an entry is served as is. Between `ttl` and `ttl + stale_ttl`
+    it is still served, but a background refresh is started so the next caller
+    gets fresh data. Older entries, misses and force_refresh load inline. Loads
+    are single-flight per key. At most `max_entries` keys are kept; the least
+    recently used is evicted first.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, max_entries: int, should_cache: Optional[Callable[[Any], bool]] = None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.should_cache = should_cache or (lambda value: True)
+        self._entries: OrderedDict = OrderedDict()
+        # key -> the key's current load. A load only stores its value while it is still
+        # the current one, so one started before an invalidation can't repopulate the key
+        self._inflight: dict = {}
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0, "evictions": 0, "invalidations": 0}
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        if not self.should_cache(value):
+            return
+        self._entries[key] = _Entry(value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        future = self._inflight.get(key)
+        if future is None:
+            async def run():
+                try:
+                    value = await loader()
+                    if self._inflight.get(key) is future:
+                        self._store(key, value)
+                    return value
+                finally:
+                    if self._inflight.get(key) is future:
+                        del self._inflight[key]
+            future = self._inflight[key] = asyncio.ensure_future(run())
+        return future
+
+    def _revalidate(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._inflight:
+            return
+        self._stats["refreshes"] += 1
+        future = self._load(key, loader)
+
+        def done(f: asyncio.Future):
+            if not f.cancelled() and f.exception() is not None:
+                self._stats["refresh_errors"] += 1
+                logger.warning("Background cache refresh failed: %s", f.exception())
+        future.add_done_callback(done)
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]], force_refresh: bool = False) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and not force_refresh:
+            age = time.monotonic() - entry.stored_at
+            if age < self.ttl:
+                self._stats["hits"] += 1
+                self._entries.move_to_end(key)
+                return entry.value
+            if age < self.ttl + self.stale_ttl:
+                self._stats["stale_hits"] += 1
+                self._entries.move_to_end(key)
+                self._revalidate(key, loader)
+                return entry.value
+
+        self._stats["misses"] += 1
+        if force_refresh:
+            # Don't join or keep a load that may have started before the caller's change
+            self._inflight.pop(key, None)
+        return await asyncio.shield(self._load(key, loader))
+
+    def configure(self, ttl: float, stale_ttl: float, max_entries: int) -> None:
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        if self._entries.pop(key, None) is not None:
+            self._stats["invalidations"] += 1
+        self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["stale_hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_ratio": (self._stats["hits"] + self._stats["stale_hits"]) / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+        }
+
+
+# Per-user /api/msgraph/calendars responses. Empty lists usually mean discovery
+# failed, so they are not cached. Sized by the app lifespan from the calendar_cache_* settings.
+calendar_cache = SWRCache(
+    ttl=DEFAULTS.calendar_cache_ttl,
+    stale_ttl=DEFAULTS.calendar_cache_stale_ttl,
+    max_entries=DEFAULTS.calendar_cache_max_entries,
+    should_cache=lambda calendars: bool(calendars),
+)
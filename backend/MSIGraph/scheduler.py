@@ -0,0 +1,388 @@
+import time
+import random
+import json
+import asyncio
+import collections
+import logging
+import contextlib
+import email.utils
+from typing import Mapping, Optional
+import httpx
+from backend.metrics import record, path_template, Gauge, registry
+from backend.settings import Settings, DEFAULTS
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 503}
+# Methods that can be sent twice with the same effect as once
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Names the mailbox (the signed-in user's id) a request is scheduled under; never sent to Graph
+MAILBOX_HEADER = "X-LegalClerk-Mailbox"
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delay-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def mailbox_key(headers: Mapping) -> str:
+    """
+    The mailbox a delegated Graph request runs against. Every call uses /me,
+    so it is the signed-in user's, whose id the route put in MAILBOX_HEADER.
+    Requests without one share the "app" mailbox.
+    """
+    return headers.get(MAILBOX_HEADER) or "app"
+
+
+def retryable(status: int, method: str, body) -> bool:
+    """
+    Whether a throttled request may be sent again. A 429 was refused before
+    Graph did anything. A 503 may come after the request was carried out, so
+    it is only resent when repeating it is harmless: an idempotent method, or
+    a POST whose body has a transactionId (Graph creates that event once).
+    For a $batch POST every request in the batch must qualify.
+    """
+    if status == 429:
+        return True
+    if status != 503:
+        return False
+    if method.upper() in IDEMPOTENT_METHODS:
+        return True
+    if not isinstance(body, dict):
+        return False
+    if isinstance(body.get("requests"), list):
+        return all(retryable(status, item.get("method", ""), item.get("body")) for item in body["requests"])
+    return bool(body.get("transactionId"))
+
+
+def _json_body(request: httpx.Request):
+    try:
+        return json.loads(request.content) if request.content else None
+    except ValueError:
+        return None
+
+
+def request_weight(request: httpx.Request, body) -> int:
+    """Mailbox slots a request takes: Outlook counts every request inside a $batch against the mailbox's concurrency."""
+    if request.method == "POST" and request.url.path.endswith("/$batch") and isinstance(body, dict):
+        return max(1, len(body.get("requests") or []))
+    return 1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> float:
+        """Take one token, sleeping until one is available. Returns the time waited."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+            delay = (1 - self.tokens) / self.rate
+            waited += delay
+            await asyncio.sleep(delay)
+
+
+class MailboxState:
+    """
+    Concurrency for one mailbox, with a limit that adapts to throttling:
+    every 429/503 lowers it by one (down to 1), and recovery_after successes
+    in a row raise it by one again (up to max_concurrency). A request takes
+    `weight` slots (a $batch one per request in it); one heavier than the
+    limit runs alone. Waiters are served first come, first served.
+    """
+
+    def __init__(self, concurrency: int, recovery_after: int = DEFAULTS.graph_mailbox_recovery):
+        self.max_concurrency = concurrency
+        self.limit = concurrency
+        self.recovery_after = recovery_after
+        self.successes = 0
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.in_flight = 0
+        self.throttled = 0
+        self._waiters: collections.deque = collections.deque()
+
+    def _fits(self, weight: int) -> bool:
+        return self.in_flight + weight <= self.limit or self.in_flight == 0
+
+    async def acquire(self, weight: int = 1) -> None:
+        if self._fits(weight) and not self._waiters:
+            self.in_flight += weight
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((waiter, weight))
+        try:
+            # release() hands the slots over by resolving the future
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(weight)
+            else:
+                self._waiters.remove((waiter, weight))
+            raise
+
+    def release(self, weight: int = 1) -> None:
+        self.in_flight -= weight
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self._fits(self._waiters[0][1]):
+            waiter, weight = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += weight
+                waiter.set_result(None)
+
+    def on_throttled(self) -> None:
+        self.throttled += 1
+        self.successes = 0
+        self.limit = max(1, self.limit - 1)
+
+    def on_success(self) -> None:
+        self.successes += 1
+        if self.limit < self.max_concurrency and self.successes >= self.recovery_after:
+            self.limit += 1
+            self.successes = 0
+            self._wake()
+
+    def idle(self) -> bool:
+        # A lowered limit is remembered until it has recovered
+        return (self.waiting == 0 and self.in_flight == 0 and self.limit == self.max_concurrency
+                and self.blocked_until <= time.monotonic())
+
+
+class GraphScheduler:
+    """
+    Every Graph request passes through here (see ThrottlingTransport).
+
+    A request waits out any Retry-After its mailbox was given, then takes a
+    per-mailbox slot, an app-wide slot and a token from the app's token
+    bucket before it is sent. A 429 or 503 response blocks the whole mailbox
+    for the Retry-After period (or a jittered exponential backoff when the
+    header is missing), lowers the mailbox's concurrency limit, and the
+    request is retried, up to max_retries, if retryable() allows it.
+    """
+
+    def __init__(self, mailbox_concurrency: int = DEFAULTS.graph_mailbox_concurrency, app_concurrency: int = DEFAULTS.graph_app_concurrency,
+                 rate: float = DEFAULTS.graph_rate_limit, burst: int = DEFAULTS.graph_rate_burst, max_retries: int = DEFAULTS.graph_max_retries,
+                 backoff_base: float = DEFAULTS.graph_backoff_base, backoff_max: float = DEFAULTS.graph_backoff_max,
+                 max_retry_after: float = DEFAULTS.graph_max_retry_after, mailbox_recovery: int = DEFAULTS.graph_mailbox_recovery):
+        self.mailbox_concurrency = max(1, mailbox_concurrency)
+        self.mailbox_recovery = mailbox_recovery
+        self.app_concurrency = max(1, app_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.bucket = TokenBucket(rate, burst)
+        self._app_slots = asyncio.Semaphore(self.app_concurrency)
+        self._mailboxes: dict = {}
+        self.metrics = {
+            "requests": 0,
+            "sent": 0,
+            "throttled": 0,
+            "retries": 0,
+            "gave_up": 0,
+            "batch_subrequest_retries": 0,
+            "queue_wait_seconds": 0.0,
+            "throttle_wait_seconds": 0.0,
+        }
+        self.in_flight = 0
+        self.waiting = 0
+
+    def configure(self, settings: Settings) -> None:
+        """
+        Apply the scheduler settings; called by the app lifespan before any
+        request is sent. The limits are for the whole app, so each of the
+        web_concurrency worker processes takes its share (at least one
+        request per mailbox; past four workers Outlook's limit is exceeded and
+        the 429 handling lowers it).
+        """
+        workers = max(1, settings.web_concurrency)
+        self.mailbox_concurrency = max(1, settings.graph_mailbox_concurrency // workers)
+        self.mailbox_recovery = settings.graph_mailbox_recovery
+        self.app_concurrency = max(1, settings.graph_app_concurrency // workers)
+        self.max_retries = settings.graph_max_retries
+        self.backoff_base = settings.graph_backoff_base
+        self.backoff_max = settings.graph_backoff_max
+        self.max_retry_after = settings.graph_max_retry_after
+        self.bucket = TokenBucket(settings.graph_rate_limit / workers, max(1, settings.graph_rate_burst // workers))
+        self._app_slots = asyncio.Semaphore(self.app_concurrency)
+        self._mailboxes.clear()
+
+    def _mailbox(self, key: str) -> MailboxState:
+        state = self._mailboxes.get(key)
+        if state is None:
+            state = self._mailboxes[key] = MailboxState(self.mailbox_concurrency, self.mailbox_recovery)
+        return state
+
+    def _release_idle(self, key: str) -> None:
+        state = self._mailboxes.get(key)
+        if state is not None and state.idle():
+            del self._mailboxes[key]
+
+    def batch_size(self, key: str) -> int:
+        """Requests per $batch for a mailbox: no more than it may run at once."""
+        state = self._mailboxes.get(key)
+        return state.limit if state is not None else self.mailbox_concurrency
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry number `attempt` (0-based)."""
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def throttle(self, key: str, delay: float) -> None:
+        """Hold every request for this mailbox for `delay` seconds and lower its concurrency limit."""
+        state = self._mailbox(key)
+        state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+        state.on_throttled()
+        self.metrics["throttled"] += 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key: str, weight: int = 1):
+        """Wait for the mailbox to be unblocked and for `weight` mailbox slots, an app slot and a rate token."""
+        state = self._mailbox(key)
+        app_slots = self._app_slots
+        state.waiting += 1
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            while state.blocked_until > time.monotonic():
+                await asyncio.sleep(state.blocked_until - time.monotonic())
+            await state.acquire(weight)
+            try:
+                await app_slots.acquire()
+                try:
+                    await self.bucket.acquire()
+                except BaseException:
+                    app_slots.release()
+                    raise
+            except BaseException:
+                state.release(weight)
+                raise
+        finally:
+            state.waiting -= 1
+            self.waiting -= 1
+            self.metrics["queue_wait_seconds"] += time.monotonic() - started
+
+        self.in_flight += 1
+        try:
+            yield state
+        finally:
+            self.in_flight -= 1
+            app_slots.release()
+            state.release(weight)
+            self._release_idle(key)
+
+    async def send(self, transport: httpx.AsyncBaseTransport, request: httpx.Request, key: str = "app") -> httpx.Response:
+        body = _json_body(request) if request.method == "POST" else None
+        weight = request_weight(request, body)
+        self.metrics["requests"] += 1
+        attempt = 0
+        while True:
+            async with self.slot(key, weight) as state:
+                response = await transport.handle_async_request(request)
+                self.metrics["sent"] += 1
+                if response.status_code not in RETRY_STATUSES:
+                    state.on_success()
+            if response.status_code not in RETRY_STATUSES:
+                return response
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if (attempt >= self.max_retries or (retry_after or 0) > self.max_retry_after
+                    or not retryable(response.status_code, request.method, body)):
+                self.metrics["gave_up"] += 1
+                self.throttle(key, retry_after or 0)
+                return response
+
+            await response.aread()
+            await response.aclose()
+            delay = self.backoff(attempt, retry_after)
+            logger.warning("Graph returned %s for %s %s; retrying in %.2fs", response.status_code, request.method, request.url.path, delay)
+            self.throttle(key, delay)
+            self.metrics["retries"] += 1
+            self.metrics["throttle_wait_seconds"] += delay
+            attempt += 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            **self.metrics,
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "mailboxes": len(self._mailboxes),
+            "blocked_mailboxes": sum(1 for s in self._mailboxes.values() if s.blocked_until > now),
+            # Mailboxes running below mailbox_concurrency after being throttled
+            "reduced_mailboxes": sum(1 for s in self._mailboxes.values() if s.limit < s.max_concurrency),
+            "mailbox_concurrency": self.mailbox_concurrency,
+            "app_concurrency": self.app_concurrency,
+            "rate_limit": self.bucket.rate,
+            "rate_burst": self.bucket.burst,
+        }
+
+
+class ThrottlingTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps the shared client's transport so that every request under base_url
+    (Graph) goes through the scheduler, under the mailbox named by
+    MAILBOX_HEADER. Other hosts (the login endpoint) pass straight through.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, scheduler: GraphScheduler, base_url: str):
+        self.transport = transport
+        self.scheduler = scheduler
+        self.base_url = base_url
+        self.base_path = httpx.URL(base_url).path.rstrip("/")
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # Every outbound call is timed for Server-Timing and the upstream histograms
+        started = time.perf_counter()
+        response = None
+        is_graph = str(request.url).startswith(self.base_url)
+        key = mailbox_key(request.headers)
+        request.headers.pop(MAILBOX_HEADER, None)
+        try:
+            if is_graph:
+                response = await self.scheduler.send(self.transport, request, key)
+            else:
+                response = await self.transport.handle_async_request(request)
+            return response
+        finally:
+            path = request.url.path
+            if is_graph and path.startswith(self.base_path):
+                path = path[len(self.base_path):]
+            record("graph" if is_graph else "login", f"{request.method} {path_template(path)}",
+                   time.perf_counter() - started, response is None or response.status_code >= 400)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+graph_scheduler = GraphScheduler()
+
+registry.register(Gauge("graph_scheduler_queue_depth", "Graph requests waiting for a slot.", lambda: graph_scheduler.waiting))
+registry.register(Gauge("graph_scheduler_in_flight", "Graph requests being sent.", lambda: graph_scheduler.in_flight))
+registry.register(Gauge("graph_scheduler_blocked_mailboxes", "Mailboxes held back by Retry-After.",
+                        lambda: graph_scheduler.stats()["blocked_mailboxes"]))
+registry.register(Gauge("graph_throttled_total", "429/503 responses from Graph.", lambda: graph_scheduler.metrics["throttled"], "counter"))
+registry.register(Gauge("graph_retries_total", "Graph requests retried after throttling.", lambda: graph_scheduler.metrics["retries"], "counter"))
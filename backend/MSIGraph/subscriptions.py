@@ -0,0 +1,396 @@
+import hmac
+import time
+import asyncio
+import logging
+import secrets
+import datetime
+from dataclasses import dataclass
+from typing import Callable, Optional
+import httpx
+from fastapi import HTTPException
+from backend.jobs.store import SQLiteStore
+from backend.settings import DEFAULTS, Settings
+from backend.worker_bus import worker_bus
+from .graph_client import graph_url
+from .scheduler import MAILBOX_HEADER
+from .token_cache import token_cache
+from .event_store import CALENDAR_CHANGED, event_store, graph_iso
+from .notification_hub import NotificationHub, notification_hub
+
+logger = logging.getLogger(__name__)
+
+CHANGE_TYPES = "created,updated,deleted"
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+@dataclass
+class Subscription:
+    id: str
+    user_id: str
+    calendar_id: str
+    client_state: str
+    expires_at: datetime.datetime
+    # Last time.time() a worker process had a live stream of the user open
+    listened_at: Optional[float] = None
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS graph_subscriptions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    client_state TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    listened_at REAL,
+    UNIQUE (user_id, calendar_id)
+);
+CREATE INDEX IF NOT EXISTS graph_subscriptions_expiry ON graph_subscriptions (expires_at);
+"""
+
+
+def _subscription(row) -> Optional[Subscription]:
+    if row is None:
+        return None
+    expires_at = datetime.datetime.fromtimestamp(row["expires_at"], datetime.timezone.utc)
+    return Subscription(row["id"], row["user_id"], row["calendar_id"], row["client_state"], expires_at, row["listened_at"])
+
+
+class SubscriptionStore(SQLiteStore):
+    """
+    The subscriptions and their clientStates, in the job database: Graph
+    posts a notification to whichever worker process it reaches, and a
+    subscription made by one process is renewed or deleted by any of them.
+    """
+
+    schema = SCHEMA
+
+    def _get(self, subscription_id: str) -> Optional[Subscription]:
+        return _subscription(self._conn.execute("SELECT * FROM graph_subscriptions WHERE id = ?", (subscription_id,)).fetchone())
+
+    async def get(self, subscription_id: str) -> Optional[Subscription]:
+        return await self._run(self._locked, self._get, subscription_id)
+
+    def _for_calendar(self, user_id: str, calendar_id: str) -> Optional[Subscription]:
+        return _subscription(self._conn.execute(
+            "SELECT * FROM graph_subscriptions WHERE user_id = ? AND calendar_id = ?", (user_id, calendar_id)
+        ).fetchone())
+
+    async def for_calendar(self, user_id: str, calendar_id: str) -> Optional[Subscription]:
+        return await self._run(self._locked, self._for_calendar, user_id, calendar_id)
+
+    def _for_user(self, user_id: str) -> list:
+        return [_subscription(row) for row in self._conn.execute("SELECT * FROM graph_subscriptions WHERE user_id = ?", (user_id,))]
+
+    async def for_user(self, user_id: str) -> list:
+        return await self._run(self._locked, self._for_user, user_id)
+
+    def _due(self, before: float) -> list:
+        return [_subscription(row) for row in self._conn.execute("SELECT * FROM graph_subscriptions WHERE expires_at <= ?", (before,))]
+
+    async def due(self, before: datetime.datetime) -> list:
+        """Subscriptions expiring by `before`."""
+        return await self._run(self._locked, self._due, before.timestamp())
+
+    def _add(self, subscription: Subscription) -> Subscription:
+        self._conn.execute(
+            "INSERT INTO graph_subscriptions (id, user_id, calendar_id, client_state, expires_at, listened_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (user_id, calendar_id) DO NOTHING",
+            (subscription.id, subscription.user_id, subscription.calendar_id, subscription.client_state,
+             subscription.expires_at.timestamp(), time.time()),
+        )
+        return self._for_calendar(subscription.user_id, subscription.calendar_id)
+
+    async def add(self, subscription: Subscription) -> Subscription:
+        """Store a new subscription, unless another process stored one for the calendar first; returns the stored one."""
+        return await self._run(self._transaction, self._add, subscription)
+
+    def _set_expiry(self, subscription_id: str, expires_at: float) -> None:
+        self._conn.execute("UPDATE graph_subscriptions SET expires_at = ? WHERE id = ?", (expires_at, subscription_id))
+
+    async def set_expiry(self, subscription_id: str, expires_at: datetime.datetime) -> None:
+        await self._run(self._transaction, self._set_expiry, subscription_id, expires_at.timestamp())
+
+    def _remove(self, subscription_id: str) -> None:
+        self._conn.execute("DELETE FROM graph_subscriptions WHERE id = ?", (subscription_id,))
+
+    async def remove(self, subscription_id: str) -> None:
+        await self._run(self._transaction, self._remove, subscription_id)
+
+    def _touch(self, user_ids: list, now: float) -> None:
+        self._conn.executemany("UPDATE graph_subscriptions SET listened_at = ? WHERE user_id = ?", [(now, u) for u in user_ids])
+
+    async def touch(self, user_ids: list) -> None:
+        """Record that these users have a live stream open (in this process)."""
+        if user_ids:
+            await self._run(self._transaction, self._touch, user_ids, time.time())
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM graph_subscriptions").fetchone()[0]
+
+    async def count(self) -> int:
+        return await self._run(self._locked, self._count)
+
+
+class SubscriptionManager:
+    """
+    Graph change-notification subscriptions for the calendars users have
+    open, and the ingestion side of those notifications.
+
+    A subscription is created per (user, calendar) the first time a
+    dashboard asks for it, with a random clientState that every incoming
+    notification must echo. Subscriptions are renewed before they expire
+    while the user has a live stream open in any worker process, and deleted
+    once they have none. They are kept in a SubscriptionStore shared by the
+    worker processes (given to start()), so a notification is accepted by
+    whichever process Graph reaches and survives restarts. What it changes
+    reaches the other processes over the worker bus.
+    """
+
+    def __init__(self, hub: NotificationHub, notification_url: Optional[str] = DEFAULTS.graph_notification_url,
+                 minutes: int = DEFAULTS.graph_subscription_minutes, renew_margin: float = DEFAULTS.graph_subscription_renew_margin,
+                 check_interval: float = DEFAULTS.graph_subscription_check_interval):
+        self.hub = hub
+        self.notification_url = notification_url
+        self.minutes = minutes
+        self.renew_margin = datetime.timedelta(seconds=renew_margin)
+        self.check_interval = check_interval
+        self.store: Optional[SubscriptionStore] = None
+        self._locks: dict = {}
+        self._tasks: set = set()
+        self._renewer: Optional[asyncio.Task] = None
+        self._get_client: Optional[Callable[[], httpx.AsyncClient]] = None
+        self.metrics = {"created": 0, "renewed": 0, "deleted": 0, "failed": 0, "notifications": 0, "rejected": 0}
+
+    def configure(self, settings: Settings) -> None:
+        """Apply the subscription settings; called by the app lifespan before start()."""
+        self.notification_url = settings.graph_notification_url
+        self.minutes = settings.graph_subscription_minutes
+        self.renew_margin = datetime.timedelta(seconds=settings.graph_subscription_renew_margin)
+        self.check_interval = settings.graph_subscription_check_interval
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.notification_url)
+
+    def _expiry(self) -> datetime.datetime:
+        return _now() + datetime.timedelta(minutes=self.minutes)
+
+    async def _headers(self, client: httpx.AsyncClient, user_id: str) -> dict:
+        access_token = await token_cache.get_access_token(client, user_id)
+        return {"Authorization": f"Bearer {access_token}", MAILBOX_HEADER: user_id, "Content-Type": "application/json"}
+
+    def _listened(self, subscription: Subscription) -> bool:
+        """Whether the user has a live stream open here, or had one in another process at its last check."""
+        if self.hub.listeners(subscription.user_id):
+            return True
+        return subscription.listened_at is not None and subscription.listened_at >= time.time() - 2 * self.check_interval
+
+    # Graph side
+
+    async def ensure(self, client: httpx.AsyncClient, user_id: str, calendar_id: str) -> Optional[Subscription]:
+        """Make sure the user's calendar has a live subscription. Returns None if one can't be created."""
+        if not self.enabled or self.store is None:
+            return None
+        key = (user_id, calendar_id)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                subscription = await self.store.for_calendar(user_id, calendar_id)
+                if subscription is not None and subscription.expires_at - _now() > self.renew_margin:
+                    return subscription
+                if subscription is not None and await self._renew(client, subscription):
+                    return subscription
+                return await self._create(client, user_id, calendar_id)
+        finally:
+            if not lock.locked() and self._locks.get(key) is lock:
+                del self._locks[key]
+
+    async def _create(self, client: httpx.AsyncClient, user_id: str, calendar_id: str) -> Optional[Subscription]:
+        client_state = secrets.token_urlsafe(32)
+        body = {
+            "changeType": CHANGE_TYPES,
+            "notificationUrl": self.notification_url,
+            "lifecycleNotificationUrl": self.notification_url,
+            "resource": f"me/calendars/{calendar_id}/events",
+            "expirationDateTime": graph_iso(self._expiry()),
+            "clientState": client_state,
+        }
+        try:
+            response = await client.post(f"{graph_url()}/subscriptions", headers=await self._headers(client, user_id), json=body)
+        except (httpx.HTTPError, HTTPException) as e:
+            logger.warning("Failed to subscribe to calendar %s: %s", calendar_id, e)
+            self.metrics["failed"] += 1
+            return None
+        if response.status_code != 201:
+            logger.warning("Failed to subscribe to calendar %s: %s - %s", calendar_id, response.status_code, response.text)
+            self.metrics["failed"] += 1
+            return None
+        created = response.json()
+        expires_at = datetime.datetime.fromisoformat(created["expirationDateTime"].replace("Z", "+00:00"))
+        subscription = Subscription(created["id"], user_id, calendar_id, client_state, expires_at)
+        stored = await self.store.add(subscription)
+        self.metrics["created"] += 1
+        if stored.id != subscription.id:
+            # Another worker process subscribed to the calendar at the same time; keep one
+            await self._delete_remote(client, subscription)
+            return stored
+        logger.info("Subscribed to changes in calendar %s for user %s", calendar_id, user_id)
+        return subscription
+
+    async def _renew(self, client: httpx.AsyncClient, subscription: Subscription) -> bool:
+        """Extend a subscription. False if Graph no longer has it (it is forgotten) or the call failed."""
+        expires_at = self._expiry()
+        try:
+            response = await client.patch(f"{graph_url()}/subscriptions/{subscription.id}",
+                                          headers=await self._headers(client, subscription.user_id),
+                                          json={"expirationDateTime": graph_iso(expires_at)})
+        except (httpx.HTTPError, HTTPException) as e:
+            logger.warning("Failed to renew subscription %s: %s", subscription.id, e)
+            self.metrics["failed"] += 1
+            return False
+        if response.status_code == 404:
+            await self.store.remove(subscription.id)
+            return False
+        if response.status_code != 200:
+            logger.warning("Failed to renew subscription %s: %s - %s", subscription.id, response.status_code, response.text)
+            self.metrics["failed"] += 1
+            return False
+        subscription.expires_at = expires_at
+        await self.store.set_expiry(subscription.id, expires_at)
+        self.metrics["renewed"] += 1
+        return True
+
+    async def _delete(self, client: httpx.AsyncClient, subscription: Subscription) -> None:
+        await self.store.remove(subscription.id)
+        await self._delete_remote(client, subscription)
+
+    async def _delete_remote(self, client: httpx.AsyncClient, subscription: Subscription) -> None:
+        try:
+            response = await client.delete(f"{graph_url()}/subscriptions/{subscription.id}",
+                                           headers=await self._headers(client, subscription.user_id))
+            if response.status_code not in (204, 404):
+                logger.warning("Failed to delete subscription %s: %s", subscription.id, response.status_code)
+        except (httpx.HTTPError, HTTPException) as e:
+            logger.warning("Failed to delete subscription %s: %s", subscription.id, e)
+        self.metrics["deleted"] += 1
+
+    async def remove_user(self, client: httpx.AsyncClient, user_id: str) -> None:
+        """Delete all of a user's subscriptions; call while their Microsoft token is still stored."""
+        if self.store is None:
+            return
+        for subscription in await self.store.for_user(user_id):
+            await self._delete(client, subscription)
+
+    async def listening(self, user_id: str) -> None:
+        """Note that user_id has a live stream open here, so no process deletes their subscriptions meanwhile."""
+        if self.store is not None:
+            await self.store.touch([user_id])
+
+    async def renew_due(self, client: httpx.AsyncClient) -> None:
+        """Renew subscriptions close to expiry for users with an open stream (in any process); delete the rest."""
+        await self.store.touch(self.hub.users())
+        for subscription in await self.store.due(_now() + self.renew_margin):
+            if self._listened(subscription):
+                await self.ensure(client, subscription.user_id, subscription.calendar_id)
+            else:
+                await self._delete(client, subscription)
+
+    # Ingestion side
+
+    async def _verify(self, notification: dict) -> Optional[Subscription]:
+        subscription_id = notification.get("subscriptionId")
+        subscription = await self.store.get(subscription_id) if self.store is not None and subscription_id else None
+        client_state = notification.get("clientState") or ""
+        if subscription is None or not hmac.compare_digest(client_state.encode(), subscription.client_state.encode()):
+            self.metrics["rejected"] += 1
+            return None
+        return subscription
+
+    async def handle(self, notifications: list) -> int:
+        """
+        Apply a batch of change or lifecycle notifications. Nothing here waits
+        on Graph (only on the subscription table), so the endpoint can answer
+        within Graph's 3 second limit; renewals and re-subscriptions run in
+        the background. Returns how many notifications were accepted.
+        """
+        accepted = 0
+        for notification in notifications:
+            subscription = await self._verify(notification)
+            if subscription is None:
+                continue
+            accepted += 1
+            self.metrics["notifications"] += 1
+            user_id, calendar_id = subscription.user_id, subscription.calendar_id
+            lifecycle = notification.get("lifecycleEvent")
+            if lifecycle == "reauthorizationRequired":
+                self._background(self._reauthorize(subscription))
+            elif lifecycle == "subscriptionRemoved":
+                await self.store.remove(subscription.id)
+                if self._listened(subscription):
+                    self._background(self._resubscribe(user_id, calendar_id))
+            elif lifecycle == "missed":
+                self._mark_stale(user_id, calendar_id)
+                self.hub.publish(user_id, {"type": "resync", "calendarId": calendar_id})
+            else:
+                self._mark_stale(user_id, calendar_id)
+                self.hub.publish(user_id, {
+                    "type": "event_change",
+                    "calendarId": calendar_id,
+                    "changeType": notification.get("changeType"),
+                    "eventId": (notification.get("resourceData") or {}).get("id"),
+                })
+        return accepted
+
+    @staticmethod
+    def _mark_stale(user_id: str, calendar_id: str) -> None:
+        event_store.mark_stale(user_id, calendar_id)
+        worker_bus.send(CALENDAR_CHANGED, user_id, {"calendarId": calendar_id})
+
+    async def _reauthorize(self, subscription: Subscription) -> None:
+        if self._get_client is not None:
+            await self._renew(self._get_client(), subscription)
+
+    async def _resubscribe(self, user_id: str, calendar_id: str) -> None:
+        if self._get_client is not None:
+            await self.ensure(self._get_client(), user_id, calendar_id)
+
+    def _background(self, coroutine) -> None:
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # Lifecycle
+
+    def start(self, get_client: Callable[[], httpx.AsyncClient], store: SubscriptionStore) -> None:
+        self._get_client = get_client
+        self.store = store
+        if self.enabled and self._renewer is None:
+            self._renewer = asyncio.create_task(self._renew_loop())
+        elif not self.enabled:
+            logger.info("GRAPH_NOTIFICATION_URL is not set; calendar change notifications are disabled")
+
+    async def _renew_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.renew_due(self._get_client())
+            except Exception:
+                logger.exception("Subscription renewal failed")
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks) + ([self._renewer] if self._renewer else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._renewer = None
+        self.store = None
+
+    async def stats(self) -> dict:
+        count = await self.store.count() if self.store is not None else 0
+        return {**self.metrics, "enabled": self.enabled, "subscriptions": count}
+
+
+subscriptions = SubscriptionManager(notification_hub)
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+import httpx
+from fastapi import HTTPException
+from .. import db
+from ..settings import Settings, get_settings, DEFAULTS
+from .graph_client import token_url
+from .notification_hub import notification_hub
+
+logger = logging.getLogger(__name__)
+
+# Worker bus kind: a user's stored Microsoft tokens were replaced or deleted; every process drops what it cached for them
+TOKENS_CHANGED = "tokens_changed"
+
+
+def parse_expires_at(expires_at: Optional[str]) -> Optional[datetime.datetime]:
+    """Parse an ms_tokens.expires_at value; naive timestamps are stored as UTC."""
+    if not expires_at:
+        return None
+    parsed = datetime.datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def expires_at_from_now(expires_in: Optional[int]) -> Optional[str]:
+    if not expires_in:
+        return None
+    return (datetime.datetime.utcnow() + datetime.timedelta(seconds=expires_in)).isoformat()
+
+
+@dataclass
+class CachedToken:
+    access_token: str
+    refresh_token: Optional[str]
+    expires_at: Optional[datetime.datetime]
+    fresh_until: datetime.datetime
+
+
+class _UserLock:
+    """A user's refresh lock, while any request holds or waits for it."""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+        # Bumped by invalidate(): a refresh that started under an older generation must not write back
+        self.generation = 0
+
+
+class TokenCache:
+    """
+    Per-user cache of Microsoft tokens backed by the ms_tokens table.
+
+    An entry is served until a few minutes before its expires_at, after which
+    the next caller re-reads the row (another process may have refreshed it)
+    and refreshes it if still needed. Refreshes are single-flight per user_id:
+    one lock per user means concurrent requests wait for the in-flight refresh
+    and reuse its result instead of racing on the ms_tokens row. A refresh
+    that overlaps invalidate() (e.g. /disconnect) neither caches nor saves the
+    token it got. Locks are dropped as soon as no request holds or waits for one.
+    """
+
+    def __init__(self, refresh_margin: float = DEFAULTS.ms_token_refresh_margin, fallback_ttl: float = DEFAULTS.ms_token_cache_ttl):
+        # Refresh this long before the Microsoft token actually expires
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        # How long to trust a cached row that has no expires_at
+        self.fallback_ttl = datetime.timedelta(seconds=fallback_ttl)
+        self._tokens: dict[str, CachedToken] = {}
+        self._locks: dict[str, _UserLock] = {}
+
+    def configure(self, settings: Settings) -> None:
+        """Apply the token settings; called by the app lifespan."""
+        self.refresh_margin = datetime.timedelta(seconds=settings.ms_token_refresh_margin)
+        self.fallback_ttl = datetime.timedelta(seconds=settings.ms_token_cache_ttl)
+
+    def _now(self) -> datetime.datetime:
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    def _entry(self, access_token: str, refresh_token: Optional[str], expires_at: Optional[str]) -> CachedToken:
+        expires = parse_expires_at(expires_at)
+        if expires is None:
+            fresh_until = self._now() + self.fallback_ttl
+        else:
+            fresh_until = expires - self.refresh_margin
+        return CachedToken(access_token, refresh_token, expires, fresh_until)
+
+    def _is_fresh(self, entry: Optional[CachedToken]) -> bool:
+        return entry is not None and self._now() < entry.fresh_until
+
+    def store(self, user_id: str, access_token: str, refresh_token: Optional[str], expires_at: Optional[str]) -> None:
+        self._tokens[user_id] = self._entry(access_token, refresh_token, expires_at)
+
+    def invalidate(self, user_id: str) -> None:
+        self._tokens.pop(user_id, None)
+        user_lock = self._locks.get(user_id)
+        if user_lock is not None:
+            user_lock.generation += 1
+
+    async def get_access_token(self, client: httpx.AsyncClient, user_id: str) -> str:
+        """
+        Return a valid Microsoft access token for user_id, loading it from
+        Supabase and refreshing it as needed.
+        Raises HTTPException(401) if the account is not connected or the
+        refresh fails after the token has expired.
+        """
+        entry = self._tokens.get(user_id)
+        if self._is_fresh(entry):
+            return entry.access_token
+
+        user_lock = self._locks.get(user_id)
+        if user_lock is None:
+            user_lock = self._locks[user_id] = _UserLock()
+        user_lock.users += 1
+        try:
+            async with user_lock.lock:
+                # Another request may have refreshed while we waited for the lock
+                entry = self._tokens.get(user_id)
+                if self._is_fresh(entry):
+                    return entry.access_token
+
+                generation = user_lock.generation
+                row = await db.get_ms_tokens(user_id)
+                if row is None:
+                    raise HTTPException(status_code=401, detail="Microsoft account not connected")
+                entry = self._entry(row["access_token"], row["refresh_token"], row["expires_at"])
+                if user_lock.generation == generation:
+                    self._tokens[user_id] = entry
+                if self._is_fresh(entry):
+                    return entry.access_token
+
+                return await self._refresh(client, user_id, entry, user_lock, generation)
+        finally:
+            user_lock.users -= 1
+            if user_lock.users == 0 and self._locks.get(user_id) is user_lock:
+                del self._locks[user_id]
+
+    def _superseded(self, user_id: str) -> str:
+        """After an invalidate() during a refresh: whatever is cached now, or 401 if nothing is."""
+        logger.info("Tokens for user %s changed during the refresh; discarding its result", user_id)
+        entry = self._tokens.get(user_id)
+        if self._is_fresh(entry):
+            return entry.access_token
+        raise HTTPException(status_code=401, detail="Microsoft account not connected")
+
+    async def _refresh(self, client: httpx.AsyncClient, user_id: str, entry: CachedToken, user_lock: _UserLock, generation: int) -> str:
+        expired = entry.expires_at is not None and entry.expires_at <= self._now()
+
+        if entry.expires_at is None:
+            # Nothing to refresh against; re-check the row again after the fallback TTL
+            entry.fresh_until = self._now() + self.fallback_ttl
+            return entry.access_token
+
+        if not entry.refresh_token:
+            if not expired:
+                entry.fresh_until = entry.expires_at
+                return entry.access_token
+            logger.warning("No refresh token available, deleting expired token for user %s", user_id)
+            self.invalidate(user_id)
+            await db.delete_ms_tokens(user_id)
+            notification_hub.publish(user_id, {"type": "status", "connected": False})
+            raise HTTPException(status_code=401, detail="Microsoft token expired and no refresh token available. Please reconnect your Microsoft account.")
+
+        logger.info("Access token expiring, refreshing for user %s", user_id)
+        settings = get_settings()
+        refresh_payload = {
+            "client_id": settings.ms_client_id,
+            "client_secret": settings.ms_client_secret,
+            "refresh_token": entry.refresh_token,
+            "grant_type": "refresh_token",
+        }
+        refresh_response = await client.post(token_url(), data=refresh_payload)
+        if user_lock.generation != generation:
+            return self._superseded(user_id)
+        if refresh_response.status_code == 200:
+            new_tokens = refresh_response.json()
+            update_data = {
+                "access_token": new_tokens["access_token"],
+                "refresh_token": new_tokens.get("refresh_token", entry.refresh_token),
+                "expires_at": expires_at_from_now(new_tokens.get("expires_in")),
+            }
+            await db.update_ms_tokens(user_id, update_data)
+            if user_lock.generation != generation:
+                return self._superseded(user_id)
+            self.store(user_id, update_data["access_token"], update_data["refresh_token"], update_data["expires_at"])
+            logger.info("Token refreshed for user %s", user_id)
+            return update_data["access_token"]
+
+        if not expired:
+            # Proactive refresh failed but the current token still works; retry once it expires
+            logger.warning("Proactive token refresh failed for user %s: %s", user_id, refresh_response.status_code)
+            entry.fresh_until = entry.expires_at
+            return entry.access_token
+
+        logger.warning("Failed to refresh token for user %s (%s), deleting expired token", user_id, refresh_response.status_code)
+        self.invalidate(user_id)
+        await db.delete_ms_tokens(user_id)
+        notification_hub.publish(user_id, {"type": "status", "connected": False})
+        raise HTTPException(status_code=401, detail="Microsoft token expired and refresh failed. Please reconnect your Microsoft account.")
+
+
+token_cache = TokenCache()
@@ -0,0 +1,267 @@
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import datetime
+from typing import Optional
+import httpx
+from fastapi import HTTPException
+from backend.jobs.store import SQLiteStore
+from backend.settings import DEFAULTS
+from .batch import run_batched
+from .events import calendar_events_path
+
+# A trial's duration option from the Create Trial form, in calendar days
+TRIAL_DURATION_DAYS = {"1-day": 1, "2-days": 2, "3-days": 3, "1-week": 7}
+# Outlook category of the trial events this app creates (deadline reminders get "Deadline")
+TRIAL_CATEGORY = "Trial"
+
+# Namespace for the Graph transactionId derived from an idempotency key
+TRANSACTION_NAMESPACE = uuid.UUID("6f1f3c1e-5b8a-4f0e-9a57-1d8c2f4b7e21")
+
+
+def parse_date(value: str, field: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(value[:10])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Invalid date for {field}: {value!r}")
+
+
+def all_day_event(subject: str, start: datetime.date, end: datetime.date, time_zone: str, notes: str = "",
+                  categories: Optional[list] = None, show_as: str = "free") -> dict:
+    """Graph payload for an all-day event; `end` is exclusive."""
+    event = {
+        "subject": subject,
+        "start": {"dateTime": f"{start.isoformat()}T00:00:00", "timeZone": time_zone},
+        "end": {"dateTime": f"{end.isoformat()}T00:00:00", "timeZone": time_zone},
+        "isAllDay": True,
+        "showAs": show_as,
+    }
+    if notes:
+        event["body"] = {"contentType": "text", "content": notes}
+    if categories:
+        event["categories"] = categories
+    return event
+
+
+def build_trial_events(data: dict) -> list:
+    """
+    Expand a trial submission into the individual calendar events to create.
+
+    The trial itself goes to every target calendar. Each deadline goes to its
+    own calendar_ids (the template-specific reminder settings), falling back to
+    the reminder calendars and then the target calendars.
+    Returns [{"key", "calendar_id", "subject", "event"}] with a stable key per event.
+    """
+    trial = data.get("trial") or {}
+    time_zone = data.get("time_zone") or "UTC"
+    target_calendars = data.get("target_calendars") or []
+    reminder_calendars = data.get("reminder_calendars") or []
+    court_file_no = trial.get("court_file_no", "")
+    style_of_cause = trial.get("style_of_cause", "")
+    title = f"{style_of_cause} ({court_file_no})" if court_file_no else style_of_cause
+    notes = trial.get("notes", "")
+
+    if not target_calendars:
+        raise HTTPException(status_code=400, detail="Select at least one target calendar")
+
+    duration = trial.get("trial_duration")
+    if duration == "custom":
+        trial_start = parse_date(trial.get("custom_start_date"), "custom_start_date")
+        trial_end = parse_date(trial.get("custom_end_date"), "custom_end_date") + datetime.timedelta(days=1)
+        if trial_end <= trial_start:
+            raise HTTPException(status_code=400, detail="custom_end_date is before custom_start_date")
+    else:
+        trial_start = parse_date(trial.get("trial_date"), "trial_date")
+        trial_end = trial_start + datetime.timedelta(days=TRIAL_DURATION_DAYS.get(duration, 1))
+
+    events = []
+    for calendar_id in target_calendars:
+        events.append({
+            "key": f"trial:{calendar_id}",
+            "calendar_id": calendar_id,
+            "subject": f"Trial: {title}",
+            # Busy: the trial occupies those days (the scheduling check treats free events as not blocking)
+            "event": all_day_event(f"Trial: {title}", trial_start, trial_end, time_zone, notes, [TRIAL_CATEGORY], show_as="busy"),
+        })
+
+    seen = set()
+    for deadline in data.get("deadlines") or []:
+        name = deadline.get("deadline_name", "Deadline")
+        if not deadline.get("calculated_date"):
+            continue
+        due = parse_date(deadline["calculated_date"], f"deadline '{name}'")
+        subject = f"{name} - {title}"
+        # An explicit [] means no reminder calendar is enabled for this deadline's template
+        calendar_ids = deadline.get("calendar_ids")
+        if calendar_ids is None:
+            calendar_ids = reminder_calendars or target_calendars
+        for calendar_id in calendar_ids:
+            key = f"deadline:{name}:{due.isoformat()}:{calendar_id}"
+            if key in seen:
+                continue
+            seen.add(key)
+            events.append({
+                "key": key,
+                "calendar_id": calendar_id,
+                "subject": subject,
+                "event": all_day_event(subject, due, due + datetime.timedelta(days=1), time_zone,
+                                       deadline.get("notes") or deadline.get("description") or "", ["Deadline"]),
+            })
+    return events
+
+
+def payload_fingerprint(data: dict) -> str:
+    body = {k: v for k, v in data.items() if k != "idempotency_key"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+
+IDEMPOTENCY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trial_sync_keys (
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    results TEXT NOT NULL,
+    locked_until REAL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (user_id, key)
+);
+CREATE INDEX IF NOT EXISTS trial_sync_keys_created ON trial_sync_keys (created_at);
+"""
+
+
+class IdempotencyStore(SQLiteStore):
+    """
+    Remembers which events a (user_id, idempotency key) submission already
+    created, so a retried submit only sends the events that have not succeeded.
+    Kept in the job database, so a retry that reaches another worker process,
+    or comes after a restart, still sees the earlier attempt. A submission
+    holds its key while it runs; the same key sent meanwhile gets a 409.
+    Keys are forgotten after `ttl` seconds.
+    """
+
+    schema = IDEMPOTENCY_SCHEMA
+
+    def __init__(self, path: str = DEFAULTS.job_db_path, ttl: float = DEFAULTS.trial_sync_idempotency_ttl,
+                 lease_seconds: float = DEFAULTS.trial_sync_idempotency_lease):
+        super().__init__(path)
+        self.ttl = ttl
+        self.lease_seconds = lease_seconds
+
+    def _begin(self, user_id: str, key: str, fingerprint: str) -> dict:
+        now = time.time()
+        self._conn.execute("DELETE FROM trial_sync_keys WHERE created_at <= ?", (now - self.ttl,))
+        row = self._conn.execute(
+            "SELECT fingerprint, results, locked_until FROM trial_sync_keys WHERE user_id = ? AND key = ?", (user_id, key)
+        ).fetchone()
+        if row is None:
+            self._conn.execute(
+                "INSERT INTO trial_sync_keys (user_id, key, fingerprint, results, locked_until, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, key, fingerprint, "{}", now + self.lease_seconds, now),
+            )
+            return {}
+        if row["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency key was already used for a different trial")
+        if row["locked_until"] is not None and row["locked_until"] > now:
+            raise HTTPException(status_code=409, detail="A submission with this idempotency key is still in progress")
+        self._conn.execute(
+            "UPDATE trial_sync_keys SET locked_until = ? WHERE user_id = ? AND key = ?", (now + self.lease_seconds, user_id, key)
+        )
+        return json.loads(row["results"])
+
+    async def begin(self, user_id: str, key: str, fingerprint: str) -> dict:
+        """Take the key for a submission and return the results of earlier attempts ({event key: result})."""
+        return await self._run(self._transaction, self._begin, user_id, key, fingerprint)
+
+    def _finish(self, user_id: str, key: str, results: dict) -> None:
+        row = self._conn.execute("SELECT results FROM trial_sync_keys WHERE user_id = ? AND key = ?", (user_id, key)).fetchone()
+        if row is None:
+            return
+        self._conn.execute(
+            "UPDATE trial_sync_keys SET results = ?, locked_until = NULL WHERE user_id = ? AND key = ?",
+            (json.dumps({**json.loads(row["results"]), **results}), user_id, key),
+        )
+
+    async def finish(self, user_id: str, key: str, results: dict) -> None:
+        """Record this attempt's results and free the key."""
+        await self._run(self._transaction, self._finish, user_id, key, results)
+
+
+def transaction_id(user_id: str, idempotency_key: str, event_key: str) -> str:
+    """Graph de-duplicates event POSTs that share a transactionId."""
+    return str(uuid.uuid5(TRANSACTION_NAMESPACE, f"{user_id}:{idempotency_key}:{event_key}"))
+
+
+def _error_message(body) -> str:
+    if isinstance(body, dict):
+        error = body.get("error")
+        if isinstance(error, dict):
+            return error.get("message") or error.get("code") or json.dumps(error)
+        if error:
+            return str(error)
+    return json.dumps(body) if body else ""
+
+
+async def sync_trial(client: httpx.AsyncClient, headers: dict, user_id: str, data: dict, idempotency_key: Optional[str] = None,
+                     idempotency_store: Optional[IdempotencyStore] = None) -> dict:
+    """
+    Create every event for a trial through Graph $batch and report the
+    outcome of each one. With an idempotency key, events already created by
+    an earlier attempt (as recorded in `idempotency_store`) are not sent
+    again, and the transactionId on each event lets Graph drop duplicates.
+    """
+    events = build_trial_events(data)
+
+    remember = bool(idempotency_key and idempotency_store)
+    previous = await idempotency_store.begin(user_id, idempotency_key, payload_fingerprint(data)) if remember else {}
+    results = {}
+    try:
+        pending = [e for e in events if previous.get(e["key"], {}).get("status") != "created"]
+
+        requests = []
+        for index, item in enumerate(pending):
+            body = dict(item["event"])
+            if idempotency_key:
+                body["transactionId"] = transaction_id(user_id, idempotency_key, item["key"])
+            requests.append({
+                "id": str(index),
+                "method": "POST",
+                "url": calendar_events_path(item["calendar_id"]),
+                "headers": {"Content-Type": "application/json"},
+                "body": body,
+            })
+
+        responses = await run_batched(client, headers, requests) if requests else {}
+
+        for index, item in enumerate(pending):
+            response = responses.get(str(index), {"status": 500, "body": {"error": "No response in $batch"}})
+            status = response.get("status")
+            result = {"key": item["key"], "calendar_id": item["calendar_id"], "subject": item["subject"], "http_status": status}
+            if status in (200, 201):
+                result["status"] = "created"
+                result["event_id"] = (response.get("body") or {}).get("id")
+            else:
+                result["status"] = "failed"
+                result["error"] = _error_message(response.get("body"))
+            results[item["key"]] = result
+    finally:
+        if remember:
+            # Frees the key even if this request was cancelled
+            await asyncio.shield(idempotency_store.finish(user_id, idempotency_key, results))
+
+    report = []
+    for item in events:
+        if item["key"] in results:
+            report.append(results[item["key"]])
+        else:
+            report.append({**previous[item["key"]], "replayed": True})
+
+    succeeded = sum(1 for r in report if r["status"] == "created")
+    return {
+        "idempotency_key": idempotency_key,
+        "total": len(report),
+        "succeeded": succeeded,
+        "failed": len(report) - succeeded,
+        "events": report,
+    }
@@ -1,17 +1,200 @@
-import os
-from fastapi import HTTPException, status, Header, Depends
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional
+import httpx
+from fastapi import HTTPException, status, Header, Depends, Query
 from jose import jwt
+from backend.metrics import timed
+from backend.settings import DEFAULTS, Settings, get_settings
 
-SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+logger = logging.getLogger(__name__)
 
-def verify_jwt(token: str):
+# Asymmetric algorithms Supabase signing keys use; anything else is verified as HS256 with the shared secret
+ASYMMETRIC_ALGORITHMS = {"RS256", "ES256"}
+
+
+def _unauthorized() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+
+class VerifiedTokenCache:
+    """
+    Claims of tokens that passed verification, keyed by a SHA-256 digest of
+    the token. An entry is trusted until the token's exp (capped at max_ttl)
+    and only ever written after a successful decode, so a rejected token is
+    always verified again.
+    """
+
+    def __init__(self, max_entries: int = DEFAULTS.jwt_cache_max_entries, max_ttl: float = DEFAULTS.jwt_cache_max_ttl):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, settings: Settings) -> None:
+        """Apply the JWT cache settings; called by the app lifespan."""
+        self.max_entries = settings.jwt_cache_max_entries
+        self.max_ttl = settings.jwt_cache_max_ttl
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[0])
+
+    def put(self, token: str, claims: dict) -> None:
+        expires_at = time.time() + self.max_ttl
+        if isinstance(claims.get("exp"), (int, float)):
+            expires_at = min(expires_at, claims["exp"])
+        if expires_at <= time.time():
+            return
+        key = self._key(token)
+        self._entries[key] = (dict(claims), expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+class JWKSCache:
+    """
+    Supabase's public signing keys, fetched from the project's JWKS endpoint
+    and refreshed every refresh_interval. A token signed with a kid we have
+    not seen forces an early refresh (at most once per min_refresh_interval),
+    which picks up rotated keys. If a refresh fails the last good keys stay.
+    """
+
+    def __init__(self, url: Optional[str] = None, refresh_interval: float = DEFAULTS.jwks_refresh_interval,
+                 min_refresh_interval: float = DEFAULTS.jwks_min_refresh_interval):
+        self._url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.keys: dict = {}
+        self.fetched_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def configure(self, settings: Settings) -> None:
+        """Apply the refresh intervals; called by the app lifespan."""
+        self.refresh_interval = settings.jwks_refresh_interval
+        self.min_refresh_interval = settings.jwks_min_refresh_interval
+
+    @property
+    def url(self) -> Optional[str]:
+        # Read lazily: SUPABASE_URL may come from .env.local, loaded after this module is imported
+        if self._url:
+            return self._url
+        settings = get_settings()
+        if settings.supabase_jwks_url:
+            return settings.supabase_jwks_url
+        supabase_url = settings.supabase_url
+        if supabase_url:
+            return supabase_url.rstrip("/") + "/auth/v1/.well-known/jwks.json"
+        return None
+
+    def load(self, document: dict) -> None:
+        self.keys = {key.get("kid"): key for key in document.get("keys", [])}
+        self.fetched_at = time.monotonic()
+
+    def _age(self) -> float:
+        return float("inf") if self.fetched_at is None else time.monotonic() - self.fetched_at
+
+    async def _refresh(self) -> None:
+        if not self.url:
+            logger.error("JWKS URL is not configured; cannot verify asymmetric tokens")
+            return
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.get(self.url)
+            response.raise_for_status()
+            self.load(response.json())
+        except Exception as e:
+            logger.warning("Failed to refresh JWKS: %s", e)
+            if self.fetched_at is not None:
+                # Keep the last good keys, but don't retry on every request
+                self.fetched_at = time.monotonic() - self.refresh_interval + self.min_refresh_interval
+
+    async def get_key(self, kid: Optional[str]) -> Optional[dict]:
+        if self._age() < self.refresh_interval and kid in self.keys:
+            return self.keys[kid]
+        async with self._lock:
+            # Another request may have refreshed while we waited
+            stale = self._age() >= self.refresh_interval
+            unknown = kid not in self.keys and self._age() >= self.min_refresh_interval
+            if stale or unknown:
+                await self._refresh()
+            return self.keys.get(kid)
+
+
+verified_tokens = VerifiedTokenCache()
+jwks = JWKSCache()
+
+
+def verify_jwt(token: str, key=None, algorithms=("HS256",)):
     try:
-        payload = jwt.decode(token, SUPABASE_JWT_SECRET, algorithms=["HS256"], options={"verify_aud": False})
+        payload = jwt.decode(token, key if key is not None else get_settings().supabase_jwt_secret, algorithms=list(algorithms), options={"verify_aud": False})
         return payload
     except Exception as e:
-        print("JWT decode error:", e)
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        logger.info("JWT decode error: %s", e)
+        raise _unauthorized()
+
 
 async def get_current_user(authorization: str = Header(...)):
     token = authorization.replace("Bearer ", "")
-    return verify_jwt(token)
+    with timed("jwt", "verify"):
+        return await _authenticate(token)
+
+
+async def get_current_user_from_query(access_token: str = Query(...)):
+    """
+    For EventSource connections, which cannot send an Authorization header:
+    the Supabase JWT comes as ?access_token=. Only use it on streaming routes;
+    configure_logging redacts the parameter in uvicorn's access log lines.
+    """
+    with timed("jwt", "verify"):
+        return await _authenticate(access_token)
+
+
+async def _authenticate(token: str) -> dict:
+    claims = verified_tokens.get(token)
+    if claims is not None:
+        return claims
+
+    try:
+        header = jwt.get_unverified_header(token)
+    except Exception as e:
+        logger.info("JWT decode error: %s", e)
+        raise _unauthorized()
+
+    algorithm = header.get("alg")
+    if algorithm in ASYMMETRIC_ALGORITHMS:
+        key = await jwks.get_key(header.get("kid"))
+        if key is None or key.get("alg", algorithm) != algorithm:
+            logger.info("JWT decode error: no matching signing key for kid %s", header.get("kid"))
+            raise _unauthorized()
+        claims = verify_jwt(token, key, [algorithm])
+    else:
+        claims = verify_jwt(token)
+
+    verified_tokens.put(token, claims)
+    return claims
@@ -0,0 +1,99 @@
+"""
+Benchmarks calendar discovery against a mocked Graph transport.
+
+Every Graph call sleeps for --latency seconds. The mocked tenant has
+--groups calendar groups and --office-groups Office 365 groups, so a
+sequential walk costs (4 + groups + office_groups) round-trips. The run
+with fan-out concurrency 1 and the default run must return identical
+calendars; only the wall time should differ.
+
+    python -m backend.benchmarks.calendar_discovery --groups 10 --office-groups 15 --latency 0.05
+"""
+import io
+import time
+import asyncio
+import argparse
+import contextlib
+import httpx
+from backend.MSIGraph.calendars import discover_calendars
+from backend.settings import get_settings
+
+USER_EMAIL = "partner@firm.example"
+
+
+def fake_graph(groups: int, office_groups: int, latency: float):
+    calendar_groups = [{"id": "my-calendars", "name": "My Calendars"}] + [
+        {"id": f"cg{i}", "name": f"Team {i}"} for i in range(groups)
+    ]
+    unified_groups = [{"id": f"og{i}", "displayName": f"Practice group {i}"} for i in range(office_groups)]
+    my_calendars = [
+        {"id": "cal-personal", "name": "Calendar", "owner": {"name": "Partner", "address": USER_EMAIL}},
+        {"id": "cal-shared", "name": "Associate", "owner": {"name": "Associate", "address": "associate@firm.example"}},
+        {"id": "cal-noowner", "name": "clerk@firm.example", "owner": None},
+    ]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        path = request.url.path.removeprefix("/v1.0")
+        if path == "/me/calendars":
+            return httpx.Response(200, json={"value": my_calendars})
+        if path == "/me":
+            return httpx.Response(200, json={"mail": USER_EMAIL})
+        if path == "/me/calendarGroups":
+            return httpx.Response(200, json={"value": calendar_groups})
+        if path.startswith("/me/calendarGroups/"):
+            group_id = path.split("/")[3]
+            # Every group also lists the shared calendar, which must be de-duplicated
+            return httpx.Response(200, json={"value": [
+                {"id": f"{group_id}-cal", "name": f"{group_id} calendar"},
+                {"id": "cal-shared", "name": "Associate"},
+            ]})
+        if path == "/me/memberOf":
+            return httpx.Response(200, json={"value": unified_groups})
+        if path.startswith("/groups/"):
+            group_id = path.split("/")[2]
+            if group_id == "og0":
+                return httpx.Response(404, json={})
+            # og1 resolves to a calendar already found through a calendar group
+            calendar_id = "cg0-cal" if group_id == "og1" else f"{group_id}-cal"
+            return httpx.Response(200, json={"id": calendar_id, "name": f"{group_id} calendar"})
+        return httpx.Response(404, json={})
+
+    return httpx.MockTransport(handler)
+
+
+async def timed_discovery(transport, concurrency: int):
+    async with httpx.AsyncClient(transport=transport) as client:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            calendars = await discover_calendars(client, {}, {"email": USER_EMAIL}, concurrency=concurrency)
+        return time.perf_counter() - started, calendars
+
+
+async def run(groups: int, office_groups: int, latency: float):
+    transport = fake_graph(groups, office_groups, latency)
+    serial_time, serial_calendars = await timed_discovery(transport, concurrency=1)
+    concurrency = get_settings().graph_fanout_concurrency
+    fanout_time, fanout_calendars = await timed_discovery(transport, concurrency=concurrency)
+    if serial_calendars != fanout_calendars:
+        raise SystemExit("Concurrent discovery returned different calendars")
+
+    sequential_estimate = (4 + groups + office_groups) * latency
+    print(f"{groups} calendar groups, {office_groups} Office 365 groups, {latency * 1000:.0f}ms per Graph call")
+    print(f"  sequential walk (estimated):   {sequential_estimate:.3f}s")
+    print(f"  fan-out concurrency 1:         {serial_time:.3f}s")
+    print(f"  fan-out concurrency {concurrency}:         {fanout_time:.3f}s")
+    print(f"  calendars found: {len(fanout_calendars)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--office-groups", type=int, default=15)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(run(args.groups, args.office_groups, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Calendar change notifications end to end: the app is served over HTTP on
+127.0.0.1, FakeGraph stands in for Graph (and posts notifications back to
+the app like Graph does), FakeSupabase for the ms_tokens table. A dashboard
+opens the live stream and subscribes to a calendar; each change made in the
+fake should arrive on the stream as an event_change, with no polling.
+
+Also checks the validationToken handshake, that a wrong clientState is
+ignored, lifecycle notifications, renewal of subscriptions with a listener
+and cleanup of those without, and the status push on disconnect.
+
+    python -m backend.benchmarks.change_notifications --changes 50 --graph-latency 0.02
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import datetime
+import tempfile
+import statistics
+
+from .fake_graph import FakeGraph
+from .fake_services import FakeSupabase, LocalServers
+
+JWT_SECRET = "benchmark-secret"
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+    print(f"  ok: {message}")
+
+
+def listening_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+async def read_stream(response, messages: asyncio.Queue) -> None:
+    """Parse server-sent events into (received_at, event, data) tuples."""
+    event = None
+    async for line in response.aiter_lines():
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            await messages.put((time.perf_counter(), event, json.loads(line[len("data: "):])))
+
+
+async def next_message(messages: asyncio.Queue, kind: str, timeout: float = 5.0, **match) -> tuple:
+    """The next message of type `kind` whose data contains `match`; others are skipped."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        received_at, event, data = await asyncio.wait_for(messages.get(), max(0.01, deadline - time.perf_counter()))
+        if event == kind and all(data.get(k) == v for k, v in match.items()):
+            return received_at, data
+
+
+async def run(changes: int, graph_latency: float) -> None:
+    supabase = FakeSupabase()
+    servers = LocalServers(supabase=supabase.app)
+    servers.start()
+    app_socket = listening_socket()
+    app_url = "http://127.0.0.1:%d" % app_socket.getsockname()[1]
+
+    # Read at import time by the backend
+    os.environ["SUPABASE_URL"] = servers.url("supabase")
+    os.environ["SUPABASE_SERVICE_KEY"] = "benchmark"
+    os.environ["SUPABASE_JWT_SECRET"] = JWT_SECRET
+    os.environ["JOB_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "jobs.sqlite3")
+    os.environ["GRAPH_NOTIFICATION_URL"] = app_url + "/api/msgraph/notifications"
+    os.environ["GRAPH_SUBSCRIPTION_CHECK_INTERVAL"] = "0.1"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    import httpx
+    import uvicorn
+    from jose import jwt
+    from backend.main import app
+    from backend.MSIGraph.graph_client import graph_url, create_graph_client
+    from backend.MSIGraph.subscriptions import subscriptions
+
+    fake = FakeGraph(base_url=graph_url(), latency=graph_latency)
+    now = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    fake.add_event("cal-0", "Status conference", now + datetime.timedelta(days=1))
+
+    users = {}
+    for name in ("dashboard", "idle"):
+        user_id = str(uuid.uuid4())
+        supabase.tables["ms_tokens"].append({
+            "user_id": user_id, "access_token": f"fake-access-{name}", "refresh_token": None,
+            "expires_at": (datetime.datetime.utcnow() + datetime.timedelta(hours=2)).isoformat(),
+        })
+        exp = int(time.time()) + 3600
+        token = jwt.encode({"sub": user_id, "exp": exp}, JWT_SECRET, algorithm="HS256")
+        users[name] = (user_id, token, {"Authorization": f"Bearer {token}"})
+    user_id, token, auth = users["dashboard"]
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False, timeout_graceful_shutdown=1))
+    serving = asyncio.create_task(server.serve(sockets=[app_socket]))
+    while not server.started:
+        await asyncio.sleep(0.01)
+    await app.state.graph_client.aclose()
+    app.state.graph_client = create_graph_client(transport=httpx.ASGITransport(app=fake.app))
+
+    latencies = []
+    try:
+        async with httpx.AsyncClient(base_url=app_url, timeout=10) as client:
+            messages = asyncio.Queue()
+            async with client.stream("GET", "/api/msgraph/notifications/stream", params={"access_token": token}) as stream:
+                reader = asyncio.create_task(read_stream(stream, messages))
+                _, status = await next_message(messages, "status")
+                check(status["connected"] is True, "the stream opens with the Microsoft connection status")
+
+                before = (await client.post("/api/msgraph/calendar-events", json={"calendar_id": "cal-0", "sync": "delta"}, headers=auth)).json()
+                subscribed = (await client.post("/api/msgraph/subscriptions", json={"calendar_id": "cal-0"}, headers=auth)).json()
+                check(subscribed["subscribed"] and len(fake.subscriptions) == 1,
+                      "subscribing creates a Graph subscription after the validationToken handshake")
+                again = (await client.post("/api/msgraph/subscriptions", json={"calendar_id": "cal-0"}, headers=auth)).json()
+                check(again["subscribed"] and len(fake.subscriptions) == 1, "subscribing again reuses the subscription")
+                subscription_id = next(iter(fake.subscriptions))
+
+                forged = await client.post("/api/msgraph/notifications", json={"value": [{
+                    "subscriptionId": subscription_id, "clientState": "guess", "changeType": "created",
+                    "resourceData": {"id": "forged"}}]})
+                fake.add_event("cal-0", "Hearing", now + datetime.timedelta(days=2))
+                _, first = await next_message(messages, "event_change")
+                check(forged.status_code == 202 and first["eventId"] != "forged" and subscriptions.metrics["rejected"] == 1,
+                      "a notification with the wrong clientState is acknowledged but not delivered")
+                after = (await client.post("/api/msgraph/calendar-events", json={"calendar_id": "cal-0", "sync": "delta"}, headers=auth)).json()
+                check(after["total"] == before["total"] + 1, "a notification makes the next read pick up the change right away")
+
+                for i in range(changes):
+                    started = time.perf_counter()
+                    event_id = fake.add_event("cal-0", f"Deposition {i}", now + datetime.timedelta(days=3, hours=i))
+                    received_at, _ = await next_message(messages, "event_change", eventId=event_id)
+                    latencies.append(received_at - started)
+                fake.delete_event("cal-0", event_id)
+                _, deleted = await next_message(messages, "event_change", eventId=event_id)
+                check(deleted["changeType"] == "deleted" and deleted["calendarId"] == "cal-0",
+                      f"{changes} created events and a deletion arrive on the stream")
+
+                fake.send_lifecycle(subscription_id, "missed")
+                await next_message(messages, "resync", calendarId="cal-0")
+                check(True, "a missed lifecycle notification asks the dashboard to resync")
+                fake.send_lifecycle(subscription_id, "reauthorizationRequired")
+                await fake.drain_notifications()
+                while not fake.subscriptions[subscription_id].get("renewed"):
+                    await asyncio.sleep(0.01)
+                check(True, "reauthorizationRequired renews the subscription")
+                fake.send_lifecycle(subscription_id, "subscriptionRemoved")
+                await fake.drain_notifications()
+                while not fake.subscriptions:
+                    await asyncio.sleep(0.01)
+                subscription_id = next(iter(fake.subscriptions))
+                check(True, "a removed subscription is recreated while the dashboard is connected")
+
+                idle_id, _, idle_auth = users["idle"]
+                await client.post("/api/msgraph/subscriptions", json={"calendar_id": "cal-0"}, headers=idle_auth)
+                check(len(fake.subscriptions) == 2, "a second user without a stream subscribes")
+                # Make every subscription due for renewal on the next check
+                subscriptions.renew_margin = datetime.timedelta(days=30)
+                while len(fake.subscriptions) != 1 or not fake.subscriptions.get(subscription_id, {}).get("renewed"):
+                    await asyncio.sleep(0.01)
+                subscriptions.renew_margin = datetime.timedelta(hours=6)
+                check(subscription_id in fake.subscriptions, "renewal keeps subscriptions with a listener and deletes the idle user's")
+
+                await client.post("/api/msgraph/disconnect", headers=auth)
+                _, status = await next_message(messages, "status")
+                check(status["connected"] is False and not fake.subscriptions,
+                      "disconnecting pushes the new status and deletes the subscriptions")
+                reader.cancel()
+            expired = await client.get("/api/msgraph/notifications/stream", params={"access_token": "not-a-jwt"})
+            check(expired.status_code == 401, "the stream requires a valid token")
+    finally:
+        server.should_exit = True
+        await serving
+        servers.stop()
+
+    print(f"{changes} changes, Graph latency {graph_latency * 1000:.0f}ms: change in Graph -> message on the dashboard stream")
+    print(f"  p50 {statistics.median(latencies) * 1000:.1f}ms  max {max(latencies) * 1000:.1f}ms"
+          f"  ({fake.notifications_sent} notifications delivered, {fake.notification_failures} failed)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--changes", type=int, default=50)
+    parser.add_argument("--graph-latency", type=float, default=0.02)
+    args = parser.parse_args()
+    asyncio.run(run(args.changes, args.graph_latency))
+
+
+if __name__ == "__main__":
+    main()
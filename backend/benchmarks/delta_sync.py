@@ -0,0 +1,129 @@
+"""
+Exercises incremental event sync against the local Graph stand-in.
+
+Seeds a calendar with more events than fit on one Graph page, then checks
+that /api/msgraph/calendar-events returns every event in the window, that
+sync="delta" serves the same result from the local store, that later
+changes are applied from the delta link alone, and that an expired delta
+token falls back to a full sync.
+
+    python -m backend.benchmarks.delta_sync --events 300
+"""
+import os
+import io
+import time
+import uuid
+import asyncio
+import argparse
+import datetime
+import contextlib
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-secret")
+
+import httpx
+from jose import jwt
+from backend.MSIGraph.graph_client import graph_url
+from backend.MSIGraph.token_cache import token_cache
+from backend.MSIGraph.event_store import event_store
+from .fake_graph import FakeGraph
+
+CALENDAR_ID = "cal-1"
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+    print(f"  ok: {message}")
+
+
+async def run(event_count: int) -> None:
+    from backend.main import app
+
+    fake = FakeGraph(base_url=graph_url())
+    now = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    for i in range(event_count):
+        fake.add_event(CALENDAR_ID, f"Event {i}", now + datetime.timedelta(hours=6 * i + 1))
+
+    user_id = str(uuid.uuid4())
+    token_cache.store(user_id, "fake-access-token", None, (now + datetime.timedelta(days=1)).isoformat())
+    auth = {"Authorization": "Bearer " + jwt.encode({"sub": user_id}, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")}
+
+    async with app.router.lifespan_context(app):
+        await app.state.graph_client.aclose()
+        app.state.graph_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+
+            async def events(**body):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    response = await client.post("/api/msgraph/calendar-events", json={"calendar_id": CALENDAR_ID, **body}, headers=auth)
+                response.raise_for_status()
+                return [e["id"] for e in response.json()["events"]]
+
+            def expected():
+                end = now + datetime.timedelta(days=30)
+                return [e["id"] for e in sorted(fake.calendars[CALENDAR_ID].values(), key=lambda e: e["start"]["dateTime"])
+                        if now <= datetime.datetime.fromisoformat(e["start"]["dateTime"][:19]) <= end]
+
+            print(f"{event_count} events seeded, {len(expected())} in the default 30-day window")
+            windowed = await events(start=now.isoformat())
+            check(windowed == expected(), f"windowed fetch pages through all {len(windowed)} events")
+
+            fake.requests.clear()
+            started = time.perf_counter()
+            synced = await events(sync="delta", start=now.isoformat())
+            full_time = time.perf_counter() - started
+            full_requests = sum(fake.requests.values())
+            check(synced == expected(), f"initial delta sync matches ({full_requests} Graph requests, {full_time * 1000:.1f}ms)")
+
+            fake.requests.clear()
+            cached = await events(sync="delta", start=now.isoformat())
+            check(cached == synced and sum(fake.requests.values()) == 0, "repeat read is served from the local store")
+
+            ids = list(fake.calendars[CALENDAR_ID])
+            fake.delete_event(CALENDAR_ID, ids[0])
+            fake.update_event(CALENDAR_ID, ids[1], subject="Rescheduled")
+            fake.add_event(CALENDAR_ID, "New hearing", now + datetime.timedelta(days=2, minutes=30))
+
+            fake.requests.clear()
+            started = time.perf_counter()
+            incremental = await events(sync="delta", start=now.isoformat(), force_sync=True)
+            delta_time = time.perf_counter() - started
+            check(incremental == expected(), f"changes applied from the delta link ({sum(fake.requests.values())} Graph request, {delta_time * 1000:.1f}ms)")
+
+            later = (now + datetime.timedelta(days=300)).isoformat()
+            fake.requests.clear()
+            await events(sync="delta", start=now.isoformat(), end=later)
+            check(sum(fake.requests.values()) >= 1, "a range outside the synced window triggers a wider full sync")
+
+            state = event_store.cached_state(user_id, CALENDAR_ID)
+            wide_end = state.window_end
+            before = (now - datetime.timedelta(days=300)).isoformat()
+            await events(sync="delta", start=before, end=(now - datetime.timedelta(days=250)).isoformat())
+            check(state.window_end < wide_end, f"the synced window starts over instead of growing past {event_store.max_days} days")
+            fake.requests.clear()
+            for start, end in ((now - datetime.timedelta(days=20 * 365), now), (now, now + datetime.timedelta(days=20 * 365))):
+                try:
+                    await events(sync="delta", start=start.isoformat(), end=end.isoformat())
+                    check(False, "a range more than a year from today is rejected")
+                except httpx.HTTPStatusError as e:
+                    check(e.response.status_code == 400 and not fake.requests, "a range more than a year from today is rejected")
+
+            fake.expire_delta_tokens()
+            fake.add_event(CALENDAR_ID, "After expiry", now + datetime.timedelta(days=3))
+            recovered = await events(sync="delta", start=now.isoformat(), force_sync=True)
+            check(recovered == expected(), "expired delta token falls back to a full sync")
+            print(f"  store: {event_store.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(run(args.events))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Event and calendar payloads: checks the cached date labels against the old
+per-event strftime formatting, then compares the /api/msgraph/calendar-events
+response before this change (full Graph dicts, FastAPI's default encoder) with
+the compact one (trimmed events, orjson, gzip) for an agenda of --events
+events, with and without a field projection.
+
+    python -m backend.benchmarks.event_payloads --events 500
+"""
+import os
+import io
+import time
+import uuid
+import gzip
+import random
+import asyncio
+import argparse
+import datetime
+import tempfile
+import statistics
+import contextlib
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-secret")
+os.environ.setdefault("JOB_DB_PATH", os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
+
+import httpx
+from jose import jwt
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from backend import responses
+from backend.MSIGraph.graph_client import graph_url
+from backend.MSIGraph.token_cache import token_cache
+from backend.MSIGraph.events import enrich_event, compact_event, select_fields, parse_graph_datetime, RESPONSE_FIELDS
+from .fake_graph import FakeGraph
+
+DASHBOARD_FIELDS = ["subject", "start", "end", "location", "isAllDay", "formattedStartDate", "formattedStartTime", "formattedEndTime"]
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+    print(f"  ok: {message}")
+
+
+def enrich_event_before(event: dict) -> dict:
+    """enrich_event as it was: a datetime parse and strftime calls per event."""
+    if event.get("start"):
+        start_dt = parse_graph_datetime(event["start"]["dateTime"])
+        event["formattedStartDate"] = start_dt.strftime("%B %d, %Y")
+        event["formattedStartTime"] = start_dt.strftime("%I:%M %p") if not event.get("isAllDay") else "All day"
+    if event.get("end"):
+        end_dt = parse_graph_datetime(event["end"]["dateTime"])
+        event["formattedEndTime"] = end_dt.strftime("%I:%M %p") if not event.get("isAllDay") else "All day"
+    return event
+
+
+def response_before(events: list) -> bytes:
+    """What the route did with the Graph events: enrich in place, then FastAPI's encoder and JSONResponse."""
+    for event in events:
+        enrich_event_before(event)
+    return JSONResponse(jsonable_encoder({"events": events, "total": len(events)})).body
+
+
+def response_after(events: list, fields=RESPONSE_FIELDS) -> bytes:
+    for event in events:
+        enrich_event(event)
+    return responses.CompactJSONResponse({"events": [compact_event(e, fields) for e in events], "total": len(events)},
+                                         accept_encoding="gzip").body
+
+
+def graph_event(rng: random.Random, i: int, start: datetime.datetime) -> dict:
+    """An event as Graph returns it for the $select the route asks for."""
+    name = rng.choice(["Court Registry", "Chambers", "Boardroom 4", ""])
+    return {
+        "@odata.etag": f'W/"{uuid.uuid4().hex}"',
+        "location": {"displayName": name, "locationType": "default", "uniqueId": name, "uniqueIdType": "private",
+                     "address": {}, "coordinates": {}},
+        "organizer": {"emailAddress": {"name": "Jordan Lee", "address": "jordan.lee@example.com"}},
+        "bodyPreview": "" if i % 3 else "Bring the bundle of documents and the expert report. " * 3,
+        "webLink": f"https://outlook.office365.com/owa/?itemid=AAMkAD{uuid.uuid4().hex * 3}&exvsurl=1&path=/calendar/item",
+        "categories": [] if i % 4 else ["Trial"],
+        "showAs": "busy",
+        "isAllDay": i % 10 == 0,
+    }
+
+
+def verify_labels(rng: random.Random) -> None:
+    values = []
+    for _ in range(5000):
+        moment = datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=rng.randrange(10 * 365 * 24 * 60))
+        values.append(moment.strftime("%Y-%m-%dT%H:%M:%S.0000000"))
+        values.append(moment.strftime("%Y-%m-%dT%H:%M:%S") + rng.choice(["Z", "+02:00", "-08:00", ".5", ""]))
+    for i, value in enumerate(values):
+        event = {"start": {"dateTime": value}, "end": {"dateTime": value}, "isAllDay": i % 7 == 0}
+        expected = enrich_event_before(dict(event))
+        if enrich_event(dict(event)) != expected:
+            raise SystemExit(f"FAILED: labels for {value!r} differ from strftime: {enrich_event(dict(event))} != {expected}")
+    check(True, f"{len(values)} start/end labels match the per-event strftime output, with and without offsets")
+
+    started = time.perf_counter()
+    for value in values:
+        enrich_event_before({"start": {"dateTime": value}, "end": {"dateTime": value}})
+    before = time.perf_counter() - started
+    started = time.perf_counter()
+    for value in values:
+        enrich_event({"start": {"dateTime": value}, "end": {"dateTime": value}})
+    after = time.perf_counter() - started
+    print(f"  enrich_event: {before / len(values) * 1e6:.1f}us -> {after / len(values) * 1e6:.1f}us per event")
+
+
+def verify_projection() -> None:
+    fields, select = select_fields(["subject", "formattedStartTime"])
+    check(fields == ("id", "subject", "formattedStartTime") and select == "id,subject,start,isAllDay",
+          "a projection asks Graph only for the fields it needs, derived ones included")
+    check(select_fields("subject, webLink")[1] == "id,subject,webLink", "fields can be a comma-separated string")
+    try:
+        select_fields(["subject", "attendees"])
+        check(False, "an unknown field is rejected")
+    except ValueError:
+        check(True, "an unknown field is rejected")
+    compact = compact_event({"id": "1", "subject": "", "bodyPreview": None, "categories": [], "isAllDay": False,
+                             "location": {"displayName": "", "address": {}}, "@odata.etag": "x"})
+    check(compact == {"id": "1", "isAllDay": False}, "empty values and annotations are left out, false is kept")
+
+
+def time_serialization(rng: random.Random, count: int, runs: int) -> None:
+    start = datetime.datetime(2026, 3, 2, 8)
+    events = []
+    for i in range(count):
+        moment = start + datetime.timedelta(minutes=30 * rng.randrange(24 * 60))
+        events.append({"id": str(uuid.uuid4()), "subject": f"Hearing {i}: Smith v. Jones",
+                       "start": {"dateTime": moment.strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": "UTC"},
+                       "end": {"dateTime": (moment + datetime.timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": "UTC"},
+                       **graph_event(rng, i, moment)})
+
+    def best(build) -> tuple:
+        timings, body = [], b""
+        for _ in range(runs):
+            copies = [{**event} for event in events]
+            started = time.process_time()
+            body = build(copies)
+            timings.append(time.process_time() - started)
+        return statistics.median(timings), body
+
+    before_cpu, before_body = best(response_before)
+    after_cpu, after_body = best(response_after)
+    fields = select_fields(DASHBOARD_FIELDS)[0]
+    projected_cpu, projected_body = best(lambda copies: response_after(copies, fields))
+    print(f"{count} events, serialized per response (median of {runs}):")
+    print(f"  before: {len(before_body) / 1024:7.1f} KiB  {before_cpu * 1000:6.2f}ms CPU")
+    print(f"  after:  {len(after_body) / 1024:7.1f} KiB  {after_cpu * 1000:6.2f}ms CPU  "
+          f"({len(gzip.decompress(after_body)) / 1024:.1f} KiB before gzip, JSON via {'orjson' if responses.orjson else 'json'})")
+    print(f"  fields={','.join(DASHBOARD_FIELDS)}: {len(projected_body) / 1024:.1f} KiB  {projected_cpu * 1000:.2f}ms CPU")
+    check(len(after_body) * 4 < len(before_body), "the compressed compact payload is under a quarter of the old size")
+    check(after_cpu < before_cpu, "and takes less CPU to build")
+
+
+async def check_endpoint(count: int) -> None:
+    from backend.main import app
+
+    fake = FakeGraph(base_url=graph_url())
+    rng = random.Random(2)
+    now = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    for i in range(count):
+        moment = now + datetime.timedelta(hours=1 + rng.randrange(29 * 24))
+        fake.add_event("agenda", f"Hearing {i}", moment, **graph_event(rng, i, moment))
+
+    user_id = str(uuid.uuid4())
+    token_cache.store(user_id, "fake-access-token", None, (datetime.datetime.utcnow() + datetime.timedelta(days=1)).isoformat())
+    auth = {"Authorization": "Bearer " + jwt.encode({"sub": user_id}, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")}
+
+    async with app.router.lifespan_context(app):
+        await app.state.graph_client.aclose()
+        app.state.graph_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+
+            async def events(body: dict, encoding: str = "gzip") -> httpx.Response:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    return await client.post("/api/msgraph/calendar-events", json={"calendar_id": "agenda", **body},
+                                             headers={**auth, "Accept-Encoding": encoding})
+
+            full = await events({})
+            check(full.status_code == 200 and full.json()["total"] == count, f"all {count} events are returned")
+            check(full.headers.get("content-encoding") == "gzip", "the response is gzip-compressed when accepted")
+            plain = await events({}, encoding="identity")
+            check("content-encoding" not in plain.headers and plain.json() == full.json(), "and sent as is otherwise")
+            event = full.json()["events"][0]
+            check(not any(key.startswith("@odata") for key in event) and set(event.get("location", {})) <= {"displayName"},
+                  "events carry no @odata annotations or location details")
+            check(event["formattedStartDate"] == enrich_event_before({"start": event["start"]})["formattedStartDate"],
+                  "the formatted labels are unchanged")
+
+            projected = await events({"fields": DASHBOARD_FIELDS})
+            check(all(set(e) <= {"id", *DASHBOARD_FIELDS} for e in projected.json()["events"]), "a projection returns only those fields")
+            delta = await events({"fields": DASHBOARD_FIELDS, "sync": "delta"})
+            by_id = lambda response: sorted(response.json()["events"], key=lambda e: e["id"])
+            check(by_id(delta) == by_id(projected), "delta mode projects the same fields from the event store")
+            bad = await events({"fields": ["attendees"]})
+            check(bad.status_code == 400, "an unknown field is rejected")
+
+            for label, body in (("all fields", {}), ("dashboard fields", {"fields": DASHBOARD_FIELDS})):
+                timings, wire = [], 0
+                for _ in range(10):
+                    started = time.perf_counter()
+                    response = await events(body)
+                    timings.append(time.perf_counter() - started)
+                    wire = response.num_bytes_downloaded
+                print(f"  calendar-events, {label}: {wire / 1024:.1f} KiB on the wire, p50 {statistics.median(timings) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    verify_labels(rng)
+    verify_projection()
+    time_serialization(rng, args.events, args.runs)
+    asyncio.run(check_endpoint(args.events))
+
+
+if __name__ == "__main__":
+    main()
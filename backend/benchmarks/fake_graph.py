@@ -0,0 +1,382 @@
+"""
+In-process stand-in for the parts of Microsoft Graph the backend uses.
+
+Point the backend's shared client at it with an httpx.ASGITransport:
+
+    fake = FakeGraph()
+    app.state.graph_client = create_graph_client(transport=httpx.ASGITransport(app=fake.app))
+
+(create_graph_client keeps the throttling scheduler in front of the fake; a
+plain httpx.AsyncClient over the same transport bypasses it.)
+
+Change-notification subscriptions (POST /subscriptions) are validated and
+delivered like Graph does: the notificationUrl must echo a validationToken,
+then every change to a subscribed calendar is POSTed to it with the
+subscription's clientState. Deliveries go through notification_client
+(a plain httpx.AsyncClient unless replaced); await drain_notifications()
+to wait for them.
+
+MS_GRAPH_URL must match fake.base_url (the default, https://graph.microsoft.com/v1.0,
+works because the transport never leaves the process).
+"""
+import re
+import uuid
+import random
+import asyncio
+import datetime
+from collections import Counter
+from typing import Optional
+import httpx
+from urllib.parse import urlencode
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+DEFAULT_PAGE_SIZE = 10
+
+
+def _parse(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value.replace("Z", "")[:19])
+
+
+def _graph_datetime(value: datetime.datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.0000000")
+
+
+class FakeGraph:
+    def __init__(self, base_url: str = "https://graph.microsoft.com/v1.0", latency: float = 0.0):
+        self.base_url = base_url.rstrip("/")
+        self.latency = latency
+        # calendar id -> event id -> event
+        self.calendars: dict = {}
+        # Change log: (sequence, calendar id, event id)
+        self.changes: list = []
+        self.sequence = 0
+        # Delta tokens issued before this sequence number answer 410 Gone
+        self.expired_before = 0
+        # Extra per-calendar latency, to model one slow mailbox
+        self.calendar_latency: dict = {}
+        self.requests = Counter()
+        # Throttling: more than mailbox_limit concurrent requests with the same
+        # Authorization get 429 (like Outlook, each request inside a $batch
+        # counts), and each $batch request is throttled with probability
+        # batch_throttle_rate; both answer Retry-After: retry_after
+        self.mailbox_limit = None
+        self.batch_throttle_rate = 0.0
+        self.retry_after = 1.0
+        self.throttled = 0
+        self.in_flight = Counter()
+        self.random = random.Random(0)
+        # Creating events in these calendars answers 404, like a deleted calendar
+        self.missing_calendars: set = set()
+        # Fault injection for load tests: a fraction of all requests answer
+        # 500, and another fraction 429 with Retry-After: retry_after
+        self.failure_rate = 0.0
+        self.throttle_rate = 0.0
+        self.failed = 0
+        # Calendar discovery: every mailbox sees the same calendars, calendar
+        # groups (id -> (name, calendars)) and Office 365 groups (id -> (name, calendar))
+        self.mail = "user@firm.example"
+        self.calendar_list: list = []
+        self.calendar_groups: dict = {}
+        self.office_groups: dict = {}
+        # Change notifications: subscription id -> subscription, and delivery state
+        self.subscriptions: dict = {}
+        self.notification_client: Optional[httpx.AsyncClient] = None
+        self.notifications_sent = 0
+        self.notification_failures = 0
+        self._deliveries: set = set()
+        self.app = self._build_app()
+
+    # Test-side mutations
+
+    def _record(self, calendar_id: str, event_id: str, change_type: str = "updated") -> None:
+        self.sequence += 1
+        self.changes.append((self.sequence, calendar_id, event_id))
+        resource = f"me/calendars/{calendar_id}/events"
+        for subscription in list(self.subscriptions.values()):
+            if subscription["resource"] == resource and change_type in subscription["changeType"].split(","):
+                self._deliver(subscription["notificationUrl"], {
+                    "subscriptionId": subscription["id"],
+                    "clientState": subscription.get("clientState"),
+                    "changeType": change_type,
+                    "resource": f"Users/fake-user/Events/{event_id}",
+                    "resourceData": {"@odata.type": "#Microsoft.Graph.Event", "id": event_id},
+                    "subscriptionExpirationDateTime": subscription["expirationDateTime"],
+                    "tenantId": "fake-tenant",
+                })
+
+    def send_lifecycle(self, subscription_id: str, lifecycle_event: str) -> None:
+        """Post a lifecycle notification (reauthorizationRequired, subscriptionRemoved, missed)."""
+        subscription = self.subscriptions[subscription_id]
+        if lifecycle_event == "subscriptionRemoved":
+            del self.subscriptions[subscription_id]
+        self._deliver(subscription.get("lifecycleNotificationUrl") or subscription["notificationUrl"], {
+            "subscriptionId": subscription_id,
+            "clientState": subscription.get("clientState"),
+            "lifecycleEvent": lifecycle_event,
+            "subscriptionExpirationDateTime": subscription["expirationDateTime"],
+        })
+
+    def _client(self) -> httpx.AsyncClient:
+        if self.notification_client is None:
+            self.notification_client = httpx.AsyncClient(timeout=10)
+        return self.notification_client
+
+    def _deliver(self, url: str, notification: dict) -> None:
+        async def post():
+            try:
+                response = await self._client().post(url, json={"value": [notification]})
+                if response.status_code >= 300:
+                    raise httpx.HTTPStatusError(str(response.status_code), request=response.request, response=response)
+                self.notifications_sent += 1
+            except httpx.HTTPError:
+                self.notification_failures += 1
+
+        task = asyncio.ensure_future(post())
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    async def drain_notifications(self) -> None:
+        while self._deliveries:
+            await asyncio.gather(*list(self._deliveries))
+
+    def add_event(self, calendar_id: str, subject: str, start: datetime.datetime, duration: datetime.timedelta = datetime.timedelta(hours=1), **fields) -> str:
+        event_id = fields.pop("id", None) or str(uuid.uuid4())
+        self.calendars.setdefault(calendar_id, {})[event_id] = {
+            "id": event_id,
+            "subject": subject,
+            "start": {"dateTime": _graph_datetime(start), "timeZone": "UTC"},
+            "end": {"dateTime": _graph_datetime(start + duration), "timeZone": "UTC"},
+            "isAllDay": False,
+            "bodyPreview": "",
+            "categories": [],
+            **fields,
+        }
+        self._record(calendar_id, event_id, "created")
+        return event_id
+
+    def update_event(self, calendar_id: str, event_id: str, **fields) -> None:
+        self.calendars[calendar_id][event_id].update(fields)
+        self._record(calendar_id, event_id)
+
+    def delete_event(self, calendar_id: str, event_id: str) -> None:
+        del self.calendars[calendar_id][event_id]
+        self._record(calendar_id, event_id, "deleted")
+
+    def add_calendar(self, calendar_id: str, name: str, owner: str = None, group: str = None) -> None:
+        """List a calendar in /me/calendars, or under calendar group `group`."""
+        calendar = {"id": calendar_id, "name": name, "owner": {"name": name, "address": owner or self.mail},
+                    "isDefaultCalendar": False, "canEdit": True, "canShare": True, "canViewPrivateItems": True}
+        if group is None:
+            self.calendar_list.append(calendar)
+        else:
+            self.calendar_groups.setdefault(group, (group, []))[1].append(calendar)
+        self.calendars.setdefault(calendar_id, {})
+
+    def add_office_group(self, group_id: str, name: str) -> None:
+        self.office_groups[group_id] = (name, {"id": f"{group_id}-calendar", "name": name, "isDefaultCalendar": False,
+                                               "owner": {"name": name, "address": f"{group_id}@firm.example"}})
+
+    def expire_delta_tokens(self) -> None:
+        self.expired_before = self.sequence + 1
+
+    def _create(self, calendar_id: str, body: dict) -> dict:
+        event = {"isAllDay": False, "bodyPreview": "", "categories": [], **body, "id": str(uuid.uuid4())}
+        self.calendars.setdefault(calendar_id, {})[event["id"]] = event
+        self._record(calendar_id, event["id"], "created")
+        return event
+
+    def _throttled(self) -> dict:
+        self.throttled += 1
+        return {"error": {"code": "ApplicationThrottled", "message": "Application is over its MailboxConcurrency limit."}}
+
+    # Graph surface
+
+    def _in_window(self, event: dict, start: datetime.datetime, end: datetime.datetime) -> bool:
+        return _parse(event["start"]["dateTime"]) < end and _parse(event["end"]["dateTime"]) > start
+
+    def _page(self, request: Request, items: list, link_params: dict, final_link: str) -> dict:
+        prefer = request.headers.get("Prefer", "")
+        match = re.search(r"odata\.maxpagesize=(\d+)", prefer)
+        page_size = int(match.group(1)) if match else DEFAULT_PAGE_SIZE
+        offset = int(request.query_params.get("$skiptoken", "0"))
+        page = {"value": items[offset:offset + page_size]}
+        if offset + page_size < len(items):
+            page["@odata.nextLink"] = f"{request.url.scheme}://{request.url.netloc}{request.url.path}?" + urlencode({**link_params, "$skiptoken": offset + page_size})
+        else:
+            page["@odata.deltaLink"] = final_link
+        return page
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+        prefix = "/" + self.base_url.split("/", 3)[3] if self.base_url.count("/") >= 3 else ""
+
+        @app.middleware("http")
+        async def count_and_delay(request: Request, call_next):
+            self.requests[request.url.path] += 1
+            mailbox = request.headers.get("Authorization", "")
+            self.in_flight[mailbox] += 1
+            try:
+                if self.mailbox_limit and self.in_flight[mailbox] > self.mailbox_limit:
+                    return JSONResponse(self._throttled(), status_code=429, headers={"Retry-After": str(self.retry_after)})
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if self.throttle_rate and self.random.random() < self.throttle_rate:
+                    return JSONResponse(self._throttled(), status_code=429, headers={"Retry-After": str(self.retry_after)})
+                if self.failure_rate and self.random.random() < self.failure_rate:
+                    self.failed += 1
+                    return JSONResponse({"error": {"code": "generalException", "message": "Injected failure."}}, status_code=500)
+                return await call_next(request)
+            finally:
+                self.in_flight[mailbox] -= 1
+
+        @app.post(prefix + "/subscriptions")
+        async def create_subscription(request: Request):
+            body = await request.json()
+            missing = [f for f in ("changeType", "notificationUrl", "resource", "expirationDateTime") if not body.get(f)]
+            if missing:
+                return JSONResponse({"error": {"code": "InvalidRequest", "message": f"Missing {', '.join(missing)}"}}, status_code=400)
+            # Graph checks the endpoint before creating the subscription
+            token = str(uuid.uuid4())
+            try:
+                response = await self._client().post(body["notificationUrl"], params={"validationToken": token})
+                valid = response.status_code == 200 and response.text == token
+            except httpx.HTTPError:
+                valid = False
+            if not valid:
+                return JSONResponse({"error": {"code": "ValidationError", "message": "Subscription validation request failed."}}, status_code=400)
+            subscription = {**body, "id": str(uuid.uuid4())}
+            self.subscriptions[subscription["id"]] = subscription
+            return JSONResponse(subscription, status_code=201)
+
+        @app.patch(prefix + "/subscriptions/{subscription_id}")
+        async def renew_subscription(subscription_id: str, request: Request):
+            if subscription_id not in self.subscriptions:
+                return JSONResponse({"error": {"code": "ResourceNotFound"}}, status_code=404)
+            self.subscriptions[subscription_id]["expirationDateTime"] = (await request.json())["expirationDateTime"]
+            self.subscriptions[subscription_id]["renewed"] = self.subscriptions[subscription_id].get("renewed", 0) + 1
+            return self.subscriptions[subscription_id]
+
+        @app.delete(prefix + "/subscriptions/{subscription_id}")
+        async def delete_subscription(subscription_id: str):
+            if self.subscriptions.pop(subscription_id, None) is None:
+                return JSONResponse({"error": {"code": "ResourceNotFound"}}, status_code=404)
+            return Response(status_code=204)
+
+        @app.get(prefix + "/me")
+        async def me():
+            return {"mail": self.mail, "userPrincipalName": self.mail}
+
+        @app.get(prefix + "/me/calendars")
+        async def list_calendars():
+            return {"value": self.calendar_list}
+
+        @app.get(prefix + "/me/calendarGroups")
+        async def list_calendar_groups():
+            return {"value": [{"id": "my-calendars", "name": "My Calendars"}] +
+                             [{"id": group_id, "name": name} for group_id, (name, _) in self.calendar_groups.items()]}
+
+        @app.get(prefix + "/me/calendarGroups/{group_id}/calendars")
+        async def list_group_calendars(group_id: str):
+            return {"value": self.calendar_groups.get(group_id, (None, []))[1]}
+
+        @app.get(prefix + "/me/memberOf")
+        async def member_of():
+            return {"value": [{"id": group_id, "displayName": name} for group_id, (name, _) in self.office_groups.items()]}
+
+        @app.get(prefix + "/groups/{group_id}/calendar")
+        async def group_calendar(group_id: str):
+            if group_id not in self.office_groups:
+                return JSONResponse({"error": {"code": "ErrorItemNotFound"}}, status_code=404)
+            return self.office_groups[group_id][1]
+
+        @app.post(prefix + "/me/events")
+        async def create_default_event(request: Request):
+            return JSONResponse(self._create("default", await request.json()), status_code=201)
+
+        @app.post(prefix + "/me/calendars/{calendar_id}/events")
+        async def create_event(calendar_id: str, request: Request):
+            if calendar_id in self.missing_calendars:
+                return JSONResponse({"error": {"code": "ErrorItemNotFound", "message": "The specified object was not found in the store."}}, status_code=404)
+            return JSONResponse(self._create(calendar_id, await request.json()), status_code=201)
+
+        @app.post(prefix + "/$batch")
+        async def batch(request: Request):
+            responses = []
+            # The batch itself was counted once by the middleware
+            mailbox = request.headers.get("Authorization", "")
+            capacity = self.mailbox_limit - self.in_flight[mailbox] + 1 if self.mailbox_limit else None
+            for position, item in enumerate((await request.json())["requests"]):
+                match = re.fullmatch(r"/me/(?:calendars/([^/]+)/)?events", item["url"])
+                if (capacity is not None and position >= capacity) or self.random.random() < self.batch_throttle_rate:
+                    responses.append({"id": item["id"], "status": 429, "headers": {"Retry-After": str(self.retry_after)}, "body": self._throttled()})
+                elif item["method"] == "POST" and match:
+                    event = self._create(match.group(1) or "default", item.get("body") or {})
+                    responses.append({"id": item["id"], "status": 201, "headers": {}, "body": event})
+                else:
+                    responses.append({"id": item["id"], "status": 501, "headers": {}, "body": {"error": {"code": "NotImplemented"}}})
+            return {"responses": responses}
+
+        @app.get(prefix + "/me/calendars/{calendar_id}/calendarView/delta")
+        async def calendar_view_delta(calendar_id: str, request: Request):
+            params = request.query_params
+            start, end = _parse(params["startDateTime"]), _parse(params["endDateTime"])
+            window = {"startDateTime": params["startDateTime"], "endDateTime": params["endDateTime"]}
+            events = self.calendars.get(calendar_id, {})
+
+            if "$deltatoken" in params:
+                since = int(params["$deltatoken"])
+                if since < self.expired_before:
+                    return JSONResponse({"error": {"code": "SyncStateNotFound", "message": "Delta token expired"}}, status_code=410)
+                changed = []
+                for event_id in dict.fromkeys(e for seq, cal, e in self.changes if seq > since and cal == calendar_id):
+                    event = events.get(event_id)
+                    if event is not None and self._in_window(event, start, end):
+                        changed.append(event)
+                    else:
+                        changed.append({"id": event_id, "@removed": {"reason": "deleted"}})
+                items = changed
+                link_params = {**window, "$deltatoken": since}
+            else:
+                items = sorted((e for e in events.values() if self._in_window(e, start, end)), key=lambda e: e["start"]["dateTime"])
+                link_params = window
+
+            delta_link = f"{request.url.scheme}://{request.url.netloc}{request.url.path}?" + urlencode({**window, "$deltatoken": self.sequence})
+            return self._page(request, items, link_params, delta_link)
+
+        @app.get(prefix + "/me/calendars/{calendar_id}/calendarView")
+        async def calendar_view(calendar_id: str, request: Request):
+            params = request.query_params
+            if self.calendar_latency.get(calendar_id):
+                await asyncio.sleep(self.calendar_latency[calendar_id])
+            start, end = _parse(params["startDateTime"]), _parse(params["endDateTime"])
+            events = sorted((e for e in self.calendars.get(calendar_id, {}).values() if self._in_window(e, start, end)),
+                            key=lambda e: e["start"]["dateTime"])
+            top = int(params.get("$top", DEFAULT_PAGE_SIZE))
+            skip = int(params.get("$skip", "0"))
+            page = {"value": events[skip:skip + top]}
+            if skip + top < len(events):
+                next_params = {k: v for k, v in params.items() if k != "$skip"}
+                page["@odata.nextLink"] = f"{request.url.scheme}://{request.url.netloc}{request.url.path}?" + urlencode({**next_params, "$skip": skip + top})
+            return page
+
+        @app.get(prefix + "/me/calendars/{calendar_id}/events")
+        async def list_events(calendar_id: str, request: Request):
+            params = request.query_params
+            events = sorted(self.calendars.get(calendar_id, {}).values(), key=lambda e: e["start"]["dateTime"])
+            bounds = re.findall(r"'([^']+)'", params.get("$filter", ""))
+            if len(bounds) == 2:
+                start, end = _parse(bounds[0]), _parse(bounds[1])
+                events = [e for e in events if start <= _parse(e["start"]["dateTime"]) <= end]
+            top = int(params.get("$top", DEFAULT_PAGE_SIZE))
+            skip = int(params.get("$skip", "0"))
+            page = {"value": events[skip:skip + top]}
+            if params.get("$select"):
+                selected = set(params["$select"].split(",")) | {"id"}
+                page["value"] = [{k: v for k, v in e.items() if k in selected} for e in page["value"]]
+            if skip + top < len(events):
+                next_params = {k: v for k, v in params.items() if k != "$skip"}
+                page["@odata.nextLink"] = f"{request.url.scheme}://{request.url.netloc}{request.url.path}?" + urlencode({**next_params, "$skip": skip + top})
+            return page
+
+        return app
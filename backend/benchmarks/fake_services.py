@@ -0,0 +1,238 @@
+"""
+Stand-ins for the other services the backend calls: the
+login.microsoftonline.com token endpoint and the Supabase REST API (the
+ms_tokens and user_profiles tables), plus LocalServers, which serves any of
+these apps (and FakeGraph) over real HTTP on 127.0.0.1.
+
+The supabase client is synchronous and opens its own connections, so it
+cannot be pointed at an in-process ASGI app; serving the stand-ins on a
+local port lets the backend use its real clients unchanged:
+
+    servers = LocalServers(graph=FakeGraph(...).app, login=FakeLogin().app, supabase=FakeSupabase().app)
+    servers.start()
+    os.environ["SUPABASE_URL"] = servers.url("supabase")    # before importing the backend
+
+Every stand-in takes the same fault settings as FakeGraph: latency (seconds
+per request), failure_rate (fraction answered 500) and throttle_rate
+(fraction answered 429 with Retry-After: retry_after).
+"""
+import uuid
+import socket
+import random
+import asyncio
+import threading
+from urllib.parse import parse_qs
+from collections import Counter
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+TOKEN_PATH = "/common/oauth2/v2.0/token"
+
+# Primary key of each table, used for upserts
+PRIMARY_KEYS = {"ms_tokens": "user_id", "user_profiles": "id"}
+
+
+class FaultInjection:
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 1.0, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests = Counter()
+        self.failed = 0
+        self.throttled = 0
+
+    def install(self, app: FastAPI, failure_body: dict, throttle_body: dict) -> None:
+        @app.middleware("http")
+        async def inject_faults(request: Request, call_next):
+            self.requests[request.url.path] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.throttle_rate and self.random.random() < self.throttle_rate:
+                self.throttled += 1
+                return JSONResponse(throttle_body, status_code=429, headers={"Retry-After": str(self.retry_after)})
+            if self.failure_rate and self.random.random() < self.failure_rate:
+                self.failed += 1
+                return JSONResponse(failure_body, status_code=500)
+            return await call_next(request)
+
+
+class FakeLogin(FaultInjection):
+    """The v2.0 token endpoint: every refresh_token grant issues a new token pair."""
+
+    def __init__(self, expires_in: int = 3600, **faults):
+        super().__init__(**faults)
+        self.expires_in = expires_in
+        self.refreshed = 0
+        self.app = self._build_app()
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+        self.install(app, {"error": "server_error", "error_description": "Injected failure."},
+                     {"error": "temporarily_unavailable", "error_description": "Too many requests."})
+
+        @app.post(TOKEN_PATH)
+        async def token(request: Request):
+            # Parsed by hand: request.form() needs the optional python-multipart package
+            form = {key: values[0] for key, values in parse_qs((await request.body()).decode()).items()}
+            if form.get("grant_type") not in ("refresh_token", "authorization_code"):
+                return JSONResponse({"error": "unsupported_grant_type"}, status_code=400)
+            if form.get("grant_type") == "refresh_token" and not form.get("refresh_token"):
+                return JSONResponse({"error": "invalid_grant"}, status_code=400)
+            self.refreshed += 1
+            return {
+                "token_type": "Bearer",
+                "access_token": f"fake-access-{uuid.uuid4()}",
+                "refresh_token": f"fake-refresh-{uuid.uuid4()}",
+                "expires_in": self.expires_in,
+            }
+
+        return app
+
+
+class FakeSupabase(FaultInjection):
+    """
+    The subset of PostgREST the backend's supabase client uses on
+    /rest/v1/<table>: select with column lists and eq filters, insert/upsert,
+    update and delete. Rows live in `tables` (table -> list of dicts).
+    """
+
+    def __init__(self, **faults):
+        super().__init__(**faults)
+        self.tables: dict = {name: [] for name in PRIMARY_KEYS}
+        self.app = self._build_app()
+
+    @staticmethod
+    def _filters(request: Request) -> list:
+        filters = []
+        for column, value in request.query_params.items():
+            if column in ("select", "on_conflict", "columns", "limit", "offset", "order"):
+                continue
+            operator, _, operand = value.partition(".")
+            if operator != "eq":
+                raise ValueError(f"unsupported filter {column}={value}")
+            filters.append((column, operand))
+        return filters
+
+    @staticmethod
+    def _project(row: dict, select: str) -> dict:
+        columns = [c.strip() for c in select.split(",") if c.strip()]
+        if not columns or "*" in columns:
+            return dict(row)
+        return {c: row.get(c) for c in columns}
+
+    def _matching(self, table: str, filters: list) -> list:
+        return [row for row in self.tables.setdefault(table, []) if all(str(row.get(c)) == v for c, v in filters)]
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+        self.install(app, {"message": "Injected failure.", "code": "XX000", "details": None, "hint": None},
+                     {"message": "Too many requests.", "code": "429", "details": None, "hint": None})
+
+        def bad_request(error: Exception) -> JSONResponse:
+            return JSONResponse({"message": str(error), "code": "PGRST100", "details": None, "hint": None}, status_code=400)
+
+        @app.get("/rest/v1/{table}")
+        async def select(table: str, request: Request):
+            try:
+                rows = self._matching(table, self._filters(request))
+            except ValueError as e:
+                return bad_request(e)
+            return [self._project(row, request.query_params.get("select", "*")) for row in rows]
+
+        @app.post("/rest/v1/{table}")
+        async def insert(table: str, request: Request):
+            body = await request.json()
+            rows = body if isinstance(body, list) else [body]
+            key = PRIMARY_KEYS.get(table)
+            merge = "merge-duplicates" in request.headers.get("Prefer", "")
+            stored = []
+            for row in rows:
+                existing = next((r for r in self.tables.setdefault(table, []) if key and r.get(key) == row.get(key)), None)
+                if existing is not None and not merge:
+                    return JSONResponse({"message": "duplicate key value violates unique constraint", "code": "23505",
+                                         "details": None, "hint": None}, status_code=409)
+                if existing is not None:
+                    existing.update(row)
+                    stored.append(existing)
+                else:
+                    self.tables[table].append(dict(row))
+                    stored.append(row)
+            return JSONResponse(stored, status_code=201)
+
+        @app.patch("/rest/v1/{table}")
+        async def update(table: str, request: Request):
+            try:
+                rows = self._matching(table, self._filters(request))
+            except ValueError as e:
+                return bad_request(e)
+            changes = await request.json()
+            for row in rows:
+                row.update(changes)
+            return rows
+
+        @app.delete("/rest/v1/{table}")
+        async def delete(table: str, request: Request):
+            try:
+                rows = self._matching(table, self._filters(request))
+            except ValueError as e:
+                return bad_request(e)
+            self.tables[table] = [row for row in self.tables[table] if row not in rows]
+            return rows
+
+        return app
+
+
+class LocalServers:
+    """
+    Serves named ASGI apps on 127.0.0.1 from one background thread (with its
+    own event loop, so the stand-ins never compete with the app under test
+    for the benchmark's loop). Ports are picked when the object is created,
+    so url() works before start().
+    """
+
+    def __init__(self, **apps):
+        self.apps = apps
+        self.sockets = {}
+        for name in apps:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            # Inherited by accepted connections; without it the separate header and body
+            # writes of a response wait out the peer's delayed ACK (~40ms per request)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.bind(("127.0.0.1", 0))
+            self.sockets[name] = sock
+        self._servers = []
+        self._thread = None
+
+    def url(self, name: str) -> str:
+        return "http://127.0.0.1:%d" % self.sockets[name].getsockname()[1]
+
+    def start(self) -> None:
+        started = threading.Event()
+
+        async def serve_all():
+            self._servers = [
+                uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="off", access_log=False))
+                for app in self.apps.values()
+            ]
+            tasks = [asyncio.create_task(server.serve(sockets=[sock])) for server, sock in zip(self._servers, self.sockets.values())]
+            while not all(server.started for server in self._servers):
+                await asyncio.sleep(0.01)
+            started.set()
+            await asyncio.gather(*tasks)
+
+        self._thread = threading.Thread(target=asyncio.run, args=(serve_all(),), name="local-servers", daemon=True)
+        self._thread.start()
+        if not started.wait(10):
+            raise RuntimeError("Local servers did not start")
+
+    def stop(self) -> None:
+        for server in self._servers:
+            server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(10)
+        for sock in self.sockets.values():
+            sock.close()
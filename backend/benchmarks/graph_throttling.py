@@ -0,0 +1,104 @@
+"""
+Creates many events in one mailbox against a throttling Graph stand-in, with
+and without the request scheduler in front of it.
+
+The stand-in answers 429 (Retry-After: --retry-after) to any request beyond
+--mailbox-limit concurrent requests for the same user, counting each request
+inside a $batch, and throttles $batch requests at random with probability
+--batch-throttle. Without the scheduler the throttled creations are simply
+lost; with it every event must be created.
+
+    python -m backend.benchmarks.graph_throttling --events 200 --mailbox-limit 2
+"""
+import time
+import asyncio
+import argparse
+import datetime
+import httpx
+from backend.MSIGraph.graph_client import graph_url, create_graph_client
+from backend.MSIGraph.scheduler import graph_scheduler, MAILBOX_HEADER
+from backend.MSIGraph.batch import run_batched
+from .fake_graph import FakeGraph
+
+HEADERS = {"Authorization": "Bearer benchmark-mailbox", MAILBOX_HEADER: "benchmark-user", "Content-Type": "application/json"}
+
+
+def event_body(i: int) -> dict:
+    start = datetime.datetime(2030, 1, 1, 9) + datetime.timedelta(hours=i)
+    return {
+        "subject": f"Event {i}",
+        "start": {"dateTime": start.isoformat(), "timeZone": "UTC"},
+        "end": {"dateTime": (start + datetime.timedelta(minutes=30)).isoformat(), "timeZone": "UTC"},
+    }
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+    print(f"  ok: {message}")
+
+
+async def create_all(client: httpx.AsyncClient, count: int) -> tuple:
+    started = time.perf_counter()
+    responses = await asyncio.gather(*[
+        client.post(f"{graph_url()}/me/calendars/cal-1/events", headers=HEADERS, json=event_body(i)) for i in range(count)
+    ])
+    return sum(1 for r in responses if r.status_code == 201), time.perf_counter() - started
+
+
+async def run(events: int, mailbox_limit: int, retry_after: float, batch_throttle: float) -> None:
+    print(f"{events} concurrent creations, stand-in allows {mailbox_limit} per mailbox, Retry-After {retry_after}s")
+
+    fake = FakeGraph(base_url=graph_url(), latency=0.01)
+    fake.mailbox_limit, fake.retry_after = mailbox_limit, retry_after
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app)) as client:
+        created, elapsed = await create_all(client, events)
+    print(f"  without scheduler: {created}/{events} created, {fake.throttled} throttled, {elapsed * 1000:.0f}ms")
+
+    fake = FakeGraph(base_url=graph_url(), latency=0.01)
+    fake.mailbox_limit, fake.retry_after = mailbox_limit, retry_after
+    async with create_graph_client(transport=httpx.ASGITransport(app=fake.app)) as client:
+        created, elapsed = await create_all(client, events)
+    print(f"  with scheduler:    {created}/{events} created, {fake.throttled} throttled, {elapsed * 1000:.0f}ms")
+    check(created == events and len(fake.calendars["cal-1"]) == events, "every event created exactly once")
+
+    fake = FakeGraph(base_url=graph_url(), latency=0.01)
+    fake.batch_throttle_rate, fake.retry_after = batch_throttle, retry_after
+    requests = [{"id": str(i), "method": "POST", "url": "/me/calendars/cal-1/events", "headers": {"Content-Type": "application/json"},
+                 "body": event_body(i)} for i in range(events)]
+    async with create_graph_client(transport=httpx.ASGITransport(app=fake.app)) as client:
+        started = time.perf_counter()
+        results = await run_batched(client, HEADERS, requests)
+        elapsed = time.perf_counter() - started
+    created = sum(1 for r in results.values() if r["status"] == 201)
+    print(f"  $batch, {batch_throttle:.0%} of requests throttled: {created}/{events} created, {fake.throttled} throttled, {elapsed * 1000:.0f}ms")
+    check(created == events and len(fake.calendars["cal-1"]) == events, "throttled $batch requests are retried")
+
+    # Outlook's real limit, with every $batch request counted: the scheduler must keep under it.
+    # A fresh mailbox, since the runs above lowered the first one's limit.
+    fake = FakeGraph(base_url=graph_url(), latency=0.01)
+    fake.mailbox_limit, fake.retry_after = graph_scheduler.mailbox_concurrency, retry_after
+    async with create_graph_client(transport=httpx.ASGITransport(app=fake.app)) as client:
+        started = time.perf_counter()
+        results = await run_batched(client, {**HEADERS, MAILBOX_HEADER: "second-benchmark-user"}, requests)
+        elapsed = time.perf_counter() - started
+    created = sum(1 for r in results.values() if r["status"] == 201)
+    print(f"  $batch, {graph_scheduler.mailbox_concurrency} concurrent requests allowed: {created}/{events} created, "
+          f"{fake.throttled} throttled, {fake.requests['/v1.0/$batch']} batches, {elapsed * 1000:.0f}ms")
+    check(created == events and fake.throttled == 0, "$batch requests count against the mailbox limit")
+
+    print(f"  scheduler: {graph_scheduler.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--mailbox-limit", type=int, default=2)
+    parser.add_argument("--retry-after", type=float, default=0.05)
+    parser.add_argument("--batch-throttle", type=float, default=0.3)
+    args = parser.parse_args()
+    asyncio.run(run(args.events, args.mailbox_limit, args.retry_after, args.batch_throttle))
+
+
+if __name__ == "__main__":
+    main()
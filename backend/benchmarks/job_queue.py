@@ -0,0 +1,143 @@
+"""
+Compares synchronous and queued (async mode) /api/msgraph/create-event
+against a slow Graph stand-in, then checks the queue's guarantees: every
+job completes, each user's events are created in the order they were
+queued, failing jobs are dead-lettered and can be retried, and jobs
+still queued at shutdown are picked up after a restart.
+
+    python -m backend.benchmarks.job_queue --users 5 --events 20 --graph-latency 0.2
+"""
+import os
+import io
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import datetime
+import statistics
+import contextlib
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-secret")
+os.environ["JOB_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "jobs.sqlite3")
+os.environ.setdefault("JOB_POLL_INTERVAL", "0.05")
+# Short enough that shutdown interrupts the job stuck on a slow Graph call
+os.environ.setdefault("JOB_SHUTDOWN_GRACE", "0.1")
+
+import httpx
+from jose import jwt
+from backend.MSIGraph.graph_client import graph_url, create_graph_client
+from backend.MSIGraph.token_cache import token_cache
+from .fake_graph import FakeGraph
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+    print(f"  ok: {message}")
+
+
+def event_body(subject: str, i: int) -> dict:
+    start = datetime.datetime(2030, 1, 1, 9) + datetime.timedelta(hours=i)
+    return {
+        "subject": subject,
+        "start": {"dateTime": start.isoformat(), "timeZone": "UTC"},
+        "end": {"dateTime": (start + datetime.timedelta(minutes=30)).isoformat(), "timeZone": "UTC"},
+    }
+
+
+@contextlib.asynccontextmanager
+async def running_app(fake: FakeGraph):
+    from backend.main import app
+    async with app.router.lifespan_context(app):
+        await app.state.graph_client.aclose()
+        app.state.graph_client = create_graph_client(transport=httpx.ASGITransport(app=fake.app))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+            yield client
+
+
+async def run(users: int, events: int, graph_latency: float) -> None:
+    fake = FakeGraph(base_url=graph_url(), latency=graph_latency)
+    expiry = (datetime.datetime.utcnow() + datetime.timedelta(days=1)).isoformat()
+    auth = {}
+    for u in range(users):
+        user_id = str(uuid.uuid4())
+        token_cache.store(user_id, f"fake-access-token-{u}", None, expiry)
+        auth[u] = {"Authorization": "Bearer " + jwt.encode({"sub": user_id}, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")}
+
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        async with running_app(fake) as client:
+
+            async def create(u: int, i: int, queued: bool, calendar: str = None):
+                started = time.perf_counter()
+                body = {"calendar_id": calendar or f"cal-{u}", "event": event_body(f"{u}-{i}", i), "async": queued}
+                response = await client.post("/api/msgraph/create-event", json=body, headers=auth[u])
+                return response, time.perf_counter() - started
+
+            sync = await asyncio.gather(*[create(u, i, False, f"sync-{u}") for u in range(users) for i in range(events)])
+            queued = await asyncio.gather(*[create(u, i, True) for i in range(events) for u in range(users)])
+
+            started = time.perf_counter()
+            job_ids = [(u, response.json()["job_id"]) for (response, _), u in zip(queued, [u for _ in range(events) for u in range(users)])]
+            while True:
+                statuses = [(await client.get(f"/api/jobs/{job_id}", headers=auth[u])).json()["status"] for u, job_id in job_ids]
+                if all(s == "succeeded" for s in statuses):
+                    break
+                await asyncio.sleep(0.05)
+            drained = time.perf_counter() - started
+            # Enqueue order as the server saw it (the job list is newest first)
+            enqueued = {u: [job["result"]["subject"] for job in reversed((await client.get("/api/jobs?limit=200", headers=auth[u])).json()["jobs"])]
+                        for u in range(users)}
+
+            dead = (await create(0, 0, True, "deleted-calendar"))[0].json()["job_id"]
+            fake.missing_calendars.add("deleted-calendar")
+            while (await client.get(f"/api/jobs/{dead}", headers=auth[0])).json()["status"] != "dead":
+                await asyncio.sleep(0.05)
+            dead_job = (await client.get(f"/api/jobs/{dead}", headers=auth[0])).json()
+            fake.missing_calendars.clear()
+            retried = (await client.post(f"/api/jobs/{dead}/retry", headers=auth[0])).json()
+            while (await client.get(f"/api/jobs/{dead}", headers=auth[0])).json()["status"] != "succeeded":
+                await asyncio.sleep(0.05)
+            other_user = (await client.get(f"/api/jobs/{dead}", headers=auth[1 % users])).status_code
+
+            # Stop Graph answering, queue a job, and shut down before it can finish
+            fake.latency = 5.0
+            pending = (await create(0, events, True))[0].json()["job_id"]
+            await asyncio.sleep(0.2)
+        fake.latency = graph_latency
+        async with running_app(fake) as client:
+            while (resumed := (await client.get(f"/api/jobs/{pending}", headers=auth[0])).json())["status"] != "succeeded":
+                await asyncio.sleep(0.05)
+
+    sync_latency = [t for _, t in sync]
+    queued_latency = [t for _, t in queued]
+    total = users * events
+    print(f"{users} users x {events} events, Graph latency {graph_latency * 1000:.0f}ms")
+    print(f"  sync create-event:   p50 {statistics.median(sync_latency) * 1000:7.1f}ms  max {max(sync_latency) * 1000:7.1f}ms")
+    print(f"  queued create-event: p50 {statistics.median(queued_latency) * 1000:7.1f}ms  max {max(queued_latency) * 1000:7.1f}ms"
+          f"  (queue drained {drained * 1000:.0f}ms later)")
+    check(all(r.status_code == 202 for r, _ in queued), "async mode answers 202 with a job id")
+    created = {u: [e["subject"] for seq, cal, e_id in fake.changes if cal == f"cal-{u}"
+                   for e in [fake.calendars[cal][e_id]]] for u in range(users)}
+    check(all(len(created[u]) == events + (u == 0) for u in range(users)), f"all {total} queued events created once")
+    check(all(created[u][:events] == enqueued[u] for u in range(users)), "each user's events created in the order they were queued")
+    check(dead_job["attempts"] == 1 and "404" in dead_job["error"], "a 404 from Graph is dead-lettered without retrying")
+    check(retried["status"] == "queued", "a dead-lettered job can be retried")
+    check(other_user == 404, "jobs are only visible to their owner")
+    check(resumed["attempts"] == 1, "a job interrupted by shutdown is put back and completes after restart")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--graph-latency", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.events, args.graph_latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measures get_current_user with and without the verified-token cache, for an
+HS256 token (shared secret) and an ES256 token (JWKS key), and checks that
+tampered or expired tokens are still rejected after a valid one is cached.
+
+    python -m backend.benchmarks.jwt_verify --requests 5000
+"""
+import os
+import time
+import asyncio
+import argparse
+
+os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-secret")
+
+from fastapi import HTTPException
+from jose import jwk, jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from backend.auth.dependency import get_current_user, verified_tokens, jwks
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+    print(f"  ok: {message}")
+
+
+async def rejected(token: str) -> bool:
+    try:
+        await get_current_user(f"Bearer {token}")
+    except HTTPException as e:
+        return e.status_code == 401
+    return False
+
+
+async def timed(token: str, requests: int, cached: bool) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        if not cached:
+            verified_tokens.clear()
+        await get_current_user(f"Bearer {token}")
+    return (time.perf_counter() - started) / requests
+
+
+async def run(requests: int) -> None:
+    now = int(time.time())
+    claims = {"sub": "benchmark-user", "role": "authenticated", "iat": now, "exp": now + 3600}
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    public_jwk = jwk.construct(private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo), "ES256").to_dict()
+    jwks.load({"keys": [{**public_jwk, "kid": "benchmark-kid", "alg": "ES256", "use": "sig"}]})
+
+    tokens = {
+        "HS256": jwt.encode(claims, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256"),
+        "ES256": jwt.encode(claims, pem, algorithm="ES256", headers={"kid": "benchmark-kid"}),
+    }
+
+    for algorithm, token in tokens.items():
+        uncached = await timed(token, requests, cached=False)
+        cached = await timed(token, requests, cached=True)
+        print(f"{algorithm}: {uncached * 1e6:8.1f}us uncached, {cached * 1e6:6.1f}us cached ({uncached / cached:.0f}x)")
+
+    print("Rejections with valid tokens cached:")
+    hs = tokens["HS256"]
+    check(await rejected(hs[:-2] + ("AA" if hs[-2:] != "AA" else "BB")), "tampered signature is rejected")
+    check(await rejected(jwt.encode({**claims, "exp": now - 10}, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")), "expired token is rejected")
+    check(await rejected(jwt.encode(claims, "wrong-secret", algorithm="HS256")), "token signed with another secret is rejected")
+    check(await rejected(jwt.encode(claims, pem, algorithm="ES256", headers={"kid": "unknown-kid"})), "unknown signing key is rejected")
+    print(f"  cache: {verified_tokens.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Load test for the main API routes against local stand-ins for Graph, the
+Microsoft token endpoint and Supabase (see fake_graph and fake_services).
+
+The FastAPI app runs in-process with its real lifespan, clients and caches;
+only the services it calls are fake, served over HTTP on 127.0.0.1. For each
+route and each concurrency level, that many clients send requests back to
+back until --requests have completed; throughput and p50/p95/p99 latency
+are reported per level.
+
+    python -m backend.benchmarks.load_test --concurrency 1,10,50 --requests 500 --graph-latency 0.05
+    python -m backend.benchmarks.load_test --save backend/benchmarks/baselines/load_test.json
+    python -m backend.benchmarks.load_test --compare backend/benchmarks/baselines/load_test.json
+
+--compare exits non-zero if any route/level is slower at p95 or lower in
+throughput than the baseline by more than --tolerance. Baselines are only
+comparable when taken on the same machine with the same settings.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import platform
+import tempfile
+import datetime
+from collections import Counter
+
+import httpx
+from jose import jwt
+from .fake_graph import FakeGraph
+from .fake_services import FakeLogin, FakeSupabase, LocalServers
+
+ROUTES = ("calendars", "calendar-events", "create-event", "status")
+JWT_SECRET = "benchmark-secret"
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def start_fakes(args) -> tuple:
+    graph = FakeGraph(latency=args.graph_latency)
+    graph.failure_rate = args.failure_rate
+    graph.throttle_rate = args.throttle_rate
+    graph.retry_after = args.retry_after
+    faults = {"failure_rate": args.failure_rate, "throttle_rate": args.throttle_rate, "retry_after": args.retry_after}
+    login = FakeLogin(latency=args.login_latency, **faults)
+    supabase = FakeSupabase(latency=args.supabase_latency, **faults)
+    servers = LocalServers(graph=graph.app, login=login.app, supabase=supabase.app)
+    servers.start()
+
+    # Read at import time by the backend, so set before the first backend import.
+    # FakeGraph only uses the path of its base_url (/v1.0), not the host.
+    os.environ["MS_GRAPH_URL"] = servers.url("graph") + "/v1.0"
+    os.environ["MS_LOGIN_URL"] = servers.url("login")
+    os.environ["SUPABASE_URL"] = servers.url("supabase")
+    os.environ["SUPABASE_SERVICE_KEY"] = "benchmark"
+    os.environ["SUPABASE_JWT_SECRET"] = JWT_SECRET
+    os.environ["JOB_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "jobs.sqlite3")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    return servers, graph, login, supabase
+
+
+def seed(graph: FakeGraph, supabase: FakeSupabase, users: int, calendars: int, events: int) -> list:
+    now = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    for c in range(calendars):
+        graph.add_calendar(f"cal-{c}", f"Calendar {c}", group="Team" if c % 3 == 2 else None)
+        for e in range(events):
+            graph.add_event(f"cal-{c}", f"Hearing {c}-{e}", now + datetime.timedelta(hours=8 * e + c + 1))
+    graph.add_office_group("og-litigation", "Litigation")
+
+    accounts = []
+    for u in range(users):
+        user_id = str(uuid.uuid4())
+        # Every fourth user's token is about to expire, so their first request refreshes it through the login stand-in
+        expires_in = datetime.timedelta(seconds=60) if u % 4 == 0 else datetime.timedelta(hours=1)
+        supabase.tables["ms_tokens"].append({
+            "user_id": user_id,
+            "access_token": f"fake-access-{user_id}",
+            "refresh_token": f"fake-refresh-{user_id}",
+            "expires_at": (datetime.datetime.utcnow() + expires_in).isoformat(),
+        })
+        token = jwt.encode({"sub": user_id, "email": f"user{u}@firm.example"}, JWT_SECRET, algorithm="HS256")
+        accounts.append((user_id, {"Authorization": f"Bearer {token}"}))
+    return accounts
+
+
+def request_for(route: str, n: int, accounts: list, calendars: int, args) -> tuple:
+    user_id, headers = accounts[n % len(accounts)]
+    if route == "calendars":
+        body = {"force_refresh": args.force_refresh}
+    elif route == "calendar-events":
+        body = {"calendar_id": f"cal-{n % calendars}"}
+    elif route == "create-event":
+        # Far outside the calendar-events window, so created events never change what it returns
+        start = datetime.datetime(2040, 1, 1) + datetime.timedelta(minutes=30 * n)
+        body = {"calendar_id": f"cal-{n % calendars}", "event": {
+            "subject": f"Load test {n}",
+            "start": {"dateTime": start.isoformat(), "timeZone": "UTC"},
+            "end": {"dateTime": (start + datetime.timedelta(minutes=30)).isoformat(), "timeZone": "UTC"},
+        }}
+    else:
+        body = {"user_id": user_id}
+    return f"/api/msgraph/{route}", body, headers
+
+
+async def run_level(client: httpx.AsyncClient, route: str, concurrency: int, total: int, accounts: list, calendars: int, args) -> dict:
+    latencies = []
+    statuses = Counter()
+    counter = iter(range(total))
+
+    async def worker():
+        for n in counter:
+            path, body, headers = request_for(route, n, accounts, calendars, args)
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=body, headers=headers)
+                statuses[response.status_code] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400))
+    return {
+        "route": route,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "throughput": total / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+async def run(args) -> dict:
+    servers, graph, login, supabase = start_fakes(args)
+    try:
+        from backend.main import app
+        accounts = seed(graph, supabase, args.users, args.calendars, args.events)
+        results = []
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app", timeout=120) as client:
+                # One request per user and route first, so token loading and refreshes don't land in the first level
+                for route in args.routes:
+                    await run_level(client, route, min(len(accounts), max(args.concurrency)), len(accounts), accounts, args.calendars, args)
+                for route in args.routes:
+                    for concurrency in args.concurrency:
+                        result = await run_level(client, route, concurrency, args.requests, accounts, args.calendars, args)
+                        results.append(result)
+                        print_result(result)
+    finally:
+        servers.stop()
+
+    return {
+        "taken_at": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {key: getattr(args, key) for key in (
+            "users", "calendars", "events", "requests", "concurrency", "routes", "force_refresh",
+            "graph_latency", "login_latency", "supabase_latency", "failure_rate", "throttle_rate", "retry_after")},
+        "upstream_requests": {
+            "graph": sum(graph.requests.values()), "graph_throttled": graph.throttled, "graph_failed": graph.failed,
+            "login_refreshes": login.refreshed,
+            "supabase": sum(supabase.requests.values()),
+        },
+        "results": results,
+    }
+
+
+def print_result(result: dict) -> None:
+    print(f"  {result['route']:<16} c={result['concurrency']:<4} {result['throughput']:8.1f} req/s"
+          f"  p50 {result['p50_ms']:7.1f}ms  p95 {result['p95_ms']:7.1f}ms  p99 {result['p99_ms']:7.1f}ms"
+          f"  errors {result['errors']}/{result['requests']}")
+
+
+def compare(report: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """
+    Route/level pairs whose p95 latency or throughput regressed by more than
+    tolerance. A p95 increase also has to exceed min_delta_ms, so jitter on
+    millisecond-fast routes (cache hits) is not reported.
+    """
+    previous = {(r["route"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"Compared with baseline from {baseline.get('taken_at', '?')} (tolerance {tolerance:.0%}):")
+    for result in report["results"]:
+        before = previous.get((result["route"], result["concurrency"]))
+        if before is None:
+            continue
+        p95 = result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        throughput = result["throughput"] / before["throughput"] - 1 if before["throughput"] else 0.0
+        regressed = (p95 > tolerance and result["p95_ms"] - before["p95_ms"] > min_delta_ms) or throughput < -tolerance
+        print(f"  {result['route']:<16} c={result['concurrency']:<4} p95 {p95:+7.1%}  throughput {throughput:+7.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append((result["route"], result["concurrency"]))
+    if report["settings"] != baseline.get("settings"):
+        print("  note: settings differ from the baseline's")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--routes", type=lambda s: s.split(","), default=list(ROUTES), help="comma-separated subset of " + ",".join(ROUTES))
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=300, help="requests per route and concurrency level")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--calendars", type=int, default=6)
+    parser.add_argument("--events", type=int, default=40, help="events per calendar in the next 30 days")
+    parser.add_argument("--force-refresh", action="store_true", help="bypass the calendar list cache on every /calendars call")
+    parser.add_argument("--graph-latency", type=float, default=0.02)
+    parser.add_argument("--login-latency", type=float, default=0.05)
+    parser.add_argument("--supabase-latency", type=float, default=0.01)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of upstream requests answered 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of upstream requests answered 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After sent with injected 429s")
+    parser.add_argument("--save", help="write the results to this JSON file as a baseline")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 / throughput regression (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore p95 increases smaller than this")
+    args = parser.parse_args()
+    unknown = set(args.routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+
+    print(f"{args.users} users, {args.requests} requests per level; Graph {args.graph_latency * 1000:.0f}ms, "
+          f"login {args.login_latency * 1000:.0f}ms, Supabase {args.supabase_latency * 1000:.0f}ms; "
+          f"{args.failure_rate:.0%} failures, {args.throttle_rate:.0%} throttled")
+    report = asyncio.run(run(args))
+    upstream = report["upstream_requests"]
+    print(f"Upstream: {upstream['graph']} Graph requests ({upstream['graph_throttled']} throttled, {upstream['graph_failed']} failed), "
+          f"{upstream['login_refreshes']} token refreshes, {upstream['supabase']} Supabase requests")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance, args.min_delta_ms):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
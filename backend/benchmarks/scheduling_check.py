@@ -0,0 +1,222 @@
+"""
+Trial scheduling conflicts: checks the interval index against a brute-force
+scan, times single overlap queries on large calendars, then runs
+/api/msgraph/scheduling-check against the local Graph stand-in with a trial
+and deadlines that land on booked days.
+
+    python -m backend.benchmarks.scheduling_check --calendars 20 --events 2000
+"""
+import os
+import io
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import datetime
+import tempfile
+import statistics
+import contextlib
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-secret")
+os.environ.setdefault("JOB_DB_PATH", os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
+
+import httpx
+from jose import jwt
+from backend.deadlines.engine import get_calendar
+from backend.MSIGraph.graph_client import graph_url
+from backend.MSIGraph.token_cache import token_cache
+from backend.MSIGraph.event_store import event_store
+from backend.MSIGraph.conflicts import IntervalIndex
+from backend.MSIGraph.trial_sync import build_trial_events
+from .fake_graph import FakeGraph
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+    print(f"  ok: {message}")
+
+
+def random_intervals(rng: random.Random, count: int, span: int) -> list:
+    """Mostly short meetings, some all-day and multi-week events, like a busy litigation calendar."""
+    intervals = []
+    for i in range(count):
+        start = rng.randrange(span)
+        kind = rng.random()
+        if kind < 0.8:
+            length = rng.choice((15, 30, 60, 120))
+        elif kind < 0.97:
+            length = MINUTES_PER_DAY * rng.randint(1, 3)
+        else:
+            length = MINUTES_PER_DAY * rng.randint(7, 60)
+        intervals.append((start, start + length, i))
+    return intervals
+
+
+def verify_index(rng: random.Random) -> None:
+    for count in (0, 1, 2, 3, 7, 8, 9, 16, 17, 100, 1000, 4097):
+        intervals = random_intervals(rng, count, 365 * MINUTES_PER_DAY)
+        index = IntervalIndex(intervals)
+        for _ in range(300):
+            start = rng.randrange(-MINUTES_PER_DAY, 366 * MINUTES_PER_DAY)
+            end = start + rng.choice((1, 60, MINUTES_PER_DAY, 7 * MINUTES_PER_DAY))
+            expected = sorted((s, e, v) for s, e, v in intervals if s < end and start < e)
+            found = index.overlapping(start, end)
+            if sorted(found) != sorted(v for _, _, v in expected):
+                raise SystemExit(f"FAILED: {count} intervals, query [{start}, {end}) found {len(found)}, expected {len(expected)}")
+    check(True, "overlap queries match a brute-force scan for 0 to 4097 intervals")
+
+
+def time_queries(rng: random.Random, calendars: int, events: int, queries: int) -> None:
+    span = 2 * 365 * MINUTES_PER_DAY
+    started = time.perf_counter()
+    indexes = [IntervalIndex(random_intervals(rng, events, span)) for _ in range(calendars)]
+    build = (time.perf_counter() - started) / calendars
+
+    timings, hits = [], 0
+    for _ in range(queries):
+        index = rng.choice(indexes)
+        day = rng.randrange(span // MINUTES_PER_DAY) * MINUTES_PER_DAY
+        started = time.perf_counter()
+        hits += len(index.overlapping(day, day + MINUTES_PER_DAY))
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    p50, p99 = timings[len(timings) // 2] * 1e6, timings[int(len(timings) * 0.99)] * 1e6
+    print(f"{calendars} calendars x {events} events, {queries} one-day queries ({hits / queries:.1f} hits each)")
+    print(f"  index build {build * 1000:.2f}ms per calendar, query p50 {p50:.1f}us p99 {p99:.1f}us")
+    check(p99 < 1000, "every overlap query answers in under a millisecond at p99")
+
+
+async def check_endpoint(events: int) -> None:
+    from backend.main import app
+
+    # The jurisdiction the dashboard sends
+    calendar = get_calendar("BC")
+    fake = FakeGraph(base_url=graph_url())
+    today = datetime.date.today()
+    # A two-day trial on consecutive business days (not a Friday or the eve of a holiday)
+    trial_date = calendar.busday_offset(today, 60)
+    while calendar.busday_offset(trial_date, 1) != trial_date + datetime.timedelta(days=1):
+        trial_date = calendar.busday_offset(trial_date, 1)
+    midnight = lambda day: datetime.datetime.combine(day, datetime.time())
+
+    # Background noise, none of it on the dates checked below
+    rng = random.Random(1)
+    for i in range(events):
+        day = today + datetime.timedelta(days=rng.randrange(-30, 200))
+        if abs((day - trial_date).days) > 10:
+            fake.add_event("courtroom", f"Hearing {i}", midnight(day) + datetime.timedelta(hours=rng.randint(8, 16)))
+    # The trial's first day is booked in the target calendar, and so is the next business day
+    next_day = calendar.busday_offset(trial_date, 1)
+    fake.add_event("courtroom", "Motion", midnight(trial_date) + datetime.timedelta(hours=10), showAs="busy")
+    fake.add_event("courtroom", "Week of discoveries", midnight(next_day), datetime.timedelta(days=1), isAllDay=True, showAs="busy")
+    # Shown as free, so never a conflict
+    fake.add_event("courtroom", "Reading day", midnight(trial_date - datetime.timedelta(days=1)), datetime.timedelta(days=1),
+                   isAllDay=True, showAs="free")
+    # A trial booked by an earlier version of the app, which created trials as free, away from the noise
+    booked_trial_day = calendar.busday_offset(trial_date, -5)
+    fake.add_event("courtroom", "Trial: Doe v. Roe", midnight(booked_trial_day), datetime.timedelta(days=1),
+                   isAllDay=True, showAs="free", categories=["Trial"])
+    # The 21-business-day deadline falls on a booked day in the reminder calendar
+    deadline_day = calendar.busday_offset(trial_date, -21)
+    fake.add_event("reminders", "Mediation", midnight(deadline_day) + datetime.timedelta(hours=9), datetime.timedelta(hours=3), showAs="busy")
+
+    user_id = str(uuid.uuid4())
+    token_cache.store(user_id, "fake-access-token", None, (datetime.datetime.utcnow() + datetime.timedelta(days=1)).isoformat())
+    auth = {"Authorization": "Bearer " + jwt.encode({"sub": user_id}, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")}
+    payload = {
+        "trial": {"court_file_no": "S-1234", "style_of_cause": "Smith v. Jones", "trial_date": trial_date.isoformat(), "trial_duration": "2-days"},
+        "target_calendars": ["courtroom"],
+        "reminder_calendars": ["reminders"],
+        "deadlines": [
+            {"deadline_name": "File Statement of Defense", "calculated_date": deadline_day.isoformat(),
+             "reference_type": "trial_date", "days_before": 21, "is_business_days": True},
+            {"deadline_name": "Expert Report Deadline", "calculated_date": calendar.busday_offset(trial_date, -90).isoformat(),
+             "reference_type": "trial_date", "days_before": 90, "is_business_days": True},
+        ],
+        "time_zone": "America/Vancouver",
+        "jurisdiction": "BC",
+    }
+
+    async with app.router.lifespan_context(app):
+        await app.state.graph_client.aclose()
+        app.state.graph_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+
+            async def scheduling_check(body: dict) -> httpx.Response:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    return await client.post("/api/msgraph/scheduling-check", json=body, headers=auth)
+
+            response = await scheduling_check(payload)
+            result = response.json()
+            check(response.status_code == 200 and not result["errors"], "the scheduling check answers")
+            keys = {conflict["key"] for conflict in result["conflicts"]}
+            check(keys == {"trial:courtroom", f"deadline:File Statement of Defense:{deadline_day}:reminders"},
+                  "the booked trial days and the booked deadline are reported, the free event is not")
+            trial_conflict = next(c for c in result["conflicts"] if c["key"] == "trial:courtroom")
+            check(sorted(e["subject"] for e in trial_conflict["events"]) == ["Motion", "Week of discoveries"],
+                  "the trial conflict lists the events on both trial days")
+
+            suggested = [datetime.date.fromisoformat(s["trial_date"]) for s in result["suggestions"]["trial_dates"]]
+            check(len(suggested) == 3 and all(calendar.is_business_day(day) for day in suggested),
+                  f"three business days suggested for the trial: {', '.join(map(str, suggested))}")
+            check(trial_date - datetime.timedelta(days=1) not in suggested and next_day not in suggested,
+                  "no suggested trial would overlap the booked days")
+            moved = await scheduling_check({**payload, "trial": {**payload["trial"], "trial_date": suggested[0].isoformat()},
+                                            "deadlines": payload["deadlines"][1:]})
+            check(not [c for c in moved.json()["conflicts"] if c["key"].startswith("trial:")], "the first suggestion is free")
+
+            deadline_key = f"deadline:File Statement of Defense:{deadline_day}:reminders"
+            moved_deadline = datetime.date.fromisoformat(result["suggestions"]["deadlines"][deadline_key])
+            check(moved_deadline < deadline_day and calendar.is_business_day(moved_deadline),
+                  f"the conflicting deadline moves earlier, to {moved_deadline}")
+
+            bad = await scheduling_check({**payload, "jurisdiction": "XX"})
+            check(bad.status_code == 400, "an unknown jurisdiction is rejected")
+
+            timings = []
+            for _ in range(20):
+                started = time.perf_counter()
+                result = (await scheduling_check(payload)).json()
+                timings.append(time.perf_counter() - started)
+            stats = (await client.get("/api/msgraph/scheduling-check/stats", headers=auth)).json()
+            check(stats["builds"] == 2, f"repeated checks reuse the two calendar indexes ({stats['hits']} hits)")
+            print(f"scheduling-check with {events} events cached: p50 {statistics.median(timings) * 1000:.1f}ms per request,"
+                  f" {result['timing']['queries']} index queries at {result['timing']['query_us']}us each")
+
+            booked = await scheduling_check({**payload, "trial": {**payload["trial"], "trial_date": booked_trial_day.isoformat()},
+                                             "deadlines": []})
+            check([c["key"] for c in booked.json()["conflicts"]] == ["trial:courtroom"],
+                  "a trial already in the calendar is a conflict, even one shown as free")
+            check(all(e["event"]["showAs"] == "busy" for e in build_trial_events(payload) if e["key"].startswith("trial:")),
+                  "new trial events are created as busy")
+
+            builds = (await client.get("/api/msgraph/scheduling-check/stats", headers=auth)).json()["builds"]
+            # What a change notification does: the next read replays the delta link
+            fake.add_event("courtroom", "Late booking", midnight(trial_date) + datetime.timedelta(hours=20), showAs="busy")
+            event_store.mark_stale(user_id, "courtroom")
+            result = (await scheduling_check(payload)).json()
+            trial_conflict = next(c for c in result["conflicts"] if c["key"] == "trial:courtroom")
+            stats = (await client.get("/api/msgraph/scheduling-check/stats", headers=auth)).json()
+            check("Late booking" in [e["subject"] for e in trial_conflict["events"]] and stats["builds"] == builds + 1,
+                  "a changed calendar is re-indexed on the next check")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calendars", type=int, default=20)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    verify_index(rng)
+    time_queries(rng, args.calendars, args.events, args.queries)
+    asyncio.run(check_endpoint(args.events))
+
+
+if __name__ == "__main__":
+    main()
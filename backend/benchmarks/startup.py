@@ -0,0 +1,156 @@
+"""
+Cold start: how long a fresh worker process takes to import backend.main,
+build the app, run its startup and answer the first request (an
+authenticated /api/msgraph/status, which reads Supabase), and which parts
+of the supabase stack it had to import on the way.
+
+Each run is a new interpreter started with -X importtime, against
+FakeSupabase on 127.0.0.1. --ref measures a git revision of the backend
+side by side with the working tree (it is extracted with git archive into
+a temporary directory):
+
+    python -m backend.benchmarks.startup --runs 5 --ref HEAD~1
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from .fake_services import FakeSupabase, LocalServers
+
+JWT_SECRET = "benchmark-secret"
+
+# Runs inside the measured process; everything before the import of backend.main is timed as interpreter start
+CHILD = r"""
+import time
+started = time.perf_counter()
+import sys, json
+import backend.main as main
+imported = time.perf_counter()
+app = main.app
+built = time.perf_counter()
+
+import asyncio
+import httpx
+from jose import jwt
+
+async def requests():
+    user_id = sys.argv[1]
+    auth = {"Authorization": "Bearer " + jwt.encode({"sub": user_id}, sys.argv[2], algorithm="HS256")}
+    timings = {}
+    async with app.router.lifespan_context(app):
+        timings["ready"] = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+            for name in ("first", "second"):
+                response = await client.post("/api/msgraph/status", json={"user_id": user_id}, headers=auth)
+                assert response.json() == {"connected": True}, response.text
+                timings[name] = time.perf_counter()
+    return timings
+
+timings = asyncio.run(requests())
+stack = ("supabase", "supabase_auth", "supabase_functions", "realtime", "storage3", "postgrest")
+print(json.dumps({
+    "import": imported - started,
+    "build": built - imported,
+    "startup": timings["ready"] - built,
+    "first_request": timings["first"] - timings["ready"],
+    "second_request": timings["second"] - timings["first"],
+    "packages": sorted({name.split(".")[0] for name in sys.modules} & set(stack)),
+}))
+"""
+
+
+def extract(ref: str) -> str:
+    """The backend package at `ref`, unpacked into a temporary directory."""
+    directory = tempfile.mkdtemp(prefix="startup-")
+    root = subprocess.run(["git", "rev-parse", "--show-toplevel"], capture_output=True, text=True, check=True).stdout.strip()
+    archive = subprocess.run(["git", "archive", ref, "backend"], cwd=root, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+    return directory
+
+
+def import_times(stderr: str) -> dict:
+    """Cumulative microseconds per module from -X importtime output."""
+    times = {}
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def measure(tree: str, env: dict, user_id: str) -> dict:
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD, user_id, JWT_SECRET],
+                             cwd=tree, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if process.returncode != 0:
+        raise SystemExit(f"FAILED in {tree}:\n{process.stderr[-3000:]}")
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result["process"] = wall
+    modules = import_times(process.stderr)
+    result["supabase_module_ms"] = modules.get("backend.supabase", 0) / 1000
+    return result
+
+
+def summarize(label: str, runs: list) -> dict:
+    median = {key: statistics.median(run[key] for run in runs) for key in
+              ("import", "build", "startup", "first_request", "second_request", "process", "supabase_module_ms")}
+    print(f"{label}:")
+    print(f"  import backend.main {median['import'] * 1000:7.1f}ms   (backend.supabase {median['supabase_module_ms']:.1f}ms of it)")
+    print(f"  build app           {median['build'] * 1000:7.1f}ms")
+    print(f"  lifespan startup    {median['startup'] * 1000:7.1f}ms")
+    print(f"  first request       {median['first_request'] * 1000:7.1f}ms   second {median['second_request'] * 1000:.1f}ms")
+    print(f"  process start to first response {median['process'] * 1000:7.1f}ms")
+    print(f"  supabase packages imported: {', '.join(runs[0]['packages']) or 'none'}")
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ref", help="git revision to compare against, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    supabase = FakeSupabase()
+    user_id = str(uuid.uuid4())
+    supabase.tables["ms_tokens"].append({"user_id": user_id, "access_token": "fake-access", "refresh_token": None, "expires_at": None})
+    servers = LocalServers(supabase=supabase.app)
+    servers.start()
+    env = {
+        **os.environ,
+        "SUPABASE_URL": servers.url("supabase"),
+        "SUPABASE_SERVICE_KEY": "benchmark",
+        "SUPABASE_JWT_SECRET": JWT_SECRET,
+        "JOB_DB_PATH": os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"),
+        "LOG_LEVEL": "WARNING",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    env.pop("PYTHONPATH", None)
+
+    trees = [("working tree", os.getcwd())]
+    if args.ref:
+        trees.insert(0, (args.ref, extract(args.ref)))
+    try:
+        # One discarded run per tree so every measured run finds the bytecode cache warm
+        for _, tree in trees:
+            measure(tree, {**env, "PYTHONDONTWRITEBYTECODE": ""}, user_id)
+        results = [summarize(label, [measure(tree, env, user_id) for _ in range(args.runs)]) for label, tree in trees]
+    finally:
+        servers.stop()
+
+    if len(results) == 2:
+        before, after = results
+        print(f"import {before['import'] * 1000:.0f}ms -> {after['import'] * 1000:.0f}ms, "
+              f"first request {before['first_request'] * 1000:.0f}ms -> {after['first_request'] * 1000:.0f}ms, "
+              f"process start to first response {before['process'] * 1000:.0f}ms -> {after['process'] * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
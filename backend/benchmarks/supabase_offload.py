@@ -0,0 +1,91 @@
+"""
+Shows that Supabase calls no longer serialize the event loop.
+
+Every ms_tokens query is replaced with one that blocks its thread for
+--latency seconds (as a slow Postgres round-trip would). N concurrent
+/api/msgraph/status requests should then finish in roughly one request's
+time, not N times that.
+
+    python -m backend.benchmarks.supabase_offload --requests 10 --latency 0.2
+"""
+import os
+import time
+import uuid
+import asyncio
+import argparse
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "benchmark-secret")
+
+import httpx
+from jose import jwt
+from backend import db
+from backend.settings import get_settings
+from backend.supabase import set_supabase
+
+
+class SlowResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class SlowQuery:
+    """Stands in for a postgrest query builder whose execute() blocks."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        time.sleep(self.latency)
+        return SlowResponse([{"user_id": "benchmark"}])
+
+
+class SlowSupabase:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def table(self, name):
+        return SlowQuery(self.latency)
+
+
+async def run(requests: int, latency: float) -> float:
+    from backend.main import app
+
+    set_supabase(SlowSupabase(latency))
+    user_id = str(uuid.uuid4())
+    token = jwt.encode({"sub": user_id}, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/api/msgraph/status", json={"user_id": user_id}, headers=headers)
+            for _ in range(requests)
+        ])
+        elapsed = time.perf_counter() - started
+
+    assert all(r.status_code == 200 and r.json() == {"connected": True} for r in responses)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    elapsed = asyncio.run(run(args.requests, args.latency))
+    serial = args.requests * args.latency
+    print(f"{args.requests} concurrent /status requests, {args.latency:.3f}s per Supabase call")
+    print(f"  elapsed: {elapsed:.3f}s (serialized would be {serial:.3f}s)")
+    if args.requests <= get_settings().supabase_max_threads and elapsed > args.latency * 3:
+        raise SystemExit("Supabase calls are blocking the event loop")
+
+
+if __name__ == "__main__":
+    main()
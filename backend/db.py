@@ -0,0 +1,56 @@
+from typing import Optional
+import anyio
+from .settings import get_settings
+from .supabase import get_supabase
+from .metrics import timed
+
+# The supabase client is synchronous. Every .execute() runs on a bounded pool of
+# worker threads (SUPABASE_MAX_THREADS) so a slow Postgres round-trip never stalls the event loop.
+_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def _get_limiter() -> anyio.CapacityLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(get_settings().supabase_max_threads)
+    return _limiter
+
+
+async def run_query(query):
+    """Execute a supabase query builder off the event loop and return the response."""
+    method = getattr(getattr(query, "http_method", None), "value", "QUERY")
+    with timed("supabase", f"{method} {getattr(query, 'path', '')}"):
+        return await anyio.to_thread.run_sync(query.execute, limiter=_get_limiter())
+
+
+# ms_tokens
+
+async def get_ms_tokens(user_id: str) -> Optional[dict]:
+    result = await run_query(
+        get_supabase().table("ms_tokens").select("access_token, refresh_token, expires_at").eq("user_id", user_id)
+    )
+    return result.data[0] if result.data else None
+
+
+async def ms_tokens_exist(user_id: str) -> bool:
+    result = await run_query(get_supabase().table("ms_tokens").select("user_id").eq("user_id", user_id))
+    return bool(result.data)
+
+
+async def update_ms_tokens(user_id: str, data: dict):
+    return await run_query(get_supabase().table("ms_tokens").update(data).eq("user_id", user_id))
+
+
+async def upsert_ms_tokens(data: dict):
+    return await run_query(get_supabase().table("ms_tokens").upsert(data))
+
+
+async def delete_ms_tokens(user_id: str):
+    return await run_query(get_supabase().table("ms_tokens").delete().eq("user_id", user_id))
+
+
+# user_profiles
+
+async def get_user_profile(user_id: str) -> Optional[dict]:
+    result = await run_query(get_supabase().table("user_profiles").select("*").eq("id", user_id))
+    return result.data[0] if result.data else None
@@ -0,0 +1,153 @@
+import datetime
+from array import array
+from typing import Iterable, Optional
+from backend.settings import DEFAULTS, get_settings
+from .holidays import JURISDICTION_RULES, DEFAULT_JURISDICTION, holidays_for_year
+
+
+
+class BusinessDayCalendar:
+    """
+    Precomputed business days for one jurisdiction, in the spirit of NumPy's
+    busdaycalendar/busday_offset.
+
+    The calendar keeps the ordinals of every business day in its range plus,
+    for every day in the range, the index of the first business day on or
+    after it. Moving N business days is then two table lookups and an index
+    addition, with no search and no stepping through the calendar.
+    """
+
+    def __init__(self, holidays: Iterable[datetime.date], start_year: int = DEFAULTS.deadline_calendar_start_year,
+                 end_year: int = DEFAULTS.deadline_calendar_end_year):
+        self.start = datetime.date(start_year, 1, 1)
+        self.end = datetime.date(end_year, 12, 31)
+        self.holidays = frozenset(d for d in holidays if self.start <= d <= self.end)
+        holiday_ordinals = {d.toordinal() for d in self.holidays}
+        start, end = self.start.toordinal(), self.end.toordinal()
+        self.business_days = array("l")
+        # _rank[n - start]: index in business_days of the first business day on or after ordinal n
+        self._rank = array("l")
+        for n in range(start, end + 1):
+            self._rank.append(len(self.business_days))
+            # date.toordinal() % 7: 0 is Sunday, 6 is Saturday
+            if n % 7 not in (0, 6) and n not in holiday_ordinals:
+                self.business_days.append(n)
+
+    def is_business_day(self, day: datetime.date) -> bool:
+        n = day.toordinal()
+        k = n - self.start.toordinal()
+        if not 0 <= k < len(self._rank):
+            return False
+        i = self._rank[k]
+        return i < len(self.business_days) and self.business_days[i] == n
+
+    def offset_ordinal(self, n: int, offset: int) -> int:
+        """
+        Move `offset` business days from ordinal `n`, counting the way a clerk
+        steps through the calendar: the reference day itself is never counted,
+        so a non-business reference day rolls toward the direction of travel.
+        """
+        if offset == 0:
+            return n
+        k = n - self.start.toordinal()
+        if not 0 <= k < len(self._rank):
+            raise ValueError(f"Date {datetime.date.fromordinal(n)} is outside {self.start}..{self.end}")
+        i = self._rank[k]
+        if offset > 0 and (i >= len(self.business_days) or self.business_days[i] != n):
+            # Not a business day: "roll backward" so the first step lands on the next one
+            i -= 1
+        target = i + offset
+        if target < 0 or target >= len(self.business_days):
+            raise ValueError(f"Date {datetime.date.fromordinal(n)} offset by {offset} business days is outside {self.start}..{self.end}")
+        return self.business_days[target]
+
+    def busday_offset(self, day: datetime.date, offset: int) -> datetime.date:
+        return datetime.date.fromordinal(self.offset_ordinal(day.toordinal(), offset))
+
+    def busday_offsets(self, days: list, offsets: list) -> list:
+        """Batch form of busday_offset for parallel lists of dates and offsets."""
+        offset_ordinal = self.offset_ordinal
+        return [
+            datetime.date.fromordinal(offset_ordinal(day.toordinal(), offset))
+            for day, offset in zip(days, offsets)
+        ]
+
+
+_calendars: dict = {}
+
+
+def jurisdictions() -> list:
+    return sorted(JURISDICTION_RULES)
+
+
+def get_calendar(jurisdiction: Optional[str] = None) -> BusinessDayCalendar:
+    """Return the cached business-day table for a jurisdiction, building it on first use."""
+    jurisdiction = (jurisdiction or DEFAULT_JURISDICTION).upper()
+    if jurisdiction not in JURISDICTION_RULES:
+        raise KeyError(jurisdiction)
+    calendar = _calendars.get(jurisdiction)
+    if calendar is None:
+        settings = get_settings()
+        start_year, end_year = settings.deadline_calendar_start_year, settings.deadline_calendar_end_year
+        holidays = set()
+        for year in range(start_year, end_year + 1):
+            holidays |= holidays_for_year(jurisdiction, year)
+        calendar = _calendars[jurisdiction] = BusinessDayCalendar(holidays, start_year, end_year)
+    return calendar
+
+
+def resolve_reference(deadline: dict, trial_date: Optional[str], custom_dates: dict) -> tuple:
+    """Return (reference label, reference date string) for a FormTemplateDeadline."""
+    if deadline.get("reference_type") == "trial_date":
+        return "Trial Date", trial_date or ""
+    name = deadline.get("custom_reference_name")
+    if name:
+        return name, custom_dates.get(name) or ""
+    return "", ""
+
+
+def calculate_deadlines(trials: list, jurisdiction: Optional[str] = None) -> list:
+    """
+    Compute calculated deadlines for many trials at once.
+
+    Each trial is {"trial_id"?, "trial_date", "custom_dates": {name: date},
+    "deadlines": [FormTemplateDeadline]}. Deadlines count `days_before`
+    business or calendar days back from their reference date. All business-day
+    offsets across all trials are resolved in one batch against the
+    jurisdiction's precomputed tables.
+    Returns one {"trial_id", "deadlines": [CalculatedDeadline]} per trial.
+    """
+    calendar = get_calendar(jurisdiction)
+
+    results = []
+    batch_days, batch_offsets, batch_slots = [], [], []
+    for trial in trials:
+        custom_dates = trial.get("custom_dates") or {}
+        calculated = []
+        for deadline in trial.get("deadlines") or []:
+            label, reference = resolve_reference(deadline, trial.get("trial_date"), custom_dates)
+            days_before = int(deadline.get("days_before") or 0)
+            item = {
+                "deadline_id": deadline.get("id"),
+                "deadline_name": deadline.get("deadline_name"),
+                "calculated_date": "",
+                "reference_date": label,
+                "reference_type": deadline.get("reference_type"),
+                "days_before": days_before,
+                "is_business_days": bool(deadline.get("is_business_days")),
+            }
+            calculated.append(item)
+            if not reference:
+                continue
+            reference_day = datetime.date.fromisoformat(reference[:10])
+            if item["is_business_days"]:
+                batch_days.append(reference_day)
+                batch_offsets.append(-days_before)
+                batch_slots.append(item)
+            else:
+                item["calculated_date"] = (reference_day - datetime.timedelta(days=days_before)).isoformat()
+        results.append({"trial_id": trial.get("trial_id"), "deadlines": calculated})
+
+    for item, day in zip(batch_slots, calendar.busday_offsets(batch_days, batch_offsets)):
+        item["calculated_date"] = day.isoformat()
+    return results
@@ -0,0 +1,116 @@
+import datetime
+from typing import Callable
+
+# Court holiday rules per jurisdiction. Each rule maps a year to the holiday
+# date(s) in that year; fixed-date holidays that fall on a weekend are observed
+# on the next weekday, as court registries do.
+
+MON, TUE, WED, THU, FRI, SAT, SUN = range(7)
+
+
+def easter_sunday(year: int) -> datetime.date:
+    """Gregorian Easter (Anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def nth_weekday(year: int, month: int, weekday: int, n: int) -> datetime.date:
+    first = datetime.date(year, month, 1)
+    return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def weekday_before(year: int, month: int, day: int, weekday: int) -> datetime.date:
+    """Last `weekday` strictly before month/day (e.g. Victoria Day: Monday before May 25)."""
+    target = datetime.date(year, month, day)
+    return target - datetime.timedelta(days=(target.weekday() - weekday - 1) % 7 + 1)
+
+
+def fixed(month: int, day: int, since: int = 0) -> Callable[[int], list]:
+    return lambda year: [datetime.date(year, month, day)] if year >= since else []
+
+
+def nth(month: int, weekday: int, n: int, since: int = 0) -> Callable[[int], list]:
+    return lambda year: [nth_weekday(year, month, weekday, n)] if year >= since else []
+
+
+def good_friday(year: int) -> list:
+    return [easter_sunday(year) - datetime.timedelta(days=2)]
+
+
+def easter_monday(year: int) -> list:
+    return [easter_sunday(year) + datetime.timedelta(days=1)]
+
+
+def victoria_day(year: int) -> list:
+    return [weekday_before(year, 5, 25, MON)]
+
+
+# Fixed-date holidays get weekend observance; rule-based ones already land on weekdays
+FIXED, MOVABLE = "fixed", "movable"
+
+CANADA_COMMON = [
+    (FIXED, fixed(1, 1)),            # New Year's Day
+    (MOVABLE, good_friday),
+    (MOVABLE, victoria_day),
+    (FIXED, fixed(7, 1)),            # Canada Day
+    (MOVABLE, nth(9, MON, 1)),       # Labour Day
+    (FIXED, fixed(9, 30, 2021)),     # National Day for Truth and Reconciliation
+    (MOVABLE, nth(10, MON, 2)),      # Thanksgiving
+    (FIXED, fixed(11, 11)),          # Remembrance Day
+    (FIXED, fixed(12, 25)),          # Christmas Day
+    (FIXED, fixed(12, 26)),          # Boxing Day
+]
+
+JURISDICTION_RULES = {
+    # Weekends only; matches the original client-side calculation
+    "NONE": [],
+    # British Columbia (Interpretation Act holidays)
+    "BC": CANADA_COMMON + [
+        (MOVABLE, nth(2, MON, 3, 2019)),  # Family Day
+        (MOVABLE, easter_monday),
+        (MOVABLE, nth(8, MON, 1)),        # B.C. Day
+    ],
+    # Ontario (Rules of Civil Procedure holidays)
+    "ON": CANADA_COMMON + [
+        (MOVABLE, nth(2, MON, 3, 2008)),  # Family Day
+        (MOVABLE, easter_monday),
+        (MOVABLE, nth(8, MON, 1)),        # Civic Holiday
+    ],
+    # Federal Court of Canada
+    "FC": CANADA_COMMON + [
+        (MOVABLE, easter_monday),
+    ],
+}
+
+# Callers that name no jurisdiction get the weekends-only calculation they had before
+DEFAULT_JURISDICTION = "NONE"
+
+
+def holidays_for_year(jurisdiction: str, year: int) -> set:
+    """All court holidays in `year` for `jurisdiction`, with weekend observance applied."""
+    rules = JURISDICTION_RULES[jurisdiction]
+    movable = set()
+    observed = []
+    for kind, rule in rules:
+        for day in rule(year):
+            if kind == MOVABLE:
+                movable.add(day)
+            else:
+                observed.append(day)
+
+    result = set(movable)
+    for day in sorted(observed):
+        # A weekend holiday moves to the next weekday that isn't already a holiday
+        while day.weekday() >= SAT or day in result:
+            day += datetime.timedelta(days=1)
+        result.add(day)
+    return result
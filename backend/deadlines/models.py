@@ -0,0 +1,33 @@
+from typing import Dict, List, Optional
+from pydantic import BaseModel, ConfigDict
+
+# Request bodies of /api/deadlines/calculate. They are validated before the
+# engine sees them, so a malformed trial or deadline is a 400, not a 500.
+# Unknown keys (template ids, names, ...) are allowed and ignored.
+
+
+class DeadlineDefinition(BaseModel):
+    """A FormTemplateDeadline."""
+    model_config = ConfigDict(extra="ignore")
+
+    id: Optional[str] = None
+    deadline_name: Optional[str] = None
+    reference_type: Optional[str] = None
+    custom_reference_name: Optional[str] = None
+    days_before: Optional[int] = None
+    is_business_days: bool = False
+
+
+class TrialDeadlines(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    trial_id: Optional[str] = None
+    trial_date: Optional[str] = None
+    custom_dates: Dict[str, Optional[str]] = {}
+    deadlines: List[DeadlineDefinition] = []
+
+
+class CalculateRequest(TrialDeadlines):
+    """One trial (the TrialDeadlines fields) or many at once ("trials")."""
+    jurisdiction: Optional[str] = None
+    trials: Optional[List[TrialDeadlines]] = None
@@ -0,0 +1,56 @@
+import logging
+import datetime
+from fastapi import APIRouter, Request, Depends, HTTPException
+from pydantic import ValidationError
+from backend.auth.dependency import get_current_user
+from .engine import calculate_deadlines, get_calendar, jurisdictions
+from .holidays import DEFAULT_JURISDICTION
+from .models import CalculateRequest
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.post("/api/deadlines/calculate")
+async def deadlines_calculate(request: Request, user=Depends(get_current_user)):
+    """
+    Calculate deadlines for one trial ({"trial_date", "custom_dates", "deadlines"})
+    or for many at once ({"trials": [...]}), e.g. to recompute every trial
+    after a holiday table changes. "jurisdiction" picks the court holidays;
+    without one only weekends are skipped.
+    """
+    try:
+        data = await request.json()
+    except Exception as e:
+        logger.info("Error parsing JSON: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    try:
+        body = CalculateRequest.model_validate(data)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors(include_url=False, include_context=False, include_input=False))
+
+    jurisdiction = body.jurisdiction or DEFAULT_JURISDICTION
+    trials = [trial.model_dump() for trial in body.trials] if body.trials is not None else [body.model_dump()]
+    try:
+        results = calculate_deadlines(trials, jurisdiction)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown jurisdiction {jurisdiction!r}; expected one of {jurisdictions()}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if body.trials is not None:
+        return {"jurisdiction": jurisdiction.upper(), "trials": results}
+    return {"jurisdiction": jurisdiction.upper(), "deadlines": results[0]["deadlines"]}
+
+
+@router.get("/api/deadlines/holidays")
+async def deadlines_holidays(jurisdiction: str = DEFAULT_JURISDICTION, year: int = None, user=Depends(get_current_user)):
+    """Court holidays used for a jurisdiction's business-day calculations."""
+    try:
+        calendar = get_calendar(jurisdiction)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown jurisdiction {jurisdiction!r}; expected one of {jurisdictions()}")
+    year = year or datetime.date.today().year
+    holidays = sorted(d.isoformat() for d in calendar.holidays if d.year == year)
+    return {"jurisdiction": jurisdiction.upper(), "year": year, "holidays": holidays}
@@ -0,0 +1,45 @@
+"""
+Serving with gunicorn and uvicorn workers (Linux/macOS):
+
+    pip install gunicorn uvicorn-worker
+    gunicorn -c backend/gunicorn.conf.py backend.main:app
+
+The app is imported and built once in the master (preload_app) and forked
+into the worker, so a restarted worker starts with FastAPI and the routes
+already in memory instead of importing them itself. Every connection,
+thread and the job database are opened per worker in the app's lifespan,
+after the fork.
+
+Without gunicorn (the app is built in the process itself, no preloading):
+
+    uvicorn backend.main:create_app --factory --port 8080
+
+Between two and four workers by default. What the workers share:
+
+- the job queue, the trial sync idempotency keys and the Graph
+  subscriptions with their clientState, in the SQLite job database;
+- token invalidation (/disconnect, /token), calendar change notifications
+  and live-update messages, over the worker bus (a table in the same
+  database that every worker polls every WORKER_BUS_POLL_INTERVAL);
+- the Graph limits: each worker takes 1/WEB_CONCURRENCY of the mailbox and
+  app concurrency and of the app request rate.
+
+What stays per worker: the token, calendar and event caches (memory use and
+the first Graph delta calls grow with the worker count), /metrics (each
+worker reports its own), and a calendar list force_refresh, which refreshes
+the answering worker's cache only. All workers must run on one host, next
+to the one SQLite file; this is not a setup for several hosts.
+"""
+import os
+import multiprocessing
+
+bind = os.getenv("BIND", "0.0.0.0:8080")
+# At least two, at most four: each worker gets a share of Outlook's 4 concurrent requests per mailbox
+workers = int(os.getenv("WEB_CONCURRENCY", str(max(2, min(4, multiprocessing.cpu_count())))))
+# Read by the app's settings in every forked worker, which divide the Graph limits by it
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "uvicorn_worker.UvicornWorker")
+preload_app = True
+# Lifespan shutdown waits up to JOB_SHUTDOWN_GRACE for running jobs
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
@@ -0,0 +1,74 @@
+import datetime
+from fastapi import APIRouter, Request, Depends, HTTPException
+from backend.auth.dependency import get_current_user
+from .store import JobStore, QUEUED, RUNNING, SUCCEEDED, DEAD
+from .workers import WorkerPool
+
+router = APIRouter()
+
+
+def get_job_store(request: Request) -> JobStore:
+    """FastAPI dependency returning the job store opened by the app lifespan."""
+    return request.app.state.job_store
+
+
+def get_job_workers(request: Request) -> WorkerPool:
+    return request.app.state.job_workers
+
+
+def _timestamp(value):
+    return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).isoformat() if value else None
+
+
+def public_job(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "max_attempts": job["max_attempts"],
+        "created_at": _timestamp(job["created_at"]),
+        "updated_at": _timestamp(job["updated_at"]),
+        # When a queued job (e.g. one waiting to retry) becomes due
+        "next_attempt_at": _timestamp(job["run_at"]) if job["status"] == QUEUED else None,
+        "result": job["result"],
+        "error": job["error"],
+    }
+
+
+@router.get("/api/jobs/stats")
+async def jobs_stats(user=Depends(get_current_user), workers: WorkerPool = Depends(get_job_workers)):
+    """Worker pool state and job counts per status."""
+    return await workers.stats()
+
+
+@router.get("/api/jobs")
+async def jobs_list(status: str = None, limit: int = 50, user=Depends(get_current_user), store: JobStore = Depends(get_job_store)):
+    """The caller's most recent jobs, newest first; ?status=dead lists the dead-letter queue."""
+    if status and status not in (QUEUED, RUNNING, SUCCEEDED, DEAD):
+        raise HTTPException(status_code=400, detail=f"Unknown status {status!r}")
+    jobs = await store.list(user["sub"], status, max(1, min(limit, 200)))
+    return {"jobs": [public_job(job) for job in jobs]}
+
+
+@router.get("/api/jobs/{job_id}")
+async def jobs_get(job_id: str, user=Depends(get_current_user), store: JobStore = Depends(get_job_store)):
+    """Poll a job: queued, running, succeeded (with its result) or dead (with the last error)."""
+    job = await store.get(job_id)
+    if job is None or job["user_id"] != user["sub"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+
+@router.post("/api/jobs/{job_id}/retry")
+async def jobs_retry(job_id: str, user=Depends(get_current_user), store: JobStore = Depends(get_job_store),
+                     workers: WorkerPool = Depends(get_job_workers)):
+    """Move a dead-lettered job back into the queue."""
+    job = await store.get(job_id)
+    if job is None or job["user_id"] != user["sub"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != DEAD:
+        raise HTTPException(status_code=409, detail=f"Only dead-lettered jobs can be retried (job is {job['status']})")
+    job = await store.requeue(job_id, user["sub"])
+    workers.notify()
+    return public_job(job)
@@ -0,0 +1,264 @@
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Optional
+import anyio
+from backend.settings import DEFAULTS
+
+QUEUED, RUNNING, SUCCEEDED, DEAD = "queued", "running", "succeeded", "dead"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    locked_until REAL,
+    lease_owner TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at);
+CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, status, seq);
+"""
+
+# Columns added since the first release, for job databases created before them
+COLUMNS = {"lease_owner": "TEXT"}
+
+# Claimable: queued and due, or running with an expired lease (its worker died).
+# Per-user ordering: nothing earlier for the same user may still be pending.
+CLAIM = """
+SELECT * FROM jobs AS j
+WHERE ((j.status = 'queued' AND j.run_at <= :now) OR (j.status = 'running' AND j.locked_until <= :now))
+  AND NOT EXISTS (
+      SELECT 1 FROM jobs AS p
+      WHERE p.user_id = j.user_id AND p.seq < j.seq AND p.status IN ('queued', 'running')
+  )
+ORDER BY j.run_at, j.seq
+LIMIT 1
+"""
+
+
+def _row(row: Optional[sqlite3.Row]) -> Optional[dict]:
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+
+class SQLiteStore:
+    """
+    A table set in a SQLite file (WAL mode) used from async code. All calls
+    run on one background thread per store so the event loop never blocks;
+    several stores, and several worker processes, can share one file.
+    Subclasses set `schema` and run their statements through _run/_transaction.
+    """
+
+    schema = ""
+
+    def __init__(self, path: str = DEFAULTS.job_db_path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(self.schema)
+        self._lock = threading.Lock()
+        self._limiter: Optional[anyio.CapacityLimiter] = None
+
+    async def _run(self, fn, *args):
+        if self._limiter is None:
+            self._limiter = anyio.CapacityLimiter(1)
+        return await anyio.to_thread.run_sync(fn, *args, limiter=self._limiter)
+
+    def _locked(self, fn, *args):
+        """Run a read on the connection; close() waits for it."""
+        with self._lock:
+            return fn(*args)
+
+    def _transaction(self, fn, *args):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(*args)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobStore(SQLiteStore):
+    """
+    Durable job queue in SQLite (WAL mode).
+
+    Jobs for one user run strictly in the order they were enqueued: a job is
+    only claimed once every earlier job of that user has succeeded or been
+    dead-lettered, including while an earlier job waits for a retry. Claims
+    are leases, so jobs held by a worker that died are picked up again.
+    Every claim gets its own lease_owner token, and only the holder of the
+    current lease can extend it or record the job's outcome: a worker that
+    lost its lease can't overwrite the result of the one that took over.
+    All calls run on one background thread so the event loop never blocks.
+    """
+
+    schema = SCHEMA
+
+    def __init__(self, path: str = DEFAULTS.job_db_path, lease_seconds: float = DEFAULTS.job_lease_seconds,
+                 retention: float = DEFAULTS.job_retention_seconds, max_attempts: int = DEFAULTS.job_max_attempts):
+        super().__init__(path)
+        self.lease_seconds = lease_seconds
+        self.retention = retention
+        self.max_attempts = max_attempts
+        with self._lock:
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    # Writes
+
+    def _enqueue(self, user_id: str, kind: str, payload: dict, max_attempts: int) -> dict:
+        now = time.time()
+        job_id = str(uuid.uuid4())
+        self._conn.execute(
+            "INSERT INTO jobs (id, user_id, kind, payload, status, max_attempts, run_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, user_id, kind, json.dumps(payload), QUEUED, max_attempts, now, now, now),
+        )
+        return self._get(job_id)
+
+    async def enqueue(self, user_id: str, kind: str, payload: dict, max_attempts: Optional[int] = None) -> dict:
+        return await self._run(self._transaction, self._enqueue, user_id, kind, payload, max_attempts or self.max_attempts)
+
+    def _claim(self) -> Optional[dict]:
+        now = time.time()
+        row = self._conn.execute(CLAIM, {"now": now}).fetchone()
+        if row is None:
+            return None
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, locked_until = ?, lease_owner = ?, updated_at = ? WHERE seq = ?",
+            (RUNNING, now + self.lease_seconds, uuid.uuid4().hex, now, row["seq"]),
+        )
+        return self._get(row["id"])
+
+    async def claim(self) -> Optional[dict]:
+        """Take the next runnable job, or None if nothing is due. The job's lease_owner identifies this claim."""
+        return await self._run(self._transaction, self._claim)
+
+    def _extend(self, job_id: str, owner: str) -> bool:
+        now = time.time()
+        cursor = self._conn.execute(
+            "UPDATE jobs SET locked_until = ?, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+            (now + self.lease_seconds, now, job_id, owner, RUNNING),
+        )
+        return cursor.rowcount > 0
+
+    async def extend(self, job_id: str, owner: str) -> bool:
+        """Renew a running job's lease for another lease_seconds. False if the lease was lost."""
+        return await self._run(self._transaction, self._extend, job_id, owner)
+
+    def _finish(self, job_id: str, owner: str, status: str, result, error: Optional[str], run_at: Optional[float]) -> bool:
+        now = time.time()
+        cursor = self._conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, run_at = COALESCE(?, run_at), locked_until = NULL, lease_owner = NULL, "
+            "updated_at = ? WHERE id = ? AND lease_owner = ?",
+            (status, json.dumps(result) if result is not None else None, error, run_at, now, job_id, owner),
+        )
+        return cursor.rowcount > 0
+
+    # Each returns False, changing nothing, if `owner` no longer holds the job's lease
+
+    async def succeed(self, job_id: str, owner: str, result) -> bool:
+        return await self._run(self._transaction, self._finish, job_id, owner, SUCCEEDED, result, None, None)
+
+    async def retry(self, job_id: str, owner: str, error: str, delay: float) -> bool:
+        return await self._run(self._transaction, self._finish, job_id, owner, QUEUED, None, error, time.time() + delay)
+
+    async def dead_letter(self, job_id: str, owner: str, error: str, result=None) -> bool:
+        return await self._run(self._transaction, self._finish, job_id, owner, DEAD, result, error, None)
+
+    def _release(self, job_id: str, owner: str) -> bool:
+        # Put back a job interrupted by shutdown without charging it an attempt
+        cursor = self._conn.execute(
+            "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), locked_until = NULL, lease_owner = NULL, run_at = ?, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ? AND status = ?",
+            (QUEUED, time.time(), time.time(), job_id, owner, RUNNING),
+        )
+        return cursor.rowcount > 0
+
+    async def release(self, job_id: str, owner: str) -> bool:
+        return await self._run(self._transaction, self._release, job_id, owner)
+
+    def _prune(self) -> int:
+        cursor = self._conn.execute("DELETE FROM jobs WHERE status = ? AND updated_at <= ?", (SUCCEEDED, time.time() - self.retention))
+        return cursor.rowcount
+
+    async def prune(self) -> int:
+        """Delete jobs that succeeded more than `retention` seconds ago. Returns how many."""
+        return await self._run(self._transaction, self._prune)
+
+    def _requeue(self, job_id: str, user_id: str) -> Optional[dict]:
+        job = self._get(job_id)
+        if job is None or job["user_id"] != user_id or job["status"] != DEAD:
+            return job
+        # Goes to the back of the user's queue
+        self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        now = time.time()
+        self._conn.execute(
+            "INSERT INTO jobs (id, user_id, kind, payload, status, max_attempts, run_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, user_id, job["kind"], json.dumps(job["payload"]), QUEUED, job["max_attempts"], now, job["created_at"], now),
+        )
+        return self._get(job_id)
+
+    async def requeue(self, job_id: str, user_id: str) -> Optional[dict]:
+        """Send a dead-lettered job back through the queue with a fresh set of attempts."""
+        return await self._run(self._transaction, self._requeue, job_id, user_id)
+
+    # Reads
+
+    def _get(self, job_id: str) -> Optional[dict]:
+        return _row(self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def _locked_get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._get(job_id)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self._run(self._locked_get, job_id)
+
+    def _list(self, user_id: str, status: Optional[str], limit: int) -> list:
+        with self._lock:
+            if status:
+                rows = self._conn.execute("SELECT * FROM jobs WHERE user_id = ? AND status = ? ORDER BY seq DESC LIMIT ?", (user_id, status, limit))
+            else:
+                rows = self._conn.execute("SELECT * FROM jobs WHERE user_id = ? ORDER BY seq DESC LIMIT ?", (user_id, limit))
+            return [_row(row) for row in rows.fetchall()]
+
+    async def list(self, user_id: str, status: Optional[str] = None, limit: int = 50) -> list:
+        return await self._run(self._list, user_id, status, limit)
+
+    def _counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+            return {status: count for status, count in rows}
+
+    async def counts(self) -> dict:
+        return await self._run(self._counts)
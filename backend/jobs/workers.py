@@ -0,0 +1,190 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+from backend.settings import Settings, DEFAULTS
+from .store import JobStore
+
+logger = logging.getLogger(__name__)
+
+
+class JobError(Exception):
+    """
+    Raised by a job handler to control what happens next: retryable errors
+    are tried again (after retry_after seconds if given), others go straight
+    to the dead-letter state. `result` is stored with the job either way.
+    """
+
+    def __init__(self, message: str, retryable: bool = True, retry_after: Optional[float] = None, result=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.result = result
+
+
+class LeaseLost(Exception):
+    """The job's lease ran out and another worker claimed it; this worker must not record an outcome."""
+
+
+# handler(job) -> result stored on the job when it succeeds
+JobHandler = Callable[[dict], Awaitable[object]]
+
+
+class WorkerPool:
+    """
+    Async workers draining a JobStore. Started and stopped by the app lifespan.
+    Handlers are registered per job kind; a job with no handler is dead-lettered.
+    While a handler runs its job's lease is renewed; a handler that outlives
+    `timeout` is cancelled and its job retried.
+    """
+
+    def __init__(self, store: JobStore, handlers: dict, workers: int = DEFAULTS.job_workers, poll_interval: float = DEFAULTS.job_poll_interval,
+                 timeout: float = DEFAULTS.job_timeout, prune_interval: float = DEFAULTS.job_prune_interval,
+                 retry_base: float = DEFAULTS.job_retry_base, retry_max: float = DEFAULTS.job_retry_max,
+                 shutdown_grace: float = DEFAULTS.job_shutdown_grace):
+        self.store = store
+        self.handlers = handlers
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.prune_interval = prune_interval
+        # Retry backoff: base * 2^(attempt - 1), capped, with full jitter
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        # How long stop() waits for running jobs before putting them back in the queue
+        self.shutdown_grace = shutdown_grace
+        self._next_prune = 0.0
+        self._wakeup = asyncio.Event()
+        self._tasks: list = []
+        self._running: dict = {}
+        self._stopping = False
+        self.processed = {"succeeded": 0, "retried": 0, "dead": 0}
+
+    @classmethod
+    def from_settings(cls, store: JobStore, handlers: dict, settings: Settings) -> "WorkerPool":
+        return cls(store, handlers, settings.job_workers, settings.job_poll_interval, settings.job_timeout, settings.job_prune_interval,
+                   settings.job_retry_base, settings.job_retry_max, settings.job_shutdown_grace)
+
+    def start(self) -> None:
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._work(i)) for i in range(self.workers)]
+
+    def notify(self) -> None:
+        """Wake idle workers, e.g. right after a job was enqueued."""
+        self._wakeup.set()
+
+    async def stop(self, grace: Optional[float] = None) -> None:
+        grace = self.shutdown_grace if grace is None else grace
+        self._stopping = True
+        self._wakeup.set()
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(self._tasks, timeout=grace)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.retry_max, self.retry_base * (2 ** (attempt - 1))))
+
+    async def _work(self, worker: int) -> None:
+        while not self._stopping:
+            # Cleared before looking, so a notify() that lands during the claim is not lost
+            self._wakeup.clear()
+            try:
+                job = await self.store.claim()
+            except Exception as e:
+                logger.error("Job worker %d could not claim a job: %s", worker, e)
+                job = None
+            if job is None:
+                await self._prune()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # Another job may be runnable too (a different user's, or this user's next one once done)
+            self._wakeup.set()
+            self._running[job["id"]] = job
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                await asyncio.shield(self.store.release(job["id"], job["lease_owner"]))
+                raise
+            finally:
+                self._running.pop(job["id"], None)
+            self._wakeup.set()
+
+    async def _prune(self) -> None:
+        if time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + self.prune_interval
+        try:
+            pruned = await self.store.prune()
+        except Exception as e:
+            logger.error("Could not prune finished jobs: %s", e)
+            return
+        if pruned:
+            logger.info("Pruned %d succeeded job(s)", pruned)
+
+    async def _call(self, handler: JobHandler, job: dict):
+        """Run the handler, renewing the job's lease every lease_seconds / 3 until it returns or times out."""
+        task = asyncio.ensure_future(asyncio.wait_for(handler(job), self.timeout))
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.store.lease_seconds / 3)
+                if done:
+                    break
+                if not await self.store.extend(job["id"], job["lease_owner"]):
+                    raise LeaseLost()
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        try:
+            return task.result()
+        except asyncio.TimeoutError:
+            raise JobError(f"Timed out after {self.timeout:.0f}s")
+
+    async def _run(self, job: dict) -> None:
+        job_id, owner = job["id"], job["lease_owner"]
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await self.store.dead_letter(job_id, owner, f"No handler for job kind {job['kind']!r}")
+            self.processed["dead"] += 1
+            return
+        try:
+            result = await self._call(handler, job)
+        except asyncio.CancelledError:
+            raise
+        except LeaseLost:
+            logger.warning("Job %s (%s) lost its lease to another worker; leaving it to that one", job_id, job["kind"])
+            return
+        except Exception as e:
+            retryable = getattr(e, "retryable", True)
+            result = getattr(e, "result", None)
+            error = str(e) or type(e).__name__
+            if not retryable or job["attempts"] >= job["max_attempts"]:
+                logger.warning("Job %s (%s) dead-lettered after %d attempt(s): %s", job_id, job["kind"], job["attempts"], error)
+                recorded = await self.store.dead_letter(job_id, owner, error, result)
+                self.processed["dead"] += 1
+            else:
+                delay = getattr(e, "retry_after", None) or self.backoff(job["attempts"])
+                logger.info("Job %s (%s) failed on attempt %d, retrying in %.1fs: %s", job_id, job["kind"], job["attempts"], delay, error)
+                recorded = await self.store.retry(job_id, owner, error, delay)
+                self.processed["retried"] += 1
+        else:
+            recorded = await self.store.succeed(job_id, owner, result)
+            self.processed["succeeded"] += 1
+        if not recorded:
+            logger.warning("Job %s (%s) finished after its lease was taken over; outcome not recorded", job_id, job["kind"])
+
+    async def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "processed": dict(self.processed),
+            "jobs": await self.store.counts(),
+        }
@@ -0,0 +1,112 @@
+import os
+import re
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from typing import Optional
+from .settings import get_settings
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Query parameters whose values are replaced in access log lines: the live-update
+# stream authenticates with ?access_token=<Supabase JWT>, since EventSource can't send headers
+REDACTED_QUERY_PARAMS = ("access_token",)
+_REDACTED_QUERY = re.compile(r"([?&](?:%s)=)[^&\s\"]*" % "|".join(map(re.escape, REDACTED_QUERY_PARAMS)))
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is logged as a field
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def redact_query(text: str) -> str:
+    return _REDACTED_QUERY.sub(r"\1[redacted]", text)
+
+
+class RedactQueryFilter(logging.Filter):
+    """Redacts REDACTED_QUERY_PARAMS in a record's message and arguments (uvicorn passes the path as an argument)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.msg, str):
+            record.msg = redact_query(record.msg)
+        if isinstance(record.args, tuple):
+            record.args = tuple(redact_query(arg) if isinstance(arg, str) else arg for arg in record.args)
+        return True
+
+
+_redact_filter = RedactQueryFilter()
+
+
+def configure_logging() -> None:
+    """
+    Route the root logger through a QueueHandler. Request handlers only put
+    the record on an in-memory queue; a QueueListener thread formats it and
+    writes to stderr, so slow terminal or pipe I/O never blocks the event
+    loop. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    settings = get_settings()
+    output = logging.StreamHandler()
+    if settings.log_format.lower() == "text":
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    else:
+        output.setFormatter(JSONFormatter())
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(settings.log_level.upper())
+    # uvicorn's loggers go through the same queue instead of their own stream handlers
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+    # Access lines carry the full path and query string
+    access = logging.getLogger("uvicorn.access")
+    if _redact_filter not in access.filters:
+        access.addFilter(_redact_filter)
+    # httpx logs every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def _restart_after_fork() -> None:
+    # A worker forked from a preloaded app inherits the QueueHandler but not the listener thread
+    global _listener
+    if _listener is not None:
+        _listener = None
+        configure_logging()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,23 +1,146 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
-from jose import jwt
-import httpx
-from .supabase import supabase
-from backend.auth.dependency import get_current_user
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from .log import configure_logging
+from .metrics import TimingMiddleware, render as render_metrics
+from .settings import get_settings, load_env, reset_settings
+from backend.auth.dependency import get_current_user, jwks, verified_tokens
 from backend.MSIGraph.MicrosoftGraph import router as msgraph_router
+from backend.deadlines.routes import router as deadlines_router
+from backend.MSIGraph.graph_client import create_graph_client
+from backend.MSIGraph.event_jobs import CREATE_EVENT_JOB, create_event_handler
+from backend.MSIGraph.scheduler import graph_scheduler
+from backend.MSIGraph.token_cache import TOKENS_CHANGED, token_cache
+from backend.MSIGraph.response_cache import calendar_cache
+from backend.MSIGraph.event_store import CALENDAR_CHANGED, event_store
+from backend.MSIGraph.conflicts import index_cache
+from backend.MSIGraph.notification_hub import STREAM_MESSAGE, notification_hub
+from backend.MSIGraph.subscriptions import SubscriptionStore, subscriptions
+from backend.worker_bus import WorkerBusStore, worker_bus
+from backend.MSIGraph.trial_sync import IdempotencyStore
+from backend.jobs.routes import router as jobs_router
+from backend.jobs.store import JobStore
+from backend.jobs.workers import WorkerPool
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 
-app = FastAPI()
-app.include_router(msgraph_router)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:5173"],  # or ["*"] for all origins (less secure)
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@app.get("/calendars")
+router = APIRouter()
+
+
+def _forget_user(user_id: str, body: dict) -> None:
+    # Another worker process replaced or deleted the user's Microsoft tokens
+    token_cache.invalidate(user_id)
+    calendar_cache.invalidate(user_id)
+    event_store.invalidate(user_id)
+
+
+def _mark_stale(user_id: str, body: dict) -> None:
+    # Graph's change notification for the calendar reached another worker process
+    event_store.mark_stale(user_id, body.get("calendarId"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Runs in each worker process (after the fork when preloaded), so no
+    connection or thread is shared. The PostgREST client is still made on
+    first use. Tuning comes from get_settings(), read here rather than when
+    the modules were imported.
+    """
+    settings = get_settings()
+    graph_scheduler.configure(settings)
+    token_cache.configure(settings)
+    calendar_cache.configure(settings.calendar_cache_ttl, settings.calendar_cache_stale_ttl, settings.calendar_cache_max_entries)
+    event_store.configure(settings)
+    index_cache.configure(settings)
+    verified_tokens.configure(settings)
+    jwks.configure(settings)
+    notification_hub.configure(settings)
+    subscriptions.configure(settings)
+    worker_bus.configure(settings)
+    # What one worker process changes in the others' memory (see worker_bus.py)
+    worker_bus.on(TOKENS_CHANGED, _forget_user)
+    worker_bus.on(CALENDAR_CHANGED, _mark_stale)
+    worker_bus.on(STREAM_MESSAGE, notification_hub.deliver)
+    app.state.worker_bus_store = WorkerBusStore(settings.job_db_path)
+    await worker_bus.start(app.state.worker_bus_store)
+    # One pooled (HTTP/2 where available) client shared by every Graph call
+    app.state.graph_client = create_graph_client(settings=settings)
+    # Durable queue for calendar writes made in async mode, drained by background workers
+    app.state.job_store = JobStore(settings.job_db_path, settings.job_lease_seconds, settings.job_retention_seconds, settings.job_max_attempts)
+    app.state.job_workers = WorkerPool.from_settings(app.state.job_store, {
+        CREATE_EVENT_JOB: create_event_handler(lambda: app.state.graph_client),
+    }, settings)
+    app.state.job_workers.start()
+    # Idempotency keys of trial syncs, in the same database so every worker process sees them
+    app.state.idempotency_store = IdempotencyStore(settings.job_db_path, settings.trial_sync_idempotency_ttl,
+                                                   settings.trial_sync_idempotency_lease)
+    # Renews Graph change-notification subscriptions while their users are connected; every
+    # worker process shares them (and their clientStates) through the job database
+    app.state.subscription_store = SubscriptionStore(settings.job_db_path)
+    subscriptions.start(lambda: app.state.graph_client, app.state.subscription_store)
+    try:
+        yield
+    finally:
+        await subscriptions.stop()
+        await app.state.job_workers.stop()
+        await worker_bus.stop()
+        app.state.subscription_store.close()
+        app.state.worker_bus_store.close()
+        app.state.idempotency_store.close()
+        app.state.job_store.close()
+        await app.state.graph_client.aclose()
+
+
+@router.get("/calendars")
 async def list_calendars(user=Depends(get_current_user)):
     # Here you'll call Microsoft Graph API with stored OAuth token
     return {"message": f"Calendars for {user['sub']}"}
 
+
+@router.get("/metrics")
+async def metrics(request: Request):
+    """Prometheus text exposition: per-route and per-upstream latency histograms, scheduler gauges."""
+    metrics_token = get_settings().metrics_token
+    if metrics_token and request.headers.get("Authorization") != f"Bearer {metrics_token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def create_app() -> FastAPI:
+    """
+    Build the API app. Nothing here connects anywhere: the Supabase client
+    is created on first use and the Graph client and job workers in the
+    lifespan, so the app can be built in a gunicorn master before forking
+    (see gunicorn.conf.py) or per process with `uvicorn --factory`.
+    """
+    # ENV_FILE first: everything below, and the lifespan, reads its settings from the environment
+    load_env()
+    reset_settings()
+    # Log records go through a queue to a background thread, never straight to stdout
+    configure_logging()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(msgraph_router)
+    app.include_router(deadlines_router)
+    app.include_router(jobs_router)
+    app.include_router(router)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:5173"],  # or ["*"] for all origins (less secure)
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing"],
+    )
+    # Outermost, so the timing covers CORS and every route (Server-Timing header + /metrics histograms)
+    app.add_middleware(TimingMiddleware)
+    return app
+
+
+def __getattr__(name: str):
+    # `backend.main:app` keeps working, but the app is only built when something asks for it
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,213 @@
+import re
+import time
+import bisect
+import contextlib
+import contextvars
+from typing import Callable
+
+# Latency buckets in seconds, from a cache hit to a slow Graph call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self._series: dict = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Gauge:
+    """
+    A value read from a callback when /metrics is scraped. Also used for
+    counters another component already keeps (metric_type="counter").
+    """
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float], metric_type: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.metric_type = metric_type
+
+    def render(self) -> list:
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}", f"{self.name} {_number(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time to handle an API request, by route template.", ("method", "route", "status")))
+upstream_duration = registry.register(Histogram(
+    "upstream_request_duration_seconds", "Time spent in a dependency call, by upstream and operation.", ("upstream", "operation")))
+upstream_errors = registry.register(Counter(
+    "upstream_errors_total", "Dependency calls that raised or returned an error status.", ("upstream", "operation")))
+
+
+# Per-request timings. Set by TimingMiddleware; tasks started during the
+# request (asyncio.gather fan-out) inherit the same object.
+
+class RequestTimings:
+    def __init__(self):
+        # upstream -> [total seconds, calls]
+        self.spans: dict = {}
+
+    def add(self, upstream: str, seconds: float) -> None:
+        span = self.spans.setdefault(upstream, [0.0, 0])
+        span[0] += seconds
+        span[1] += 1
+
+    def server_timing(self, total: float) -> str:
+        # dur is the summed time of all calls of that kind; concurrent calls can add up to more than the total
+        entries = [f'{name};dur={seconds * 1000:.1f};desc="{calls} call{"s" if calls != 1 else ""}"'
+                   for name, (seconds, calls) in self.spans.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+current_timings: contextvars.ContextVar = contextvars.ContextVar("current_timings", default=None)
+
+
+def record(upstream: str, operation: str, seconds: float, error: bool = False) -> None:
+    upstream_duration.observe(seconds, upstream, operation)
+    if error:
+        upstream_errors.inc(upstream, operation)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(upstream, seconds)
+
+
+@contextlib.contextmanager
+def timed(upstream: str, operation: str):
+    """Time a dependency call: adds to the request's Server-Timing and the upstream histogram."""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record(upstream, operation, time.perf_counter() - started, error)
+
+
+_ID_SEGMENT = re.compile(r"^[A-Za-z$]+$")
+
+
+def path_template(path: str) -> str:
+    """Collapse ids in an outbound URL path so metrics stay low-cardinality: /me/calendars/AAMk.../events -> /me/calendars/{id}/events."""
+    return "/".join(segment if not segment or (_ID_SEGMENT.match(segment) and len(segment) < 40) else "{id}" for segment in path.split("/"))
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware timing every HTTP request. Adds a Server-Timing header
+    with the time spent in JWT verification, Supabase and Graph, and records
+    the request in the per-route latency histogram. The route label is the
+    matched path template (e.g. /api/jobs/{job_id}), not the raw URL.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = timings.server_timing(time.perf_counter() - started).encode()
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timings.reset(token)
+            route = scope.get("route")
+            http_request_duration.observe(time.perf_counter() - started, scope["method"], getattr(route, "path", "unmatched"), str(status))
+
+
+def render() -> str:
+    return registry.render()
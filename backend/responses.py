@@ -0,0 +1,59 @@
+import gzip
+import json
+from typing import Optional
+from starlette.responses import Response
+from .settings import get_settings
+
+try:
+    import orjson
+except ImportError:  # optional: several times faster than json for large payloads
+    orjson = None
+
+
+
+def dumps(content) -> bytes:
+    """Compact JSON bytes (no spaces, UTF-8 unescaped), with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """gzip if the Accept-Encoding header allows it, else None."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class CompactJSONResponse(Response):
+    """
+    A JSON response for large payloads (event and calendar lists): compact
+    serialization, compressed when `accept_encoding` (the request's
+    Accept-Encoding header) allows it and the body is compress_min_size bytes or more.
+    """
+
+    media_type = "application/json"
+
+    def __init__(self, content, status_code: int = 200, headers: Optional[dict] = None, accept_encoding: str = ""):
+        body = dumps(content)
+        headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+        settings = get_settings()
+        encoding = choose_encoding(accept_encoding) if len(body) >= settings.compress_min_size else None
+        if encoding == "gzip":
+            body = gzip.compress(body, compresslevel=settings.gzip_level)
+            headers["Content-Encoding"] = encoding
+        super().__init__(body, status_code=status_code, headers=headers)
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
@@ -0,0 +1,216 @@
+import os
+import threading
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+# Loaded into the environment by create_app, before the settings are read; variables already set win
+ENV_FILE = os.getenv("ENV_FILE", ".env.local")
+
+_env_loaded = False
+_lock = threading.Lock()
+
+
+def load_env() -> None:
+    """Load ENV_FILE once per process. python-dotenv is only imported when the file exists."""
+    global _env_loaded
+    with _lock:
+        if _env_loaded:
+            return
+        _env_loaded = True
+        if os.path.exists(ENV_FILE):
+            from dotenv import load_dotenv
+            load_dotenv(ENV_FILE)
+
+
+def env(name: str, default=None):
+    """A Settings field read from environment variable `name`, parsed like `default`."""
+    return field(default=default, metadata={"env": name})
+
+
+def _parse(value: str, default):
+    if isinstance(default, bool):
+        return value.lower() not in ("0", "false", "no")
+    if isinstance(default, (int, float)):
+        return type(default)(value)
+    return value
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Credentials, endpoints and tuning, read when first needed rather than when
+    a module is imported: the app lifespan hands them to the Graph client,
+    scheduler, caches and job queue of each worker process.
+    """
+    supabase_url: Optional[str] = env("SUPABASE_URL")
+    supabase_service_key: Optional[str] = env("SUPABASE_SERVICE_KEY")
+    supabase_jwt_secret: Optional[str] = env("SUPABASE_JWT_SECRET")
+    ms_client_id: Optional[str] = env("MS_CLIENT_ID")
+    ms_client_secret: Optional[str] = env("MS_CLIENT_SECRET")
+    # If set, /metrics requires "Authorization: Bearer <metrics_token>"
+    metrics_token: Optional[str] = env("METRICS_TOKEN")
+    # Seconds before a PostgREST request gives up (the supabase client's default)
+    supabase_timeout: float = env("SUPABASE_TIMEOUT", 120.0)
+    # The supabase client is synchronous; its queries run on at most this many threads
+    supabase_max_threads: int = env("SUPABASE_MAX_THREADS", 20)
+
+    # LOG_LEVEL: standard level name; LOG_FORMAT: "json" (one object per line) or "text"
+    log_level: str = env("LOG_LEVEL", "INFO")
+    log_format: str = env("LOG_FORMAT", "json")
+
+    # Supabase JWT verification. Signing keys come from supabase_jwks_url, by default the project's JWKS endpoint.
+    supabase_jwks_url: Optional[str] = env("SUPABASE_JWKS_URL")
+    # Verified tokens remembered at once; least recently used are dropped first
+    jwt_cache_max_entries: int = env("JWT_CACHE_MAX_ENTRIES", 10000)
+    # Upper bound on how long a verified token is trusted without re-verifying, even if exp is later
+    jwt_cache_max_ttl: float = env("JWT_CACHE_MAX_TTL", 300.0)
+    # How often the signing keys are re-fetched, and how soon an unknown kid may trigger another fetch
+    jwks_refresh_interval: float = env("JWKS_REFRESH_INTERVAL", 600.0)
+    jwks_min_refresh_interval: float = env("JWKS_MIN_REFRESH_INTERVAL", 30.0)
+
+    # Bodies smaller than this many bytes are sent uncompressed; compressing them saves little
+    compress_min_size: int = env("COMPRESS_MIN_SIZE", 1024)
+    # Low levels are several times faster than the maximum and compress JSON nearly as well
+    gzip_level: int = env("GZIP_LEVEL", 5)
+
+    # Graph and Microsoft login endpoints (a local stand-in in the benchmarks)
+    graph_url: str = env("MS_GRAPH_URL", "https://graph.microsoft.com/v1.0")
+    login_url: str = env("MS_LOGIN_URL", "https://login.microsoftonline.com")
+
+    # Pool and timeouts of the shared Graph / login.microsoftonline.com client
+    graph_max_connections: int = env("GRAPH_MAX_CONNECTIONS", 100)
+    graph_max_keepalive_connections: int = env("GRAPH_MAX_KEEPALIVE_CONNECTIONS", 20)
+    graph_keepalive_expiry: float = env("GRAPH_KEEPALIVE_EXPIRY", 60.0)
+    graph_connect_timeout: float = env("GRAPH_CONNECT_TIMEOUT", 5.0)
+    graph_read_timeout: float = env("GRAPH_READ_TIMEOUT", 30.0)
+    graph_write_timeout: float = env("GRAPH_WRITE_TIMEOUT", 30.0)
+    graph_pool_timeout: float = env("GRAPH_POOL_TIMEOUT", 10.0)
+    graph_http2: bool = env("GRAPH_HTTP2", True)
+
+    # Worker processes serving the app (gunicorn.conf.py sets it for its workers; uvicorn --workers
+    # reads it too). The scheduler limits below are for the whole app and are shared out between them.
+    web_concurrency: int = env("WEB_CONCURRENCY", 1)
+
+    # Graph request scheduler (see MSIGraph/scheduler.py).
+    # Outlook allows 4 concurrent requests per mailbox per app
+    graph_mailbox_concurrency: int = env("GRAPH_MAILBOX_CONCURRENCY", 4)
+    # After a 429 a mailbox's limit drops by one; it grows back by one after this many successes in a row
+    graph_mailbox_recovery: int = env("GRAPH_MAILBOX_RECOVERY", 20)
+    # Requests in flight to Graph across all users
+    graph_app_concurrency: int = env("GRAPH_APP_CONCURRENCY", 64)
+    # Token bucket for the whole app: sustained requests per second and burst size (0 disables)
+    graph_rate_limit: float = env("GRAPH_RATE_LIMIT", 100.0)
+    graph_rate_burst: int = env("GRAPH_RATE_BURST", 200)
+    # Retries for 429 / 503 responses; without Retry-After the wait is full-jitter exponential backoff
+    graph_max_retries: int = env("GRAPH_MAX_RETRIES", 5)
+    graph_backoff_base: float = env("GRAPH_BACKOFF_BASE", 0.5)
+    graph_backoff_max: float = env("GRAPH_BACKOFF_MAX", 30.0)
+    # A Retry-After longer than this is not waited out; the throttled response is returned instead
+    graph_max_retry_after: float = env("GRAPH_MAX_RETRY_AFTER", 120.0)
+
+    # Microsoft tokens: refresh this many seconds before they expire; trust a row without expires_at this long
+    ms_token_refresh_margin: int = env("MS_TOKEN_REFRESH_MARGIN", 300)
+    ms_token_cache_ttl: int = env("MS_TOKEN_CACHE_TTL", 300)
+
+    # Max Graph page requests in flight at the same time for one agenda (or conflict check)
+    agenda_concurrency: int = env("AGENDA_CONCURRENCY", 8)
+    # Max concurrent per-group lookups for one calendar discovery
+    graph_fanout_concurrency: int = env("GRAPH_FANOUT_CONCURRENCY", 8)
+    # How far from today a requested event range may reach, into the past and into the future
+    event_range_max_days: int = env("EVENT_RANGE_MAX_DAYS", 366)
+
+    # Calendar list cache: fresh for ttl, then served stale (and revalidated) for stale_ttl
+    calendar_cache_ttl: float = env("CALENDAR_CACHE_TTL", 300.0)
+    calendar_cache_stale_ttl: float = env("CALENDAR_CACHE_STALE_TTL", 3600.0)
+    calendar_cache_max_entries: int = env("CALENDAR_CACHE_MAX_ENTRIES", 1000)
+
+    # Event store (calendarView/delta copies of users' calendars).
+    # Calendars (per user) kept in memory; least recently used are dropped first
+    event_store_max_calendars: int = env("EVENT_STORE_MAX_CALENDARS", 500)
+    # Requests within this many seconds of the last sync are served without asking Graph
+    event_sync_min_interval: float = env("EVENT_SYNC_MIN_INTERVAL", 15.0)
+    # The synced window always covers at least this much history and future
+    event_sync_days_before: int = env("EVENT_SYNC_DAYS_BEFORE", 30)
+    event_sync_days_after: int = env("EVENT_SYNC_DAYS_AFTER", 180)
+    # A window is widened to keep what it covered only up to this many days; beyond that it starts over
+    event_sync_max_days: int = env("EVENT_SYNC_MAX_DAYS", 400)
+
+    # Graph change notifications. Public HTTPS URL of POST /api/msgraph/notifications that Graph
+    # delivers to; unset disables subscriptions
+    graph_notification_url: Optional[str] = env("GRAPH_NOTIFICATION_URL")
+    # Lifetime requested for each subscription; Outlook events allow at most 10080 minutes (7 days)
+    graph_subscription_minutes: int = env("GRAPH_SUBSCRIPTION_MINUTES", 4320)
+    # Renew a subscription once it has less than this many seconds left, checking every check_interval seconds
+    graph_subscription_renew_margin: float = env("GRAPH_SUBSCRIPTION_RENEW_MARGIN", 21600.0)
+    graph_subscription_check_interval: float = env("GRAPH_SUBSCRIPTION_CHECK_INTERVAL", 300.0)
+    # Messages buffered per open live-update stream; a stream that falls further behind gets one "resync" instead
+    notification_stream_buffer: int = env("NOTIFICATION_STREAM_BUFFER", 100)
+    # Comment line sent on idle streams so proxies don't close them
+    notification_keepalive: float = env("NOTIFICATION_KEEPALIVE", 15.0)
+
+    # Trial scheduling check. Calendar days searched on each side of a conflicting date for free business days
+    scheduling_search_days: int = env("SCHEDULING_SEARCH_DAYS", 90)
+    # Free trial dates suggested when the requested one conflicts
+    scheduling_suggestions: int = env("SCHEDULING_SUGGESTIONS", 3)
+    # Calendar indexes kept between checks, per (user, calendar, time zone)
+    scheduling_index_cache: int = env("SCHEDULING_INDEX_CACHE", 500)
+    # Years covered by the precomputed business-day tables
+    deadline_calendar_start_year: int = env("DEADLINE_CALENDAR_START_YEAR", 2000)
+    deadline_calendar_end_year: int = env("DEADLINE_CALENDAR_END_YEAR", 2100)
+
+    # Worker bus (see worker_bus.py): how often each process reads the others' messages,
+    # and how long a message is kept for them
+    worker_bus_poll_interval: float = env("WORKER_BUS_POLL_INTERVAL", 0.2)
+    worker_bus_retention: float = env("WORKER_BUS_RETENTION", 60.0)
+
+    # Trial sync idempotency keys are forgotten after this long. A submission holds its key
+    # this long at most; a worker that died mid-sync frees it when it runs out
+    trial_sync_idempotency_ttl: float = env("TRIAL_SYNC_IDEMPOTENCY_TTL", 24 * 3600.0)
+    trial_sync_idempotency_lease: float = env("TRIAL_SYNC_IDEMPOTENCY_LEASE", 900.0)
+
+    # Job queue. SQLite file holding it (and the idempotency keys, Graph subscriptions and worker
+    # bus, which every worker process shares); survives restarts
+    job_db_path: str = env("JOB_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.sqlite3"))
+    # A claimed job is owned by its worker for this long, renewed while its handler runs;
+    # once it runs out (the worker died) another worker may take the job over
+    job_lease_seconds: float = env("JOB_LEASE_SECONDS", 120.0)
+    job_max_attempts: int = env("JOB_MAX_ATTEMPTS", 5)
+    # Succeeded jobs are deleted this long after they finished; dead-lettered ones are kept for a retry
+    job_retention_seconds: float = env("JOB_RETENTION_SECONDS", 7 * 24 * 3600.0)
+    # Jobs run at the same time by one process
+    job_workers: int = env("JOB_WORKERS", 4)
+    # Idle workers look for due jobs (e.g. retries) at least this often
+    job_poll_interval: float = env("JOB_POLL_INTERVAL", 1.0)
+    # Retry backoff: base * 2^(attempt - 1), capped, with full jitter
+    job_retry_base: float = env("JOB_RETRY_BASE", 2.0)
+    job_retry_max: float = env("JOB_RETRY_MAX", 300.0)
+    # How long shutdown waits for running jobs before putting them back in the queue
+    job_shutdown_grace: float = env("JOB_SHUTDOWN_GRACE", 10.0)
+    # A handler running longer than this is cancelled and the job retried
+    job_timeout: float = env("JOB_TIMEOUT", 600.0)
+    # How often succeeded jobs past job_retention_seconds are deleted
+    job_prune_interval: float = env("JOB_PRUNE_INTERVAL", 3600.0)
+
+
+# Every setting at its default, for objects built before the settings are read
+DEFAULTS = Settings()
+
+_settings: Optional[Settings] = None
+
+
+def get_settings() -> Settings:
+    """The settings from the environment; call load_env() first for ENV_FILE to count."""
+    global _settings
+    if _settings is None:
+        values = {}
+        for setting in fields(Settings):
+            value = os.getenv(setting.metadata["env"])
+            values[setting.name] = setting.default if value is None else _parse(value, setting.default)
+        _settings = Settings(**values)
+    return _settings
+
+
+def reset_settings() -> None:
+    """Read the environment again on next use (after changing os.environ)."""
+    global _settings
+    _settings = None
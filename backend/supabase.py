@@ -1,8 +1,44 @@
-from supabase import create_client
 import os
-from dotenv import load_dotenv
-load_dotenv('.env.local')
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
\ No newline at end of file
+import threading
+from .settings import get_settings
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def _create_client():
+    # The backend only uses tables, so it talks to PostgREST directly: supabase.create_client
+    # would also import and set up the auth, realtime, storage and functions clients
+    from postgrest import SyncPostgrestClient
+
+    settings = get_settings()
+    if not settings.supabase_url or not settings.supabase_service_key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
+    key = settings.supabase_service_key
+    return SyncPostgrestClient(
+        f"{settings.supabase_url.rstrip('/')}/rest/v1",
+        headers={"apiKey": key, "Authorization": f"Bearer {key}"},
+        timeout=settings.supabase_timeout,
+    )
+
+
+def get_supabase():
+    """
+    The process's PostgREST client, created on first use. A worker forked
+    after the app was preloaded creates its own instead of sharing the
+    parent's connections.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                _client, _client_pid = _create_client(), os.getpid()
+    return _client
+
+
+def set_supabase(client) -> None:
+    """Use `client` (anything with .table()) instead of the real one, e.g. a stand-in in a benchmark."""
+    global _client, _client_pid
+    with _lock:
+        _client, _client_pid = client, os.getpid()
@@ -0,0 +1,13 @@
+import os
+
+# Nothing in these tests talks to Supabase or Microsoft; the settings only have to be present
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "test-secret")
+
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
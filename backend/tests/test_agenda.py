@@ -0,0 +1,62 @@
+import asyncio
+import datetime
+import httpx
+import pytest
+from backend.MSIGraph import agenda
+from backend.MSIGraph.agenda import merged_agenda
+
+START = datetime.datetime(2026, 3, 2)
+END = START + datetime.timedelta(days=30)
+
+
+class EndlessCalendars:
+    """Every calendarView page is full and has a next page, so the fetchers always have more to buffer."""
+
+    def __init__(self):
+        self.requests = 0
+
+    async def get(self, url, headers=None, params=None):
+        self.requests += 1
+        await asyncio.sleep(0)
+        minute = self.requests
+        start = (START + datetime.timedelta(minutes=minute)).strftime("%Y-%m-%dT%H:%M:%S.0000000")
+        page = {"value": [{"id": str(minute), "start": {"dateTime": start}, "end": {"dateTime": start}}],
+                "@odata.nextLink": f"{url.split('?')[0]}?page={minute}"}
+        return httpx.Response(200, json=page)
+
+
+def fetchers() -> set:
+    return {task for task in asyncio.all_tasks() if getattr(task.get_coro(), "__name__", None) == "_fetch_pages"}
+
+
+@pytest.mark.anyio
+async def test_closing_the_agenda_stops_every_fetcher():
+    records = merged_agenda(EndlessCalendars(), {}, "user", ["a", "b", "c"], START, END)
+    assert (await records.__anext__())["type"] == "event"
+    # Let the fetchers fill their buffers and wait for space
+    await asyncio.sleep(0.05)
+    assert fetchers()
+
+    await records.aclose()
+
+    assert not fetchers()
+
+
+@pytest.mark.anyio
+async def test_cancelling_the_consumer_stops_every_fetcher(monkeypatch):
+    monkeypatch.setattr(agenda, "AGENDA_PAGE_BUFFER", 1)
+
+    async def consume():
+        async for _ in merged_agenda(EndlessCalendars(), {}, "user", ["a", "b", "c"], START, END):
+            await asyncio.sleep(0.01)
+
+    consumer = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.05)
+    consumer.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await consumer
+    # Like a StreamingResponse whose client left, nobody closes the generator: the loop finalizes it
+    for _ in range(10):
+        await asyncio.sleep(0.01)
+
+    assert not fetchers()
@@ -0,0 +1,94 @@
+import time
+import asyncio
+import threading
+import anyio
+import pytest
+from backend import db, supabase as supabase_client
+from backend.settings import get_settings
+from backend.supabase import set_supabase
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class BlockingQuery:
+    """A postgrest query builder stand-in whose execute() blocks its thread in `wait`."""
+
+    def __init__(self, wait):
+        self.wait = wait
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        self.wait()
+        return Response([{"user_id": "test"}])
+
+
+class BlockingSupabase:
+    def __init__(self, wait):
+        self.wait = wait
+
+    def table(self, name):
+        return BlockingQuery(self.wait)
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    # Put the process's client back afterwards without ever creating a real one
+    monkeypatch.setattr(supabase_client, "_client", supabase_client._client)
+    monkeypatch.setattr(supabase_client, "_client_pid", supabase_client._client_pid)
+
+
+@pytest.mark.anyio
+async def test_concurrent_queries_overlap(supabase):
+    requests = min(8, get_settings().supabase_max_threads)
+    # Every query waits for all the others, so this only returns if they run at the same time
+    barrier = threading.Barrier(requests)
+    set_supabase(BlockingSupabase(lambda: barrier.wait(timeout=5)))
+
+    results = await asyncio.gather(*[db.ms_tokens_exist("test") for _ in range(requests)])
+
+    assert results == [True] * requests
+
+
+@pytest.mark.anyio
+async def test_query_does_not_block_the_event_loop(supabase):
+    # The query is only released by the event loop, which can't happen if execute() runs on it
+    loop_ran = threading.Event()
+
+    def wait():
+        if not loop_ran.wait(timeout=5):
+            raise TimeoutError("the event loop did not run while the query was executing")
+
+    set_supabase(BlockingSupabase(wait))
+
+    query = asyncio.ensure_future(db.get_ms_tokens("test"))
+    await asyncio.sleep(0.05)
+    loop_ran.set()
+
+    assert await query == {"user_id": "test"}
+
+
+@pytest.mark.anyio
+async def test_queries_are_bounded_by_the_thread_limit(supabase, monkeypatch):
+    monkeypatch.setattr(db, "_limiter", anyio.CapacityLimiter(2))
+    running, peak = 0, 0
+    lock = threading.Lock()
+
+    class CountingQuery:
+        def execute(self):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+            return Response([])
+
+    await asyncio.gather(*[db.run_query(CountingQuery()) for _ in range(6)])
+
+    assert peak == 2
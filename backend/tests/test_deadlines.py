@@ -0,0 +1,81 @@
+import os
+import datetime
+import httpx
+import pytest
+from jose import jwt
+from backend.main import create_app
+from backend.deadlines.engine import BusinessDayCalendar, calculate_deadlines, get_calendar
+
+
+def step_business_days(calendar: BusinessDayCalendar, day: datetime.date, offset: int) -> datetime.date:
+    """The clerk's way: one day at a time, skipping weekends and holidays."""
+    step = datetime.timedelta(days=1 if offset > 0 else -1)
+    for _ in range(abs(offset)):
+        day += step
+        while day.weekday() >= 5 or day in calendar.holidays:
+            day += step
+    return day
+
+
+@pytest.mark.parametrize("jurisdiction", ["BC", "NONE"])
+def test_offsets_match_stepping_through_the_calendar(jurisdiction):
+    calendar = get_calendar(jurisdiction)
+    days = [datetime.date(2026, 1, 1) + datetime.timedelta(days=n) for n in range(0, 730, 3)]
+    offsets = [(-1) ** n * (n % 40) for n in range(len(days))]
+
+    expected = [step_business_days(calendar, day, offset) for day, offset in zip(days, offsets)]
+
+    assert calendar.busday_offsets(days, offsets) == expected
+
+
+def test_offsets_outside_the_table_are_rejected():
+    calendar = BusinessDayCalendar([], start_year=2026, end_year=2026)
+    with pytest.raises(ValueError):
+        calendar.busday_offset(datetime.date(2026, 1, 2), -5)
+    with pytest.raises(ValueError):
+        calendar.busday_offset(datetime.date(2027, 1, 4), 1)
+
+
+def test_default_jurisdiction_skips_weekends_only():
+    # Good Friday 2026 is April 3: a BC court holiday, but a business day without a jurisdiction
+    trial = {"trial_date": "2026-04-06", "deadlines": [{"days_before": 1, "is_business_days": True, "reference_type": "trial_date"}]}
+
+    assert calculate_deadlines([trial])[0]["deadlines"][0]["calculated_date"] == "2026-04-03"
+    assert calculate_deadlines([trial], "BC")[0]["deadlines"][0]["calculated_date"] == "2026-04-02"
+
+
+@pytest.fixture
+async def client():
+    token = jwt.encode({"sub": "user"}, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app()), base_url="http://app",
+                                 headers={"Authorization": f"Bearer {token}"}) as client:
+        yield client
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("body", [
+    {"trials": ["not a trial"]},
+    {"trials": [{"trial_date": "2026-04-06", "deadlines": [{"days_before": [5]}]}]},
+    {"trial_date": "2026-04-06", "deadlines": [{"days_before": "five", "is_business_days": True}]},
+    {"trial_date": "not a date", "deadlines": [{"days_before": 5, "reference_type": "trial_date"}]},
+    {"jurisdiction": "XX", "trial_date": "2026-04-06", "deadlines": []},
+])
+async def test_malformed_requests_are_rejected(client, body):
+    response = await client.post("/api/deadlines/calculate", json=body)
+
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_calculate_batch(client):
+    deadline = {"deadline_name": "Notice", "days_before": "2", "is_business_days": True, "reference_type": "trial_date"}
+    response = await client.post("/api/deadlines/calculate", json={
+        "jurisdiction": "bc",
+        "trials": [{"trial_id": "a", "trial_date": "2026-04-07", "deadlines": [deadline]},
+                   {"trial_id": "b", "trial_date": "2026-04-08", "deadlines": [deadline]}],
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["jurisdiction"] == "BC"
+    assert [t["deadlines"][0]["calculated_date"] for t in body["trials"]] == ["2026-04-01", "2026-04-02"]
@@ -0,0 +1,119 @@
+import os
+import asyncio
+import sqlite3
+import pytest
+from backend.jobs import store as job_store
+from backend.jobs.store import JobStore, QUEUED, SUCCEEDED, DEAD
+from backend.jobs.workers import WorkerPool
+from backend.settings import DEFAULTS
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.3)
+    yield store
+    store.close()
+
+
+async def run_until_done(pool: WorkerPool, store: JobStore, job_id: str, timeout: float = 5) -> dict:
+    pool.start()
+    try:
+        for _ in range(int(timeout / 0.02)):
+            job = await store.get(job_id)
+            if job["status"] in (SUCCEEDED, DEAD) or (job["status"] == QUEUED and job["error"]):
+                return job
+            await asyncio.sleep(0.02)
+        raise AssertionError(f"job still {job['status']}")
+    finally:
+        await pool.stop(grace=1)
+
+
+def test_default_database_is_next_to_the_app():
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(job_store.__file__)))
+    assert DEFAULTS.job_db_path == os.path.join(backend_dir, "jobs.sqlite3")
+
+
+@pytest.mark.anyio
+async def test_a_lease_lost_to_another_worker_cannot_record_an_outcome(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), lease_seconds=0)
+    try:
+        job = await store.enqueue("user", "kind", {})
+        first = await store.claim()
+        # The lease ran out (lease_seconds=0) and a second worker took the job over
+        second = await store.claim()
+        assert first["id"] == second["id"] == job["id"] and first["lease_owner"] != second["lease_owner"]
+
+        assert not await store.succeed(job["id"], first["lease_owner"], {"from": "first"})
+        assert not await store.extend(job["id"], first["lease_owner"])
+        assert await store.succeed(job["id"], second["lease_owner"], {"from": "second"})
+        assert (await store.get(job["id"]))["result"] == {"from": "second"}
+    finally:
+        store.close()
+
+
+@pytest.mark.anyio
+async def test_lease_is_renewed_while_the_handler_runs(store):
+    runs = []
+    other = JobStore(store.path, lease_seconds=0.3)
+
+    async def slow(job):
+        runs.append(job["lease_owner"])
+        # Three leases long: without renewal another worker could claim the job meanwhile
+        for _ in range(9):
+            await asyncio.sleep(0.1)
+            assert await other.claim() is None
+        return {"ok": True}
+
+    job = await store.enqueue("user", "slow", {})
+    try:
+        done = await run_until_done(WorkerPool(store, {"slow": slow}, workers=1, poll_interval=0.05), store, job["id"])
+    finally:
+        other.close()
+    assert done["status"] == SUCCEEDED and done["result"] == {"ok": True} and len(runs) == 1
+
+
+@pytest.mark.anyio
+async def test_handler_over_the_timeout_is_cancelled_and_retried(store):
+    cancelled = asyncio.Event()
+
+    async def stuck(job):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    job = await store.enqueue("user", "stuck", {})
+    done = await run_until_done(WorkerPool(store, {"stuck": stuck}, workers=1, timeout=0.1), store, job["id"])
+    assert done["status"] == QUEUED and "Timed out" in done["error"] and cancelled.is_set()
+
+
+@pytest.mark.anyio
+async def test_prune_deletes_only_old_succeeded_jobs(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), retention=0)
+    try:
+        ok = await store.enqueue("user", "kind", {})
+        claimed = await store.claim()
+        await store.succeed(ok["id"], claimed["lease_owner"], None)
+        failed = await store.enqueue("user", "kind", {})
+        claimed = await store.claim()
+        await store.dead_letter(failed["id"], claimed["lease_owner"], "boom")
+
+        assert await store.prune() == 1
+        assert await store.get(ok["id"]) is None
+        assert (await store.get(failed["id"]))["status"] == DEAD
+    finally:
+        store.close()
+
+
+def test_database_from_before_lease_owners_is_upgraded(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.executescript(job_store.SCHEMA.replace("    lease_owner TEXT,\n", ""))
+    conn.close()
+
+    JobStore(path).close()
+
+    conn = sqlite3.connect(path)
+    assert "lease_owner" in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+    conn.close()
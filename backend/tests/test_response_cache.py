@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from backend.MSIGraph.response_cache import SWRCache
+
+
+def cache() -> SWRCache:
+    return SWRCache(ttl=60, stale_ttl=60, max_entries=10)
+
+
+@pytest.mark.anyio
+async def test_a_load_started_before_invalidation_does_not_repopulate_the_key():
+    swr = cache()
+    release = asyncio.Event()
+
+    async def slow_loader():
+        await release.wait()
+        return "old"
+
+    load = asyncio.ensure_future(swr.get("user", slow_loader))
+    await asyncio.sleep(0)
+    swr.invalidate("user")
+    release.set()
+
+    assert await load == "old"
+    assert await swr.get("user", lambda: asyncio.sleep(0, "new")) == "new"
+
+
+@pytest.mark.anyio
+async def test_a_forced_refresh_wins_over_an_earlier_load():
+    swr = cache()
+    release = asyncio.Event()
+
+    async def slow_loader():
+        await release.wait()
+        return "old"
+
+    load = asyncio.ensure_future(swr.get("user", slow_loader))
+    await asyncio.sleep(0)
+    assert await swr.get("user", lambda: asyncio.sleep(0, "new"), force_refresh=True) == "new"
+    release.set()
+    await load
+
+    assert await swr.get("user", lambda: asyncio.sleep(0, "unused")) == "new"
+
+
+@pytest.mark.anyio
+async def test_invalidating_many_keys_keeps_no_state():
+    swr = cache()
+    for i in range(1000):
+        await swr.get(f"user-{i}", lambda: asyncio.sleep(0, "calendars"))
+        swr.invalidate(f"user-{i}")
+
+    assert swr.stats()["size"] == 0
+    assert not swr._inflight
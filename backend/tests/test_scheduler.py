@@ -0,0 +1,76 @@
+import asyncio
+import httpx
+import pytest
+from backend.MSIGraph.scheduler import GraphScheduler, MailboxState, ThrottlingTransport, MAILBOX_HEADER, retryable
+
+GRAPH_URL = "https://graph.example/v1.0"
+
+
+def client_for(handler, scheduler: GraphScheduler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=ThrottlingTransport(httpx.MockTransport(handler), scheduler, GRAPH_URL))
+
+
+def scheduler() -> GraphScheduler:
+    return GraphScheduler(rate=0, max_retries=2, backoff_base=0.001, backoff_max=0.001)
+
+
+def test_503_is_retried_only_when_repeating_is_safe():
+    assert retryable(429, "POST", {"subject": "Hearing"})
+    assert retryable(503, "GET", None)
+    assert not retryable(503, "POST", {"subject": "Hearing"})
+    assert retryable(503, "POST", {"subject": "Hearing", "transactionId": "t-1"})
+    batch = {"requests": [{"method": "POST", "body": {"transactionId": "t-1"}}, {"method": "POST", "body": {}}]}
+    assert not retryable(503, "POST", batch)
+    assert retryable(503, "POST", {"requests": batch["requests"][:1]})
+
+
+@pytest.mark.anyio
+async def test_post_without_transaction_id_is_not_resent_after_503():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503 if len(calls) == 1 else 201, json={})
+
+    async with client_for(handler, scheduler()) as client:
+        response = await client.post(f"{GRAPH_URL}/me/events", json={"subject": "Hearing"})
+        assert response.status_code == 503 and len(calls) == 1
+
+        calls.clear()
+        response = await client.post(f"{GRAPH_URL}/me/events", json={"subject": "Hearing", "transactionId": "t-1"})
+        assert response.status_code == 201 and len(calls) == 2
+
+
+@pytest.mark.anyio
+async def test_mailbox_comes_from_the_header_which_is_not_sent():
+    seen = []
+    graph = scheduler()
+    graph.throttle("user-1", 60)
+
+    def handler(request):
+        seen.append(request.headers.get(MAILBOX_HEADER))
+        return httpx.Response(200, json={})
+
+    async with client_for(handler, graph) as client:
+        # user-1 is held for a minute; another user's request goes straight through
+        response = await client.get(f"{GRAPH_URL}/me", headers={MAILBOX_HEADER: "user-2"})
+    assert response.status_code == 200 and seen == [None]
+
+
+@pytest.mark.anyio
+async def test_batch_takes_a_slot_per_request():
+    state = MailboxState(4)
+    await state.acquire(3)
+    waiter = asyncio.ensure_future(state.acquire(2))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    state.release(3)
+    await asyncio.sleep(0)
+    assert waiter.done() and state.in_flight == 2
+    # Heavier than the whole limit: runs alone
+    heavy = asyncio.ensure_future(state.acquire(20))
+    await asyncio.sleep(0)
+    assert not heavy.done()
+    state.release(2)
+    await asyncio.sleep(0)
+    assert heavy.done() and state.in_flight == 20
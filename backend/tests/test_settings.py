@@ -0,0 +1,43 @@
+import os
+import pytest
+from backend import settings as app_settings
+from backend.settings import DEFAULTS, get_settings, reset_settings
+
+
+@pytest.fixture(autouse=True)
+def fresh_settings():
+    reset_settings()
+    yield
+    reset_settings()
+
+
+def test_settings_are_read_from_the_environment_when_first_needed(monkeypatch):
+    assert get_settings().graph_mailbox_concurrency == DEFAULTS.graph_mailbox_concurrency
+    monkeypatch.setenv("GRAPH_MAILBOX_CONCURRENCY", "2")
+    monkeypatch.setenv("GRAPH_HTTP2", "false")
+    monkeypatch.setenv("JOB_LEASE_SECONDS", "30")
+    # Cached until reset
+    assert get_settings().graph_mailbox_concurrency == DEFAULTS.graph_mailbox_concurrency
+    reset_settings()
+    settings = get_settings()
+    assert settings.graph_mailbox_concurrency == 2
+    assert settings.graph_http2 is False
+    assert settings.job_lease_seconds == 30.0
+
+
+def test_create_app_loads_env_file_before_reading_settings(monkeypatch, tmp_path):
+    pytest.importorskip("dotenv")
+    env_file = tmp_path / ".env.test"
+    env_file.write_text("GRAPH_APP_CONCURRENCY=7\n")
+    monkeypatch.delenv("GRAPH_APP_CONCURRENCY", raising=False)
+    monkeypatch.setattr(app_settings, "ENV_FILE", str(env_file))
+    monkeypatch.setattr(app_settings, "_env_loaded", False)
+    assert get_settings().graph_app_concurrency == DEFAULTS.graph_app_concurrency
+
+    from backend import main
+    monkeypatch.setattr(main, "configure_logging", lambda: None)
+    try:
+        main.create_app()
+        assert get_settings().graph_app_concurrency == 7
+    finally:
+        os.environ.pop("GRAPH_APP_CONCURRENCY", None)
@@ -0,0 +1,88 @@
+import asyncio
+import datetime
+import httpx
+import pytest
+from backend.MSIGraph import subscriptions as subscriptions_module
+from backend.MSIGraph.notification_hub import NotificationHub
+from backend.MSIGraph.subscriptions import Subscription, SubscriptionManager, SubscriptionStore
+
+
+def expiry(minutes: int = 60) -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0) + datetime.timedelta(minutes=minutes)
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """Two processes' SubscriptionStores on one job database."""
+    path = str(tmp_path / "jobs.sqlite3")
+    stores = [SubscriptionStore(path), SubscriptionStore(path)]
+    yield stores
+    for store in stores:
+        store.close()
+
+
+def graph(created: list, deleted: list, release: asyncio.Event):
+    """Graph's /subscriptions endpoint; creations wait for `release`."""
+    async def handler(request):
+        if request.method == "POST":
+            created.append(request)
+            subscription_id = f"sub-{len(created)}"
+            await release.wait()
+            return httpx.Response(201, json={"id": subscription_id, "expirationDateTime": expiry().isoformat()})
+        deleted.append(request.url.path.rsplit("/", 1)[-1])
+        return httpx.Response(204)
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.fixture(autouse=True)
+def access_token(monkeypatch):
+    async def get_access_token(client, user_id):
+        return "token"
+    monkeypatch.setattr(subscriptions_module.token_cache, "get_access_token", get_access_token)
+
+
+@pytest.mark.anyio
+async def test_the_first_subscription_stored_for_a_calendar_wins(stores):
+    first = await stores[0].add(Subscription("sub-1", "user", "cal", "state-1", expiry()))
+    second = await stores[1].add(Subscription("sub-2", "user", "cal", "state-2", expiry()))
+    assert first.id == second.id == "sub-1"
+    assert second.client_state == "state-1"
+    assert await stores[1].count() == 1
+
+
+@pytest.mark.anyio
+async def test_processes_subscribing_at_once_keep_one_subscription(stores):
+    managers = [SubscriptionManager(NotificationHub(), "https://app.example/notifications") for _ in stores]
+    for manager, store in zip(managers, stores):
+        manager.store = store
+    created, deleted, release = [], [], asyncio.Event()
+    async with graph(created, deleted, release) as client:
+        racing = [asyncio.ensure_future(m.ensure(client, "user", "cal")) for m in managers]
+        while len(created) < 2:
+            await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*racing)
+    assert results[0].id == results[1].id
+    assert deleted == [{"sub-1", "sub-2"}.difference({results[0].id}).pop()]
+    assert await stores[0].count() == 1
+
+
+@pytest.mark.anyio
+async def test_a_notification_is_accepted_by_another_process(stores):
+    hubs = [NotificationHub(), NotificationHub()]
+    managers = [SubscriptionManager(hub, "https://app.example/notifications") for hub in hubs]
+    for manager, store in zip(managers, stores):
+        manager.store = store
+    created, deleted, release = [], [], asyncio.Event()
+    release.set()
+    async with graph(created, deleted, release) as client:
+        subscription = await managers[0].ensure(client, "user", "cal")
+
+    with hubs[1].listen("user") as queue:
+        forged = {"subscriptionId": subscription.id, "clientState": "guess", "changeType": "updated"}
+        genuine = {**forged, "clientState": subscription.client_state, "resourceData": {"id": "event-1"}}
+        assert await managers[1].handle([forged, genuine]) == 1
+        message = queue.get_nowait()
+    assert message["type"] == "event_change"
+    assert message["eventId"] == "event-1"
+    assert managers[1].metrics["rejected"] == 1
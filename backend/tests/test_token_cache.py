@@ -0,0 +1,86 @@
+import asyncio
+import datetime
+import httpx
+import pytest
+from fastapi import HTTPException
+from backend import db
+from backend.MSIGraph.token_cache import TokenCache
+
+
+def iso(delta: datetime.timedelta) -> str:
+    return (datetime.datetime.utcnow() + delta).isoformat()
+
+
+@pytest.fixture
+def rows(monkeypatch):
+    """ms_tokens rows by user id, with every update recorded."""
+    table = {"user": {"access_token": "old", "refresh_token": "refresh-1", "expires_at": iso(datetime.timedelta(seconds=30))}}
+    updates = []
+
+    async def get_ms_tokens(user_id):
+        row = table.get(user_id)
+        return dict(row) if row else None
+
+    async def update_ms_tokens(user_id, data):
+        updates.append((user_id, data))
+        table[user_id].update(data)
+
+    async def delete_ms_tokens(user_id):
+        table.pop(user_id, None)
+
+    monkeypatch.setattr(db, "get_ms_tokens", get_ms_tokens)
+    monkeypatch.setattr(db, "update_ms_tokens", update_ms_tokens)
+    monkeypatch.setattr(db, "delete_ms_tokens", delete_ms_tokens)
+    return table, updates
+
+
+def token_endpoint(release: asyncio.Event, calls: list):
+    async def handler(request):
+        calls.append(request)
+        await release.wait()
+        return httpx.Response(200, json={"access_token": f"new-{len(calls)}", "refresh_token": "refresh-2", "expires_in": 3600})
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.anyio
+async def test_refresh_overlapping_disconnect_is_neither_cached_nor_saved(rows):
+    table, updates = rows
+    cache, release, calls = TokenCache(), asyncio.Event(), []
+    async with token_endpoint(release, calls) as client:
+        request = asyncio.ensure_future(cache.get_access_token(client, "user"))
+        while not calls:
+            await asyncio.sleep(0)
+        # /disconnect while the refresh is in flight
+        del table["user"]
+        cache.invalidate("user")
+        release.set()
+        with pytest.raises(HTTPException) as raised:
+            await request
+
+    assert raised.value.status_code == 401
+    assert updates == [] and "user" not in cache._tokens
+
+
+@pytest.mark.anyio
+async def test_stale_entry_rereads_the_row_before_refreshing(rows):
+    table, updates = rows
+    cache, release, calls = TokenCache(), asyncio.Event(), []
+    release.set()
+    cache.store("user", "old", "refresh-1", iso(datetime.timedelta(seconds=30)))
+    # Another process already refreshed and saved a new token
+    table["user"] = {"access_token": "from-other-worker", "refresh_token": "refresh-2", "expires_at": iso(datetime.timedelta(hours=1))}
+    async with token_endpoint(release, calls) as client:
+        assert await cache.get_access_token(client, "user") == "from-other-worker"
+    assert calls == [] and updates == []
+
+
+@pytest.mark.anyio
+async def test_locks_are_dropped_when_nobody_waits(rows):
+    cache, release, calls = TokenCache(), asyncio.Event(), []
+    async with token_endpoint(release, calls) as client:
+        requests = [asyncio.ensure_future(cache.get_access_token(client, "user")) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        assert len(cache._locks) == 1
+        release.set()
+        assert set(await asyncio.gather(*requests)) == {"new-1"}
+    assert len(calls) == 1 and cache._locks == {}
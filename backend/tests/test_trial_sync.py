@@ -0,0 +1,92 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+from backend.benchmarks.fake_graph import FakeGraph
+from backend.MSIGraph.graph_client import graph_url
+from backend.MSIGraph.event_jobs import event_url
+from backend.MSIGraph.trial_sync import IdempotencyStore, build_trial_events, payload_fingerprint, sync_trial
+
+HEADERS = {"Authorization": "Bearer fake-access-token", "Content-Type": "application/json"}
+
+SUBMISSION = {
+    "trial": {"court_file_no": "S-1", "style_of_cause": "Smith v. Jones", "trial_date": "2026-04-13", "trial_duration": "1-day"},
+    "target_calendars": ["default", "courtroom"],
+    "deadlines": [{"deadline_name": "Expert Report", "calculated_date": "2026-03-02", "reference_date": "Trial Date",
+                   "description": "Serve the expert report on all parties", "calendar_ids": ["reminders"]}],
+}
+
+
+def test_default_calendar_is_the_same_everywhere():
+    assert event_url(None) == event_url("") == event_url("default") == f"{graph_url()}/me/events"
+    assert event_url("courtroom") == f"{graph_url()}/me/calendars/courtroom/events"
+
+
+def test_deadline_notes_come_from_the_deadline_description():
+    deadline = next(item for item in build_trial_events(SUBMISSION) if item["key"].startswith("deadline:"))
+
+    assert deadline["event"]["body"]["content"] == "Serve the expert report on all parties"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+@pytest.mark.anyio
+async def test_a_key_is_shared_by_every_store_on_the_database(db_path):
+    # Two stores on one file stand in for two worker processes
+    first, second = IdempotencyStore(db_path), IdempotencyStore(db_path)
+    fingerprint = payload_fingerprint(SUBMISSION)
+
+    assert await first.begin("user", "key", fingerprint) == {}
+    with pytest.raises(HTTPException) as in_progress:
+        await second.begin("user", "key", fingerprint)
+    assert in_progress.value.status_code == 409
+
+    await first.finish("user", "key", {"trial:default": {"status": "created"}})
+    assert await second.begin("user", "key", fingerprint) == {"trial:default": {"status": "created"}}
+    await second.finish("user", "key", {})
+
+    with pytest.raises(HTTPException) as reused:
+        await second.begin("user", "key", payload_fingerprint({**SUBMISSION, "target_calendars": ["other"]}))
+    assert reused.value.status_code == 422
+    assert await second.begin("other-user", "key", fingerprint) == {}
+
+
+@pytest.mark.anyio
+async def test_expired_keys_are_forgotten(db_path):
+    store = IdempotencyStore(db_path, ttl=0)
+    await store.begin("user", "key", "a")
+    await store.finish("user", "key", {"trial:default": {"status": "created"}})
+
+    assert await store.begin("user", "key", "b") == {}
+
+
+@pytest.mark.anyio
+async def test_a_retried_sync_on_another_worker_creates_nothing_twice(db_path):
+    fake = FakeGraph(base_url=graph_url())
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app)) as client:
+        first = await sync_trial(client, HEADERS, "user", SUBMISSION, "key", IdempotencyStore(db_path))
+        retried = await sync_trial(client, HEADERS, "user", SUBMISSION, "key", IdempotencyStore(db_path))
+
+    assert first["succeeded"] == retried["succeeded"] == 3
+    assert all(event.get("replayed") for event in retried["events"])
+    assert {calendar: len(events) for calendar, events in fake.calendars.items()} == {"default": 1, "courtroom": 1, "reminders": 1}
+
+
+@pytest.mark.anyio
+async def test_a_cancelled_sync_frees_its_key(db_path):
+    store = IdempotencyStore(db_path)
+
+    class HangingClient:
+        async def post(self, *args, **kwargs):
+            await asyncio.Event().wait()
+
+    task = asyncio.ensure_future(sync_trial(HangingClient(), HEADERS, "user", SUBMISSION, "key", store))
+    await asyncio.sleep(0.1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert await store.begin("user", "key", payload_fingerprint(SUBMISSION)) == {}
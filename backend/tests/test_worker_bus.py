@@ -0,0 +1,35 @@
+import asyncio
+import pytest
+from backend.worker_bus import WorkerBus, WorkerBusStore
+
+
+@pytest.mark.anyio
+async def test_messages_reach_the_other_processes_but_not_the_sender(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    stores = [WorkerBusStore(path), WorkerBusStore(path)]
+    first, second = WorkerBus(poll_interval=0.02), WorkerBus(poll_interval=0.02)
+    received = {"first": [], "second": []}
+    first.on("tokens_changed", lambda user_id, body: received["first"].append((user_id, body)))
+    second.on("tokens_changed", lambda user_id, body: received["second"].append((user_id, body)))
+    try:
+        await first.start(stores[0])
+        await second.start(stores[1])
+        first.send("tokens_changed", "user", {"reason": "disconnect"})
+        for _ in range(100):
+            if received["second"]:
+                break
+            await asyncio.sleep(0.02)
+        # Another round of both loops: the sender must still not have handled its own message
+        await asyncio.sleep(0.1)
+        assert received == {"first": [], "second": [("user", {"reason": "disconnect"})]}
+    finally:
+        await first.stop()
+        await second.stop()
+        for store in stores:
+            store.close()
+
+
+def test_send_before_start_does_nothing():
+    bus = WorkerBus()
+    bus.send("tokens_changed", "user")
+    assert bus.stats()["pending"] == 0
@@ -0,0 +1,183 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Callable, Optional
+from backend.jobs.store import SQLiteStore
+from backend.settings import DEFAULTS, Settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS worker_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sender TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    body TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS worker_messages_created ON worker_messages (created_at);
+"""
+
+# Messages read per query
+READ_LIMIT = 500
+
+# handler(user_id, body) for the messages of one kind; runs on the event loop and must not block
+BusHandler = Callable[[str, dict], None]
+
+
+class WorkerBusStore(SQLiteStore):
+    """The worker_messages table. Ids only grow, and SQLite commits one writer at a time, so a reader never skips one."""
+
+    schema = SCHEMA
+
+    def _append(self, sender: str, messages: list) -> None:
+        now = time.time()
+        self._conn.executemany(
+            "INSERT INTO worker_messages (sender, kind, user_id, body, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(sender, kind, user_id, body, now) for kind, user_id, body in messages],
+        )
+
+    async def append(self, sender: str, messages: list) -> None:
+        """Write [(kind, user_id, JSON body)] in one transaction."""
+        await self._run(self._transaction, self._append, sender, messages)
+
+    def _last_id(self) -> int:
+        return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM worker_messages").fetchone()[0]
+
+    async def last_id(self) -> int:
+        return await self._run(self._locked, self._last_id)
+
+    def _read(self, after: int, limit: int) -> list:
+        rows = self._conn.execute(
+            "SELECT * FROM worker_messages WHERE id > ? ORDER BY id LIMIT ?", (after, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    async def read(self, after: int, limit: int = READ_LIMIT) -> list:
+        """Messages after id `after`, oldest first (the caller skips its own)."""
+        return await self._run(self._locked, self._read, after, limit)
+
+    def _prune(self, before: float) -> int:
+        return self._conn.execute("DELETE FROM worker_messages WHERE created_at < ?", (before,)).rowcount
+
+    async def prune(self, retention: float) -> int:
+        return await self._run(self._transaction, self._prune, time.time() - retention)
+
+
+class WorkerBus:
+    """
+    Messages between the worker processes serving the app, so that state each
+    process keeps in memory (cached Microsoft tokens, event store copies,
+    live-update streams) follows a change made in any of them.
+
+    send() never waits: messages are queued and written to a table in the job
+    database by a background task. Every process reads the table every
+    poll_interval and hands the other processes' messages to the handler
+    registered for their kind; the sender has already applied its own. Until
+    start() (a single process without the lifespan, e.g. a test) send() does
+    nothing.
+    """
+
+    def __init__(self, poll_interval: float = DEFAULTS.worker_bus_poll_interval, retention: float = DEFAULTS.worker_bus_retention):
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.sender = uuid.uuid4().hex
+        self.handlers: dict = {}
+        self._store: Optional[WorkerBusStore] = None
+        self._outbox: list = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_id = 0
+        self.metrics = {"sent": 0, "received": 0, "failed": 0}
+
+    def configure(self, settings: Settings) -> None:
+        """Apply the bus settings; called by the app lifespan."""
+        self.poll_interval = settings.worker_bus_poll_interval
+        self.retention = settings.worker_bus_retention
+
+    def on(self, kind: str, handler: BusHandler) -> None:
+        self.handlers[kind] = handler
+
+    def send(self, kind: str, user_id: str, body: Optional[dict] = None) -> None:
+        """Queue a message for the other worker processes."""
+        if self._store is None:
+            return
+        self._outbox.append((kind, user_id, json.dumps(body or {}, default=str)))
+        self._wakeup.set()
+
+    async def start(self, store: WorkerBusStore) -> None:
+        # A fresh sender id per process: a worker forked from a preloaded app must not skip its siblings' messages
+        self.sender = uuid.uuid4().hex
+        self._store = store
+        self._last_id = await store.last_id()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._store is not None:
+            try:
+                await self._flush()
+            except Exception:
+                logger.exception("Failed to write worker bus messages on shutdown")
+        self._store = None
+
+    async def _loop(self) -> None:
+        next_prune = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._flush()
+                await self._receive()
+                if time.monotonic() >= next_prune:
+                    await self._store.prune(self.retention)
+                    next_prune = time.monotonic() + self.retention
+            except Exception:
+                self.metrics["failed"] += 1
+                logger.exception("Worker bus round failed")
+
+    async def _flush(self) -> None:
+        if not self._outbox:
+            return
+        messages, self._outbox = self._outbox, []
+        try:
+            await self._store.append(self.sender, messages)
+        except BaseException:
+            # Sent with the next round instead
+            self._outbox[:0] = messages
+            raise
+        self.metrics["sent"] += len(messages)
+
+    async def _receive(self) -> None:
+        while True:
+            rows = await self._store.read(self._last_id)
+            for row in rows:
+                self._last_id = row["id"]
+                if row["sender"] == self.sender:
+                    continue
+                handler = self.handlers.get(row["kind"])
+                if handler is None:
+                    continue
+                self.metrics["received"] += 1
+                try:
+                    handler(row["user_id"], json.loads(row["body"]))
+                except Exception:
+                    logger.exception("Worker bus handler for %s failed", row["kind"])
+            if len(rows) < READ_LIMIT:
+                return
+
+    def stats(self) -> dict:
+        return {**self.metrics, "running": self._task is not None, "pending": len(self._outbox)}
+
+
+worker_bus = WorkerBus()
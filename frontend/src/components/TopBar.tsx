@@ -1,39 +1,19 @@
-import { useState, useEffect } from "react";
 import { useAuth } from "../AuthProvider";
 import { useUserProfile } from "../hooks/UserProfileState";
+import { useLiveUpdates } from "../hooks/useLiveUpdates";
 
 export default function TopBar() {
   const { user, session, signOut } = useAuth();
-  const [msConnected, setMsConnected] = useState<boolean | null>(null);
   const { profile } = useUserProfile();
 
   const accessToken = session?.access_token;
+  // Connection status is pushed by the backend's live-update stream instead of fetched
+  const { msConnected, setMsConnected } = useLiveUpdates(accessToken);
 
   const CLIENT_ID = "bdcf2624-e786-4a59-a8a2-eecabe38ffdd";
   const REDIRECT_URI = "http://localhost:5173/callback";
   const SCOPES = "openid offline_access Calendars.ReadWrite User.Read";
 
-  useEffect(() => {
-    async function fetchMsStatus() {
-      if (!user || !accessToken) return;
-      try {
-        const res = await fetch("http://localhost:8080/api/msgraph/status", {
-          method: "POST",
-          headers: {
-            "Content-Type": "application/json",
-            Authorization: `Bearer ${accessToken}`,
-          },
-          body: JSON.stringify({ user_id: user.id }),
-        });
-        const data = await res.json();
-        setMsConnected(data.connected);
-      } catch (err) {
-        setMsConnected(false);
-      }
-    }
-    fetchMsStatus();
-  }, [user, accessToken]);
-
   function getMicrosoftAuthUrl() {
     const params = new URLSearchParams({
       client_id: CLIENT_ID,
@@ -34,6 +34,22 @@ interface UseCalendarEventsProps {
   accessToken: string | null;
 }
 
+// Ask the backend to subscribe to Graph change notifications for the calendar.
+// Resolves false when it can't (e.g. notifications aren't configured), in which case we fall back to refetching.
+const subscribeToCalendar = async (calendarId: string, accessToken: string): Promise<boolean> => {
+  const res = await fetch("http://localhost:8080/api/msgraph/subscriptions", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      Authorization: `Bearer ${accessToken}`,
+    },
+    body: JSON.stringify({ calendar_id: calendarId }),
+  });
+  if (!res.ok) return false;
+  const data = await res.json();
+  return !!data.subscribed;
+};
+
 const fetchCalendarEvents = async (
   calendarId: string,
   accessToken: string
@@ -44,7 +60,8 @@ const fetchCalendarEvents = async (
       "Content-Type": "application/json",
       Authorization: `Bearer ${accessToken}`,
     },
-    body: JSON.stringify({ calendar_id: calendarId }),
+    // Delta mode: the backend replays only Graph changes into its local event store
+    body: JSON.stringify({ calendar_id: calendarId, sync: "delta" }),
   });
 
   if (!res.ok) {
@@ -59,11 +76,25 @@ const fetchCalendarEvents = async (
 export const useCalendarEvents = ({ calendarId, accessToken }: UseCalendarEventsProps) => {
   const queryClient = useQueryClient();
 
+  const subscription = useQuery({
+    queryKey: ['calendarSubscription', calendarId],
+    queryFn: () => subscribeToCalendar(calendarId!, accessToken!),
+    enabled: !!calendarId && !!accessToken,
+    // The backend renews the subscription while the live stream is open; a reconnect invalidates it
+    staleTime: Infinity,
+    gcTime: 60 * 60 * 1000,
+  });
+
+  // Only a subscription confirmed since the last (re)connect of the live stream counts: useLiveUpdates
+  // invalidates it on reconnect, and until it is fetched again the events fall back to refetching
+  const subscribed = subscription.isSuccess && subscription.data === true && !subscription.isStale;
+
   const query = useQuery({
     queryKey: ['calendarEvents', calendarId],
     queryFn: () => fetchCalendarEvents(calendarId!, accessToken!),
     enabled: !!calendarId && !!accessToken,
-    staleTime: 2 * 60 * 1000, // 2 minutes (events change more frequently)
+    // With a subscription, changes arrive over the live stream (useLiveUpdates) and invalidate this query
+    staleTime: subscribed ? Infinity : 2 * 60 * 1000,
     gcTime: 5 * 60 * 1000, // 5 minutes
   });
 
@@ -14,14 +14,14 @@ interface UseCalendarsProps {
   accessToken: string | null;
 }
 
-const fetchCalendars = async (accessToken: string): Promise<Calendar[]> => {
+const fetchCalendars = async (accessToken: string, forceRefresh = false): Promise<Calendar[]> => {
   const res = await fetch("http://localhost:8080/api/msgraph/calendars", {
     method: "POST",
     headers: {
       "Content-Type": "application/json",
       Authorization: `Bearer ${accessToken}`,
     },
-    body: JSON.stringify({}),
+    body: JSON.stringify({ force_refresh: forceRefresh }),
   });
 
   if (!res.ok) {
@@ -44,8 +44,11 @@ export const useCalendars = ({ user, accessToken }: UseCalendarsProps) => {
     gcTime: 10 * 60 * 1000, // 10 minutes
   });
 
-  const refreshCalendars = () => {
-    queryClient.invalidateQueries({ queryKey: ['calendars', user?.id] });
+  // Bypass the backend's calendar cache as well as React Query's
+  const refreshCalendars = async () => {
+    if (!accessToken) return;
+    const calendars = await fetchCalendars(accessToken, true);
+    queryClient.setQueryData(['calendars', user?.id], calendars);
   };
 
   return {
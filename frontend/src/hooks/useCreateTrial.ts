@@ -1,6 +1,9 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { useCalendars } from "./useCalendars";
 
+// Court holidays that business-day deadlines skip (BC, ON, FC, or NONE for weekends only)
+const DEADLINE_JURISDICTION = import.meta.env.VITE_DEADLINE_JURISDICTION || "BC";
+
 interface CustomDate {
   id: string;
   name: string;
@@ -55,6 +58,23 @@ interface FormTemplateReminderSettings {
   };
 }
 
+interface SchedulingConflict {
+  key: string;
+  calendar_id: string;
+  subject: string;
+  start: string;
+  end: string;
+  events: { id: string; subject: string; start: string; end: string; isAllDay: boolean }[];
+}
+
+interface SchedulingCheck {
+  conflicts: SchedulingConflict[];
+  suggestions: {
+    trial_dates: { trial_date: string; deadline_conflicts: number }[];
+    deadlines: Record<string, string | null>;
+  };
+}
+
 interface UseCreateTrialProps {
   user: any;
   accessToken: string | null;
@@ -79,6 +99,12 @@ export function useCreateTrial({ user, accessToken }: UseCreateTrialProps) {
   const [selectedFormTemplates, setSelectedFormTemplates] = useState<string[]>([]);
   const [calculatedDeadlines, setCalculatedDeadlines] = useState<Record<string, CalculatedDeadline[]>>({});
   const [formTemplateReminderSettings, setFormTemplateReminderSettings] = useState<FormTemplateReminderSettings>({});
+  const [isSubmitting, setIsSubmitting] = useState(false);
+
+  // Reused when a failed submit is retried so the backend doesn't create duplicate events
+  const idempotencyKeyRef = useRef<string | null>(null);
+  // Ignore deadline responses that arrive after a newer request was sent
+  const deadlineRequestRef = useRef(0);
 
   // Use the existing useCalendars hook
   const { data: calendars = [], isLoading: loadingCalendars } = useCalendars({ 
@@ -172,13 +198,14 @@ export function useCreateTrial({ user, accessToken }: UseCreateTrialProps) {
     },
   ];
 
-  // Helper function to calculate business days
+  // Helper function to calculate business days (weekends only; the backend also skips court holidays)
   const addBusinessDays = (startDate: Date, businessDays: number): Date => {
     const result = new Date(startDate);
+    const step = businessDays < 0 ? -1 : 1;
     let daysAdded = 0;
 
-    while (daysAdded < businessDays) {
-      result.setDate(result.getDate() + 1);
+    while (daysAdded < Math.abs(businessDays)) {
+      result.setDate(result.getDate() + step);
       if (result.getDay() !== 0 && result.getDay() !== 6) {
         daysAdded++;
       }
@@ -239,6 +266,45 @@ export function useCreateTrial({ user, accessToken }: UseCreateTrialProps) {
     });
 
     setCalculatedDeadlines(newCalculatedDeadlines);
+    fetchHolidayAwareDeadlines(templateIds);
+  };
+
+  // Replace the local preview with the backend's court-holiday-aware dates, one batch for all templates
+  const fetchHolidayAwareDeadlines = async (templateIds: string[]) => {
+    if (!accessToken) return;
+
+    const trials = templateIds
+      .map((templateId) => availableFormTemplates.find((t) => t.id === templateId))
+      .filter((template): template is FormTemplate => !!template)
+      .map((template) => ({
+        trial_id: template.id,
+        trial_date: formData.trialDate,
+        custom_dates: Object.fromEntries(customDates.map((cd) => [cd.name, cd.date])),
+        deadlines: template.deadlines,
+      }));
+    if (trials.length === 0) return;
+
+    const requestId = ++deadlineRequestRef.current;
+    try {
+      const res = await fetch("http://localhost:8080/api/deadlines/calculate", {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          Authorization: `Bearer ${accessToken}`,
+        },
+        body: JSON.stringify({ jurisdiction: DEADLINE_JURISDICTION, trials }),
+      });
+      if (!res.ok || requestId !== deadlineRequestRef.current) return;
+
+      const data = await res.json();
+      const serverDeadlines: Record<string, CalculatedDeadline[]> = {};
+      data.trials.forEach((trial: { trial_id: string; deadlines: CalculatedDeadline[] }) => {
+        serverDeadlines[trial.trial_id] = trial.deadlines;
+      });
+      setCalculatedDeadlines(serverDeadlines);
+    } catch (err) {
+      console.error("Error calculating deadlines, keeping local preview:", err);
+    }
   };
 
   // Event handlers
@@ -304,16 +370,126 @@ export function useCreateTrial({ user, accessToken }: UseCreateTrialProps) {
     });
   };
 
-  const handleSubmit = () => {
-    alert("Trial created successfully!");
-    console.log("Trial Data:", formData);
-    console.log("Calendar Selections:", calendarSelections);
-    console.log("Form Template Reminder Settings:", formTemplateReminderSettings);
-    console.log("Custom Dates:", customDates);
-    console.log("Selected Form Templates:", selectedFormTemplates);
-    console.log("Calculated Deadlines:", calculatedDeadlines);
+  // The sync-trial payload; the scheduling check takes the same body
+  const buildSubmission = () => {
+    // Each deadline goes to the reminder calendars enabled for its template
+    const deadlines = Object.entries(calculatedDeadlines).flatMap(([templateId, templateDeadlines]) => {
+      const templateCalendars = calendarSelections.reminderCalendars.filter(
+        (calendarId) => formTemplateReminderSettings[templateId]?.[calendarId]
+      );
+      return templateDeadlines.map((deadline) => ({
+        ...deadline,
+        template_id: templateId,
+        calendar_ids: templateCalendars,
+      }));
+    });
+
+    return {
+      trial: {
+        court_file_no: formData.courtFileNo,
+        style_of_cause: formData.styleOfCause,
+        trial_date: formData.trialDate,
+        trial_duration: formData.trialDuration,
+        custom_start_date: formData.customStartDate,
+        custom_end_date: formData.customEndDate,
+        notes: formData.notes,
+      },
+      target_calendars: calendarSelections.targetCalendars,
+      reminder_calendars: calendarSelections.reminderCalendars,
+      deadlines,
+      time_zone: Intl.DateTimeFormat().resolvedOptions().timeZone,
+    };
+  };
+
+  // Warn before creating events on days already booked in the chosen calendars; true to go ahead
+  const confirmSchedule = async (submission: ReturnType<typeof buildSubmission>): Promise<boolean> => {
+    try {
+      const res = await fetch("http://localhost:8080/api/msgraph/scheduling-check", {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          Authorization: `Bearer ${accessToken}`,
+        },
+        body: JSON.stringify({ ...submission, jurisdiction: DEADLINE_JURISDICTION }),
+      });
+      if (!res.ok) return true;
+
+      const check: SchedulingCheck = await res.json();
+      if (check.conflicts.length === 0) return true;
+
+      const calendarName = (id: string) => availableCalendars.find((c) => c.id === id)?.name || id;
+      const lines = check.conflicts.map((conflict) => {
+        const subjects = conflict.events.map((e) => e.subject).join(", ");
+        const moveTo = check.suggestions.deadlines[conflict.key];
+        return `- ${conflict.subject} (${conflict.start}, ${calendarName(conflict.calendar_id)}): ${subjects}` +
+          (moveTo ? ` - nearest free day: ${moveTo}` : "");
+      });
+      const trialDates = check.suggestions.trial_dates.map((s) =>
+        s.deadline_conflicts ? `${s.trial_date} (${s.deadline_conflicts} deadline conflicts)` : s.trial_date
+      );
+      if (trialDates.length > 0) {
+        lines.push(`Nearest free trial dates: ${trialDates.join(", ")}`);
+      }
+      return confirm(`These dates are already booked:\n${lines.join("\n")}\n\nCreate the trial anyway?`);
+    } catch (err) {
+      // The check is advisory; never block creating the trial on it
+      console.error("Error checking the schedule:", err);
+      return true;
+    }
+  };
+
+  const handleSubmit = async () => {
+    if (!accessToken || isSubmitting) return;
+    if (calendarSelections.targetCalendars.length === 0) {
+      alert("Select at least one target calendar.");
+      return;
+    }
+
+    if (!idempotencyKeyRef.current) {
+      idempotencyKeyRef.current = crypto.randomUUID();
+    }
+
+    const submission = buildSubmission();
+
+    setIsSubmitting(true);
+    try {
+      if (!(await confirmSchedule(submission))) return;
+
+      const res = await fetch("http://localhost:8080/api/msgraph/sync-trial", {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          Authorization: `Bearer ${accessToken}`,
+          "Idempotency-Key": idempotencyKeyRef.current,
+        },
+        body: JSON.stringify(submission),
+      });
+
+      const data = await res.json();
+      if (!res.ok) {
+        throw new Error(data.detail || "Failed to create trial");
+      }
+
+      if (data.failed > 0) {
+        console.error("Events that failed to sync:", data.events.filter((e: any) => e.status === "failed"));
+        alert(`Trial created with ${data.failed} of ${data.total} calendar events not synced. Submit again to retry them.`);
+      } else {
+        idempotencyKeyRef.current = null;
+        alert(`Trial created successfully! ${data.total} calendar events synced.`);
+      }
+    } catch (err: any) {
+      console.error("Error creating trial:", err);
+      alert(err.message || "Failed to create trial.");
+    } finally {
+      setIsSubmitting(false);
+    }
   };
 
+  // A changed submission is a new trial, not a retry
+  useEffect(() => {
+    idempotencyKeyRef.current = null;
+  }, [formData, calendarSelections, calculatedDeadlines, formTemplateReminderSettings]);
+
   // Recalculate deadlines when trial date or custom dates change
   useEffect(() => {
     if (selectedFormTemplates.length > 0) {
@@ -331,6 +507,7 @@ export function useCreateTrial({ user, accessToken }: UseCreateTrialProps) {
     availableCalendars,
     availableFormTemplates,
     loadingCalendars,
+    isSubmitting,
     handleInputChange,
     handleTargetCalendarToggle,
     handleReminderCalendarToggle,
@@ -0,0 +1,66 @@
+import { useEffect, useState } from 'react';
+import { useQueryClient } from '@tanstack/react-query';
+
+interface EventChangeMessage {
+  calendarId: string;
+  changeType: 'created' | 'updated' | 'deleted';
+  eventId: string | null;
+}
+
+/**
+ * Opens the backend's live-update stream (server-sent events) for the signed-in user.
+ * The Microsoft connection status is pushed on connect and whenever it changes, and
+ * calendar changes reported by Graph invalidate the matching calendarEvents queries,
+ * so nothing has to be polled. EventSource can't send headers, so the Supabase token
+ * goes in the query string; a new token (after Supabase refreshes it) reopens the stream.
+ */
+export const useLiveUpdates = (accessToken: string | null | undefined) => {
+  const queryClient = useQueryClient();
+  const [msConnected, setMsConnected] = useState<boolean | null>(null);
+
+  useEffect(() => {
+    if (!accessToken) return;
+
+    const params = new URLSearchParams({ access_token: accessToken });
+    const source = new EventSource(`http://localhost:8080/api/msgraph/notifications/stream?${params}`);
+    let opened = false;
+
+    source.onopen = () => {
+      // The backend drops Graph subscriptions nobody listens to, so they are confirmed again
+      // whenever the stream (re)connects; until then events are refetched as usual
+      queryClient.invalidateQueries({ queryKey: ['calendarSubscription'] });
+      // After a reconnect, changes may have been missed while the stream was down
+      if (opened) {
+        queryClient.invalidateQueries({ queryKey: ['calendarEvents'] });
+      }
+      opened = true;
+    };
+
+    source.addEventListener('status', (e) => {
+      setMsConnected(JSON.parse((e as MessageEvent).data).connected);
+    });
+
+    source.addEventListener('event_change', (e) => {
+      const { calendarId } = JSON.parse((e as MessageEvent).data) as EventChangeMessage;
+      queryClient.invalidateQueries({ queryKey: ['calendarEvents', calendarId] });
+    });
+
+    source.addEventListener('resync', (e) => {
+      const { calendarId } = JSON.parse((e as MessageEvent).data) as { calendarId?: string };
+      queryClient.invalidateQueries({ queryKey: calendarId ? ['calendarEvents', calendarId] : ['calendarEvents'] });
+    });
+
+    source.onerror = () => {
+      // The browser retries on its own unless the server rejected the stream (e.g. expired token)
+      if (source.readyState === EventSource.CLOSED) {
+        setMsConnected(null);
+        // No stream, no change notifications: stop treating the calendars as subscribed
+        queryClient.invalidateQueries({ queryKey: ['calendarSubscription'], refetchType: 'none' });
+      }
+    };
+
+    return () => source.close();
+  }, [accessToken, queryClient]);
+
+  return { msConnected, setMsConnected };
+};